@@ -23,6 +23,10 @@
  This script initializes the plugin, making it known to QGIS.
 """
 
+import time
+
+from qgis.core import QgsMessageLog, Qgis
+
 
 # noinspection PyPep8Naming
 def classFactory(iface):  # pylint: disable=invalid-name
@@ -31,6 +35,11 @@ def classFactory(iface):  # pylint: disable=invalid-name
     :param iface: A QGIS interface instance.
     :type iface: QgsInterface
     """
-    #
+    # Measure the plugin's load time, which is added to the QGIS startup time
+    start_time = time.perf_counter()
     from .udt_plugin import UDTPlugin
-    return UDTPlugin(iface)
+    plugin = UDTPlugin(iface)
+    load_time = (time.perf_counter() - start_time) * 1000
+    QgsMessageLog.logMessage(f'Plugin UDT carregat en {load_time:.0f} ms', level=Qgis.Info)
+
+    return plugin
@@ -10,6 +10,8 @@ defined and the data returned.
 
 from qgis.core import QgsVectorLayer, QgsDataSourceUri, QgsProviderRegistry
 
+from .adt_table_cache import ADTTableCache, ADT_CACHED_TABLES
+
 
 class PgADTConnection:
     def __init__(self, host, dbname, user, password, schema):
@@ -40,6 +42,26 @@ class PgADTConnection:
         self.uri.setDataSource(self.schema, table_name, None)
         return QgsVectorLayer(self.uri.uri(False), table_name, "postgres")
 
+    def get_cached_table(self, table_name):
+        """
+        Return a reference table from the local cache of the ADT PostGIS Database. The database is only queried the
+        first time the table is requested in the session, to check if it has changed since it was cached
+
+        :param table_name: Name of the table to get, one of ADT_CACHED_TABLES
+        :type table_name: str
+
+        :return QgsVectorLayer: Local snapshot of the table
+        :rtype QgsVectorLayer: QgsVectorLayer
+        """
+        if table_name not in ADT_CACHED_TABLES:
+            return self.get_table(table_name)
+        table_cache = ADTTableCache(self.host, self.dbname, self.schema)
+        cached_table = table_cache.get_probed_table(table_name)
+        if cached_table is not None:
+            return cached_table
+
+        return table_cache.get_table(self.get_table(table_name))
+
     def get_layer(self, layer_name, akey=''):
         """
         Return a layer from the ADT PostGIS Database
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the ADTTableCache class is defined. The main function
+of this class is to keep a local GeoPackage snapshot of the small and slowly
+changing reference tables of the ADT PostGIS database. The first time a table
+is requested in the session, its fingerprint (row count, latest dates and
+vigent flags count) is probed in the database and the snapshot is only
+downloaded again when it has changed.
+***************************************************************************/
+"""
+
+import json
+import os
+import re
+
+from qgis.core import (QgsApplication,
+                       QgsCoordinateTransformContext,
+                       QgsVectorFileWriter,
+                       QgsVectorLayer,
+                       QgsMessageLog,
+                       Qgis)
+from PyQt5.QtCore import QVariant
+
+# Reference tables of the ADT database that are cached locally
+ADT_CACHED_TABLES = ('dic_municipality', 'linia', 'linia_veina', 'mapa_muni_icc', 'memoria_treb_top')
+# Directory of the local cache, inside the QGIS user profile so it persists between sessions
+ADT_CACHE_DIR = os.path.join(QgsApplication.qgisSettingsDirPath(), 'udt_plugin')
+# Field types whose maximum value is part of the tables' fingerprint
+FINGERPRINT_FIELD_TYPES = (QVariant.Date, QVariant.DateTime)
+# Field types whose count of true values is part of the tables' fingerprint, as the vigent flags
+FINGERPRINT_FLAG_TYPES = (QVariant.Bool,)
+
+# Snapshots already probed in the session, as GeoPackage path and table name pairs. They aren't probed again until
+# the cache is cleared
+_PROBED_TABLES = set()
+
+
+class ADTTableCache:
+    """ Local cache of the ADT reference tables """
+
+    def __init__(self, host, dbname, schema, cache_dir=ADT_CACHE_DIR):
+        """
+        Constructor
+
+        :param host: Host of the ADT PostGIS database
+        :type host: str
+
+        :param dbname: Name of the ADT PostGIS database
+        :type dbname: str
+
+        :param schema: Schema of the ADT PostGIS database
+        :type schema: str
+
+        :param cache_dir: Directory of the local cache
+        :type cache_dir: str
+        """
+        # Every database has its own cache, so the snapshots of different databases or schemas never mix
+        cache_name = re.sub(r'[^\w.-]', '_', f'adt_cache_{host}_{dbname}_{schema}')
+        self.gpkg_path = os.path.join(cache_dir, f'{cache_name}.gpkg')
+        self.fingerprints_path = os.path.join(cache_dir, f'{cache_name}.json')
+        os.makedirs(cache_dir, exist_ok=True)
+        self.fingerprints = self.read_fingerprints()
+
+    def get_probed_table(self, table_name):
+        """
+        Get the local snapshot of a table if it has already been probed in the session, without querying the database
+
+        :param table_name: Name of the table
+        :type table_name: str
+
+        :return: Local snapshot of the table, or None if it hasn't been probed yet
+        :rtype: QgsVectorLayer
+        """
+        if (self.gpkg_path, table_name) not in _PROBED_TABLES:
+            return None
+        cached_table = QgsVectorLayer(f'{self.gpkg_path}|layername={table_name}', table_name, 'ogr')
+        if not cached_table.isValid():
+            _PROBED_TABLES.discard((self.gpkg_path, table_name))
+            return None
+
+        return cached_table
+
+    def get_table(self, pg_table):
+        """
+        Get the local snapshot of a table, downloading it again if the database's table has changed
+
+        :param pg_table: Table of the ADT PostGIS database
+        :type pg_table: QgsVectorLayer
+
+        :return: Local snapshot of the table, or the database's table if it couldn't be cached
+        :rtype: QgsVectorLayer
+        """
+        table_name = pg_table.name()
+        fingerprint = self.get_fingerprint(pg_table)
+        if fingerprint is None:
+            return pg_table
+        if self.fingerprints.get(table_name) != fingerprint and not self.update_table(pg_table, fingerprint):
+            return pg_table
+
+        cached_table = QgsVectorLayer(f'{self.gpkg_path}|layername={table_name}', table_name, 'ogr')
+        if not cached_table.isValid():
+            self.fingerprints.pop(table_name, None)
+            return pg_table
+        _PROBED_TABLES.add((self.gpkg_path, table_name))
+
+        return cached_table
+
+    @staticmethod
+    def get_fingerprint(pg_table):
+        """
+        Get the fingerprint of a table of the database: its row count, the maximum value of its date fields and the
+        number of rows where every boolean field, as the vig_mm or vig_mtt flags, is true. All of them are computed by
+        the database, so only the aggregates are transferred. An in place update of any other field, which doesn't
+        change any date nor flag, isn't detected and needs the cache to be cleared manually
+
+        :param pg_table: Table of the ADT PostGIS database
+        :type pg_table: QgsVectorLayer
+
+        :return: Fingerprint of the table, or None if the table isn't available
+        :rtype: list
+        """
+        if not pg_table.isValid():
+            return None
+        fingerprint = [pg_table.featureCount()]
+        for index, field in enumerate(pg_table.fields()):
+            if field.type() in FINGERPRINT_FIELD_TYPES:
+                max_value = pg_table.maximumValue(index)
+                fingerprint.append(max_value.toString('yyyy-MM-ddTHH:mm:ss')
+                                   if hasattr(max_value, 'toString') else str(max_value))
+        # Count the true values of every flag filtering the table, so the database only returns the count
+        subset_string = pg_table.subsetString()
+        for field in pg_table.fields():
+            if field.type() in FINGERPRINT_FLAG_TYPES:
+                pg_table.setSubsetString(f'"{field.name()}" IS TRUE')
+                fingerprint.append(pg_table.featureCount())
+        pg_table.setSubsetString(subset_string)
+
+        return fingerprint
+
+    def update_table(self, pg_table, fingerprint):
+        """
+        Download the table to the local snapshot
+
+        :param pg_table: Table of the ADT PostGIS database
+        :type pg_table: QgsVectorLayer
+
+        :param fingerprint: Fingerprint of the table
+        :type fingerprint: list
+
+        :return: Indicates if the table has been downloaded
+        :rtype: bool
+        """
+        table_name = pg_table.name()
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = 'GPKG'
+        options.layerName = table_name
+        options.fileEncoding = 'utf-8'
+        if os.path.exists(self.gpkg_path):
+            options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+        error = QgsVectorFileWriter.writeAsVectorFormatV2(pg_table, self.gpkg_path, QgsCoordinateTransformContext(),
+                                                          options)
+        if error[0] != QgsVectorFileWriter.NoError:
+            QgsMessageLog.logMessage(f"No s'ha pogut desar la taula {table_name} a la memòria cau", level=Qgis.Warning)
+            return False
+
+        self.fingerprints[table_name] = fingerprint
+        self.write_fingerprints()
+        QgsMessageLog.logMessage(f'Taula {table_name} actualitzada a la memòria cau', level=Qgis.Info)
+        return True
+
+    def read_fingerprints(self):
+        """
+        Read the fingerprints of the cached tables
+
+        :return: Dictionary with the table name as key and its fingerprint as value
+        :rtype: dict
+        """
+        if not os.path.exists(self.fingerprints_path) or not os.path.exists(self.gpkg_path):
+            return {}
+        try:
+            with open(self.fingerprints_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_fingerprints(self):
+        """ Write the fingerprints of the cached tables, replacing the previous file only once it's complete """
+        tmp_path = f'{self.fingerprints_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.fingerprints, f)
+        os.replace(tmp_path, self.fingerprints_path)
+
+    def clear(self):
+        """
+        Remove the local snapshots, so every table is probed and downloaded again the next time it's requested
+
+        :return: Indicates if the snapshots have been removed. They can't be removed while any of them is open
+        :rtype: bool
+        """
+        self.fingerprints = {}
+        for probed_table in [probed_table for probed_table in _PROBED_TABLES if probed_table[0] == self.gpkg_path]:
+            _PROBED_TABLES.discard(probed_table)
+        for path in (self.fingerprints_path, self.gpkg_path):
+            if not os.path.exists(path):
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                QgsMessageLog.logMessage(f"No s'ha pogut esborrar la memòria cau de l'ADT => {e}", level=Qgis.Warning)
+                return False
+        QgsMessageLog.logMessage("Memòria cau de l'ADT esborrada", level=Qgis.Info)
+
+        return True
@@ -18,6 +18,7 @@ from qgis.core import (QgsVectorLayer,
                        QgsCoordinateReferenceSystem,
                        QgsField,
                        QgsFeature,
+                       QgsFeatureRequest,
                        QgsGeometry,
                        QgsProject,
                        QgsMessageLog,
@@ -26,17 +27,31 @@ from qgis.core.additions.edit import edit
 from PyQt5.QtWidgets import QMessageBox
 
 from ..config import *
+from ..utils import *
+from .agregador_qa import AgregadorQA
+from .point_grid_index import PointGridIndex
+
+# Maximum distance, in meters, between two fites considered the same fita
+AGREGADOR_FITA_TOLERANCE = 0.1
 
 
 class AgregadorMMC:
     """ MMC Agregation class """
 
-    def __init__(self):
-        """ Constructor """
+    def __init__(self, fita_tolerance=AGREGADOR_FITA_TOLERANCE):
+        """
+        Constructor
+
+        :param fita_tolerance: Maximum distance, in meters, between two fites considered the same fita
+        :type fita_tolerance: float
+        """
         # Initialize instance attributes
         # Common
         self.current_date = datetime.now().strftime("%Y%m%d")
         self.crs = QgsCoordinateReferenceSystem("EPSG:25831")
+        self.fita_tolerance = fita_tolerance
+        # Input fita ID as key and the ID of the coincident fita already in the work layer as value
+        self.merged_fites = {}
         # Set work layers
         self.points_work_layer = QgsVectorLayer(os.path.join(AGREGADOR_WORK_DIR, 'fites_temp.shp'), 'Fites')
         self.lines_work_layer = QgsVectorLayer(os.path.join(AGREGADOR_WORK_DIR, 'linies_temp.shp'), 'Linies de terme')
@@ -65,15 +80,23 @@ class AgregadorMMC:
             - Lines - table
             - Coast lines - table
             - BT5M
+        Then, check the topology around the added municipalities
+
+        :return: Number of topology issues found
+        :rtype: int
         """
         QgsMessageLog.logMessage('Procés iniciat: addició de mapes al Mapa Municipal de Catalunya', level=Qgis.Info)
 
+        added_municipalities, added_lines, added_points = set(), set(), set()
         input_list_dir = os.listdir(AGREGADOR_INPUT_DIR)
         for input_dir in input_list_dir:
             QgsMessageLog.logMessage(f'Carpeta: {input_dir}', level=Qgis.Info)
             self.reset_input_layers()
             input_dir_path = os.path.join(AGREGADOR_INPUT_DIR, input_dir)
             self.set_input_layers(input_dir_path)
+            added_municipalities.update(get_field_values(self.polygons_input_layer, 'CodiMuni'))
+            added_lines.update(get_field_values(self.lines_input_layer, 'IdLinia'))
+            added_points.update(get_field_values(self.points_input_layer, 'IdFita'))
             # Add geometries
             QgsMessageLog.logMessage(f'Afegint geometries...', level=Qgis.Info)
             self.add_polygons()
@@ -89,8 +112,35 @@ class AgregadorMMC:
 
             QgsMessageLog.logMessage(f'Dades de la carpeta {input_dir} afegides', level=Qgis.Info)
 
+        issues_count = self.check_topology(added_municipalities, added_lines, added_points)
         QgsMessageLog.logMessage('Procés finalitzat: addició de mapes al Mapa Municipal de Catalunya', level=Qgis.Info)
 
+        return issues_count
+
+    def check_topology(self, municipalities_ine, lines_id, points_id):
+        """
+        Check the topology around the added municipalities and export the report to the work directory
+
+        :param municipalities_ine: INE ID of the added municipalities
+        :type municipalities_ine: set
+
+        :param lines_id: ID of the added lines
+        :type lines_id: set
+
+        :param points_id: ID of the added fites
+        :type points_id: set
+
+        :return: Number of topology issues found
+        :rtype: int
+        """
+        qa = AgregadorQA(self.points_work_layer, self.lines_work_layer, self.polygons_work_layer,
+                         self.coast_lines_work_layer, self.crs)
+        report_layer = qa.check(list(municipalities_ine), list(lines_id), list(points_id))
+        QgsVectorFileWriter.writeAsVectorFormat(report_layer, os.path.join(AGREGADOR_WORK_DIR, 'qa_temp.shp'),
+                                                'utf-8', self.crs, 'ESRI Shapefile')
+
+        return report_layer.featureCount()
+
     def reset_input_layers(self):
         """ Reset the input QgsVectorLayers to None to avoid over writing """
         self.points_input_layer, self.lines_input_layer, self.polygons_input_layer, self.coast_lines_input_layer, self.coast_lines_input_table, self.lines_input_table, self.bt5_full_input_table = (None,) * 7
@@ -127,19 +177,34 @@ class AgregadorMMC:
                 self.polygons_work_layer.addFeature(polygon)
 
     def add_points(self):
-        """ Add the input points to the Municipal Map of Catalonia """
-        points_features = self.points_input_layer.getFeatures()
+        """
+        Add the input points to the Municipal Map of Catalonia. A point with the same ID as a fita that is already in
+        the work layer isn't added, and a point within the tolerance of one is merged into it instead of being added,
+        as it's the same fita with a rounding artifact
+        """
+        # Get a set with all the points ID and an index with all the points, updated with every added point
+        fita_id_set, fita_index = self.get_points_index()
+        points_features = self.points_input_layer.getFeatures(QgsFeatureRequest().setSubsetOfAttributes(
+            ['IdFita'], self.points_input_layer.fields()))
         with edit(self.points_work_layer):
             for point in points_features:
-                # Get a list with all the points ID
-                fita_id_list = self.get_points_id_list()
+                point_id = point['IdFita']
+                geom = point.geometry()
+                coords = geom.asPoint()
                 # This is done in order to avoid adding duplicated features
-                if not point['IdFita'] in fita_id_list:
-                    geom = point.geometry()
-                    fet = QgsFeature()
-                    fet.setGeometry(geom)
-                    fet.setAttributes([point['IdFita']])
-                    self.points_work_layer.addFeature(fet)
+                if point_id in fita_id_set:
+                    continue
+                existing_id = fita_index.nearest(coords.x(), coords.y())
+                if existing_id is not None:
+                    self.merged_fites[point_id] = existing_id
+                    QgsMessageLog.logMessage(f'Fita {point_id} fusionada amb la fita {existing_id}', level=Qgis.Info)
+                    continue
+                fet = QgsFeature()
+                fet.setGeometry(geom)
+                fet.setAttributes([point_id])
+                self.points_work_layer.addFeature(fet)
+                fita_index.add(coords.x(), coords.y(), point_id)
+                fita_id_set.add(point_id)
 
     def add_lines_layer(self):
         """ Add the input lines to the Municipal Map of Catalonia """
@@ -170,11 +235,13 @@ class AgregadorMMC:
 
     def add_points_table(self):
         """ Add the input points to the table of the Municipal Map of Catalonia """
-        points_features = self.points_input_layer.getFeatures()
+        points_features = get_features_attributes(self.points_input_layer)
         with edit(self.points_work_table):
             for point in points_features:
+                # Refer the merged points to the fita they have been merged into
+                point_id = self.merged_fites.get(point['IdFita'], point['IdFita'])
                 fet = QgsFeature()
-                fet.setAttributes([point['IdUFita'], point['IdFita'], point['NumTermes'], point['Monument'],
+                fet.setAttributes([point['IdUFita'], point_id, point['NumTermes'], point['Monument'],
                                    point['ValidDe'], point['ValidA'], point['DataAlta'], point['DataBaixa'],
                                    point['IdLinia'], point['IdFitaR'], point['IdSector']])
                 self.points_work_table.addFeature(fet)
@@ -193,13 +260,23 @@ class AgregadorMMC:
             for full in fulls_features:
                 self.bt5_full_work_table.addFeature(full)
 
-    def get_points_id_list(self):
-        """ Get a list with all the points ID of the point working laye """
-        fita_id_list = []
-        for feat in self.points_work_layer.getFeatures():
-            fita_id_list.append(feat['IdFita'])
+    def get_points_index(self):
+        """
+        Get a set with all the points ID and a grid index with all the points of the point working layer
 
-        return fita_id_list
+        :return: Set with the points ID and index with the point ID as value
+        :rtype: tuple
+        """
+        ids, coords = [], []
+        request = QgsFeatureRequest().setSubsetOfAttributes(['IdFita'], self.points_work_layer.fields())
+        for point in self.points_work_layer.getFeatures(request):
+            point_coords = point.geometry().asPoint()
+            ids.append(point['IdFita'])
+            coords.append((point_coords.x(), point_coords.y()))
+        fita_index = PointGridIndex(self.fita_tolerance)
+        fita_index.add_array(coords, ids)
+
+        return set(ids), fita_index
 
     def get_lines_id_list(self, entity):
         """
@@ -211,7 +288,6 @@ class AgregadorMMC:
         :return line_id_list: List of the lines ID
         :rtype line_id_list: tuple
         """
-        line_id_list = []
         layer = None
 
         if entity == 'layer':
@@ -219,10 +295,7 @@ class AgregadorMMC:
         elif entity == 'table':
             layer = self.lines_work_table
 
-        for feat in layer.getFeatures():
-            line_id_list.append(feat['IdLinia'])
-
-        return line_id_list
+        return get_field_values(layer, 'IdLinia')
 
     # #######################
     # Export data
@@ -233,11 +306,11 @@ class AgregadorMMC:
         output_points_layer = f'mapa-municipal-v1r0-catalunya-fita-{self.current_date}.shp'
         output_lines_layer = f'mapa-municipal-v1r0-catalunya-liniaterme-{self.current_date}.shp'
         output_polygon_layer = f'mapa-municipal-v1r0-catalunya-poligon-{self.current_date}.shp'
-        output_lines_table = f'mapa-municipal-v1r0-catalunya-liniatermetaula-{self.current_date}.shp'
-        output_points_table = f'mapa-municipal-v1r0-catalunya-fitataula-{self.current_date}.shp'
+        output_lines_table = f'mapa-municipal-v1r0-catalunya-liniatermetaula-{self.current_date}.dbf'
+        output_points_table = f'mapa-municipal-v1r0-catalunya-fitataula-{self.current_date}.dbf'
         output_coast_line_layer = f'mapa-municipal-v1r0-catalunya-liniacosta-{self.current_date}.shp'
-        output_coast_line_table = f'mapa-municipal-v1r0-catalunya-liniacostataula-{self.current_date}.shp'
-        output_coast_line_full = f'mapa-municipal-v1r0-catalunya-tallfullbt5m-{self.current_date}.shp'
+        output_coast_line_table = f'mapa-municipal-v1r0-catalunya-liniacostataula-{self.current_date}.dbf'
+        output_coast_line_full = f'mapa-municipal-v1r0-catalunya-tallfullbt5m-{self.current_date}.dbf'
         # Export the data
         QgsVectorFileWriter.writeAsVectorFormat(self.points_work_layer,
                                                 os.path.join(self.output_directory, output_points_layer),
@@ -251,18 +324,10 @@ class AgregadorMMC:
         QgsVectorFileWriter.writeAsVectorFormat(self.coast_lines_work_layer,
                                                 os.path.join(self.output_directory, output_coast_line_layer),
                                                 'utf-8', self.crs, 'ESRI Shapefile')
-        QgsVectorFileWriter.writeAsVectorFormat(self.lines_work_table,
-                                                os.path.join(self.output_directory, output_lines_table),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-        QgsVectorFileWriter.writeAsVectorFormat(self.points_work_table,
-                                                os.path.join(self.output_directory, output_points_table),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-        QgsVectorFileWriter.writeAsVectorFormat(self.coast_lines_work_table,
-                                                os.path.join(self.output_directory, output_coast_line_table),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-        QgsVectorFileWriter.writeAsVectorFormat(self.bt5_full_work_table,
-                                                os.path.join(self.output_directory, output_coast_line_full),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
+        export_attribute_table(self.lines_work_table, os.path.join(self.output_directory, output_lines_table))
+        export_attribute_table(self.points_work_table, os.path.join(self.output_directory, output_points_table))
+        export_attribute_table(self.coast_lines_work_table, os.path.join(self.output_directory, output_coast_line_table))
+        export_attribute_table(self.bt5_full_work_table, os.path.join(self.output_directory, output_coast_line_full))
 
     def create_output_directory(self):
         """ Create the output directory of the new Municipal Map of Catalonia """
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the AgregadorQA class is defined. The main function
+of this class is to check the topology of the Municipal Map of Catalonia
+around the municipalities that have just been added: overlaps, gaps and
+slivers between polygons, dangling line endpoints and the coincidence
+between the fites and the boundary lines. The issues are written into a
+report layer.
+***************************************************************************/
+"""
+
+from PyQt5.QtCore import QVariant
+from qgis.core import (QgsField,
+                       QgsFeature,
+                       QgsFeatureRequest,
+                       QgsGeometry,
+                       QgsSpatialIndex,
+                       QgsWkbTypes,
+                       QgsMessageLog,
+                       Qgis)
+
+from ..utils import *
+
+# Maximum distance, in meters, between two coincident vertices, endpoints or fites
+QA_TOLERANCE = 0.1
+# Maximum area, in square meters, of a gap or overlap considered a sliver
+QA_SLIVER_MAX_AREA = 1.0
+# Minimum area, in square meters, of an overlap or gap between polygons. Smaller ones are numerical noise
+QA_MIN_OVERLAP_AREA = 0.0001
+
+
+class AgregadorQA:
+    """ Topology QA of the Municipal Map of Catalonia """
+
+    def __init__(self, points_layer, lines_layer, polygons_layer, coast_lines_layer, crs):
+        """
+        Constructor
+
+        :param points_layer: Points work layer of the Municipal Map of Catalonia
+        :type points_layer: QgsVectorLayer
+
+        :param lines_layer: Lines work layer of the Municipal Map of Catalonia
+        :type lines_layer: QgsVectorLayer
+
+        :param polygons_layer: Polygons work layer of the Municipal Map of Catalonia
+        :type polygons_layer: QgsVectorLayer
+
+        :param coast_lines_layer: Coast lines work layer of the Municipal Map of Catalonia
+        :type coast_lines_layer: QgsVectorLayer
+
+        :param crs: CRS of the layers
+        :type crs: QgsCoordinateReferenceSystem
+        """
+        self.points_layer = points_layer
+        self.lines_layer = lines_layer
+        self.polygons_layer = polygons_layer
+        self.coast_lines_layer = coast_lines_layer
+        self.report_layer = create_memory_layer('QA MMC', QgsWkbTypes.Point, crs, self.get_report_fields())
+        self.issues = []
+        self.points_index, self.lines_index, self.polygons_index, self.coast_lines_index = (None,) * 4
+        self.added_polygon_ids = set()
+
+    def check(self, municipalities_ine, lines_id, points_id):
+        """
+        Main entry point. Check the topology around the given municipalities, lines and fites
+
+        :param municipalities_ine: INE ID of the added municipalities
+        :type municipalities_ine: list
+
+        :param lines_id: ID of the added lines
+        :type lines_id: list
+
+        :param points_id: ID of the added fites
+        :type points_id: list
+
+        :return: Report layer with one point for every issue
+        :rtype: QgsVectorLayer
+        """
+        QgsMessageLog.logMessage('Comprovant la topologia dels mapes afegits...', level=Qgis.Info)
+        polygons = list(get_features_by_in_list(self.polygons_layer, 'CodiMuni', municipalities_ine))
+        lines = list(get_features_by_in_list(self.lines_layer, 'IdLinia', lines_id))
+        points = list(get_features_by_in_list(self.points_layer, 'IdFita', points_id))
+        search_extent = self.get_search_extent(polygons + lines + points)
+        if search_extent is not None:
+            self.set_indexes(search_extent)
+            self.added_polygon_ids = {polygon.id() for polygon in polygons}
+            for polygon in polygons:
+                self.check_polygon(polygon)
+            for line in lines:
+                self.check_line(line)
+            for point in points:
+                self.check_point(point)
+
+        self.report_layer.dataProvider().addFeatures(self.issues)
+        self.report_layer.updateExtents()
+        QgsMessageLog.logMessage(f'Topologia comprovada: {len(self.issues)} incidències', level=Qgis.Info)
+
+        return self.report_layer
+
+    @staticmethod
+    def get_report_fields():
+        """
+        Get the fields of the report layer
+
+        :return: List with the report layer's fields
+        :rtype: list
+        """
+        return [QgsField(name='Tipus', type=QVariant.String, typeName='text', len=30),
+                QgsField(name='Entitat', type=QVariant.String, typeName='text', len=30),
+                QgsField(name='Valor', type=QVariant.Double, typeName='double', len=20, prec=4),
+                QgsField(name='Descripcio', type=QVariant.String, typeName='text', len=254)]
+
+    @staticmethod
+    def get_search_extent(features):
+        """
+        Get the extent around the given features where their neighbors are searched
+
+        :param features: Added features
+        :type features: list
+
+        :return: Extent of the features buffered by the tolerance, or None if none of them has geometry
+        :rtype: QgsRectangle
+        """
+        extent = None
+        for feature in features:
+            if not feature.hasGeometry():
+                continue
+            if extent is None:
+                extent = feature.geometry().boundingBox()
+            else:
+                extent.combineExtentWith(feature.geometry().boundingBox())
+
+        return extent.buffered(QA_TOLERANCE) if extent is not None else None
+
+    def set_indexes(self, search_extent):
+        """
+        Build the spatial indexes of the work layers' features within the search extent, storing their geometries
+
+        :param search_extent: Extent around the added features
+        :type search_extent: QgsRectangle
+        """
+        request = QgsFeatureRequest().setFilterRect(search_extent)
+        self.points_index = QgsSpatialIndex(self.points_layer.getFeatures(request),
+                                            flags=QgsSpatialIndex.FlagStoreFeatureGeometries)
+        self.lines_index = QgsSpatialIndex(self.lines_layer.getFeatures(request),
+                                           flags=QgsSpatialIndex.FlagStoreFeatureGeometries)
+        self.polygons_index = QgsSpatialIndex(self.polygons_layer.getFeatures(request),
+                                              flags=QgsSpatialIndex.FlagStoreFeatureGeometries)
+        self.coast_lines_index = QgsSpatialIndex(self.coast_lines_layer.getFeatures(request),
+                                                 flags=QgsSpatialIndex.FlagStoreFeatureGeometries)
+
+    # #######################
+    # Checks
+    def check_polygon(self, polygon):
+        """
+        Check that the polygon doesn't overlap its neighbors and that there are no gaps between them
+
+        :param polygon: Polygon of an added municipality
+        :type polygon: QgsFeature
+        """
+        polygon_geom = polygon.geometry()
+        municipality_ine = str(polygon['CodiMuni'])
+        neighbor_geoms = []
+        search_rectangle = polygon_geom.boundingBox().buffered(QA_TOLERANCE)
+        for fid in self.polygons_index.intersects(search_rectangle):
+            if fid == polygon.id():
+                continue
+            neighbor_geom = self.polygons_index.geometry(fid)
+            if neighbor_geom.distance(polygon_geom) > QA_TOLERANCE:
+                continue
+            neighbor_geoms.append(neighbor_geom)
+            # Overlaps. The overlap between two added polygons is only reported by the one with the lowest ID
+            if fid in self.added_polygon_ids and fid < polygon.id():
+                continue
+            overlap_geom = polygon_geom.intersection(neighbor_geom)
+            overlap_area = overlap_geom.area()
+            if overlap_area > QA_MIN_OVERLAP_AREA:
+                issue_type = 'Escletxa encavalcada' if overlap_area <= QA_SLIVER_MAX_AREA else 'Encavalcament'
+                self.add_issue(overlap_geom.pointOnSurface(), issue_type, municipality_ine, overlap_area,
+                               'El polígon es superposa amb un polígon veí')
+
+        # Gaps, as the holes of the union of the polygon and its neighbors that touch the polygon
+        union_geom = QgsGeometry.unaryUnion([polygon_geom] + neighbor_geoms)
+        for part in union_geom.asGeometryCollection():
+            for ring in part.asPolygon()[1:]:
+                hole_geom = QgsGeometry.fromPolygonXY([ring])
+                if hole_geom.distance(polygon_geom) > QA_TOLERANCE:
+                    continue
+                # The holes filled by other municipalities, as the enclaves, aren't gaps
+                gap_geom = self.get_uncovered_geometry(hole_geom)
+                gap_area = gap_geom.area()
+                if gap_area <= QA_MIN_OVERLAP_AREA:
+                    continue
+                issue_type = 'Escletxa' if gap_area <= QA_SLIVER_MAX_AREA else 'Buit'
+                self.add_issue(gap_geom.pointOnSurface(), issue_type, municipality_ine, gap_area,
+                               'Espai buit entre el polígon i els polígons veïns')
+
+    def check_line(self, line):
+        """
+        Check that every line's endpoint reaches another line, or the coast line, and has a fita
+
+        :param line: Line of an added municipality
+        :type line: QgsFeature
+        """
+        line_id = str(line['IdLinia'])
+        for endpoint in self.get_line_endpoints(line.geometry()):
+            endpoint_geom = QgsGeometry.fromPointXY(endpoint)
+            # Dangling endpoints. The lines that end at the coast don't touch any other boundary line
+            if not self.get_near_features(self.lines_index, endpoint_geom, line.id()) and \
+                    not self.get_near_features(self.coast_lines_index, endpoint_geom):
+                self.add_issue(endpoint_geom, 'Extrem penjat', line_id, None,
+                               'L\'extrem de la línia no toca cap altra línia ni la línia de costa')
+            # Fita - line coincidence
+            if not self.get_near_features(self.points_index, endpoint_geom):
+                self.add_issue(endpoint_geom, 'Extrem sense fita', line_id, None,
+                               'L\'extrem de la línia no coincideix amb cap fita')
+
+    def check_point(self, point):
+        """
+        Check that the fita is on a boundary line
+
+        :param point: Fita of an added municipality
+        :type point: QgsFeature
+        """
+        point_geom = point.geometry()
+        if not self.get_near_features(self.lines_index, point_geom):
+            self.add_issue(point_geom, 'Fita fora de línia', str(point['IdFita']), None,
+                           'La fita no coincideix amb cap línia de terme')
+
+    # #######################
+    # Helpers
+    @staticmethod
+    def get_line_endpoints(line_geom):
+        """
+        Get the endpoints of every open part of the line
+
+        :param line_geom: Geometry of the line
+        :type line_geom: QgsGeometry
+
+        :return: List with the line's endpoints
+        :rtype: list
+        """
+        parts = line_geom.asMultiPolyline() if line_geom.isMultipart() else [line_geom.asPolyline()]
+        endpoints = []
+        for part in parts:
+            if part and part[0] != part[-1]:
+                endpoints.extend((part[0], part[-1]))
+
+        return endpoints
+
+    @staticmethod
+    def get_near_features(index, geom, excluded_fid=None):
+        """
+        Get the features of the index that are within the tolerance of the given geometry
+
+        :param index: Spatial index storing the features' geometries
+        :type index: QgsSpatialIndex
+
+        :param geom: Geometry to search around
+        :type geom: QgsGeometry
+
+        :param excluded_fid: ID of a feature to exclude from the search
+        :type excluded_fid: int
+
+        :return: List with the ID of the near features
+        :rtype: list
+        """
+        search_rectangle = geom.boundingBox().buffered(QA_TOLERANCE)
+        return [fid for fid in index.intersects(search_rectangle)
+                if fid != excluded_fid and index.geometry(fid).distance(geom) <= QA_TOLERANCE]
+
+    def get_uncovered_geometry(self, geom):
+        """
+        Get the part of the geometry that isn't covered by any polygon of the work layer
+
+        :param geom: Geometry to check
+        :type geom: QgsGeometry
+
+        :return: Part of the geometry not covered by any polygon
+        :rtype: QgsGeometry
+        """
+        covering_geoms = [self.polygons_index.geometry(fid)
+                          for fid in self.polygons_index.intersects(geom.boundingBox())]
+        if not covering_geoms:
+            return geom
+
+        return geom.difference(QgsGeometry.unaryUnion(covering_geoms))
+
+    def add_issue(self, geom, issue_type, entity, value, description):
+        """
+        Add an issue to the report
+
+        :param geom: Location of the issue
+        :type geom: QgsGeometry
+
+        :param issue_type: Type of the issue
+        :type issue_type: str
+
+        :param entity: ID of the entity with the issue
+        :type entity: str
+
+        :param value: Value of the issue, as the area of an overlap or gap
+        :type value: float
+
+        :param description: Description of the issue
+        :type description: str
+        """
+        issue = QgsFeature(self.report_layer.fields())
+        issue.setGeometry(geom)
+        issue.setAttributes([issue_type, entity, value, description])
+        self.issues.append(issue)
@@ -30,6 +30,9 @@ from qgis.core import (QgsVectorLayer,
 from PyQt5.QtCore import QVariant
 from qgis.core.additions.edit import edit
 
+from .style_registry import StyleRegistry
+from .workspace import Workspace
+
 import processing
 from processing.algs.grass7.Grass7Utils import Grass7Utils
 # Ensure that the GRASS 7 folder is correctly configured
@@ -92,6 +95,7 @@ class CartographicDocument:
         self.muni_1_nomens, self.muni_2_nomens = None, None
         self.muni_1_normalized_name, self.muni_2_normalized_name = None, None
         self.dissolve_temp, self.split_temp = None, None  # temporal layers
+        self.workspace = None   # Scratch workspace of the pdf generation
         self.atlas = None
         # Inpunt non dependant
         self.string_date = None
@@ -205,13 +209,14 @@ class CartographicDocument:
             QgsMessageLog.logMessage("Generant l'arxiu del Document Cartogràfic en format pdf...", level=Qgis.Info)
             # Get the normalized municipalities names, as needed for the output file name
             self.muni_1_normalized_name, self.muni_2_normalized_name = self.get_municipalities_normalized_names()
-            # Create, manage and add to the map the atlas coverage layer
-            self.manage_coverage_layer()
-            # Set up, export and merge into a single pdf file the Cartographic document
-            self.export_cartographic_doc()
-            QgsMessageLog.logMessage('Procés finalitzat: Document Cartogràfic de Referència generat', level=Qgis.Info)
-            # Reset the environment, removing the coverage layer from the map canvas and the temporal files
-            self.reset_environment()
+            with Workspace(TEMP_DIR, f'doc-carto-{self.line_id}-') as self.workspace:
+                # Create, manage and add to the map the atlas coverage layer
+                self.manage_coverage_layer()
+                # Set up, export and merge into a single pdf file the Cartographic document
+                self.export_cartographic_doc()
+                QgsMessageLog.logMessage('Procés finalitzat: Document Cartogràfic de Referència generat', level=Qgis.Info)
+                # Reset the environment, removing the coverage layer from the map canvas and the temporal layers
+                self.reset_environment()
 
     # ##########
     # Get variables
@@ -358,30 +363,18 @@ class CartographicDocument:
 
     def add_layers_styles(self):
         """ Add style and simbology to the added layers """
-        layers = self.project.mapLayers().values()
-        for layer in layers:
-            if layer.name() == 'Punt Delimitació':
-                layer.loadNamedStyle(os.path.join(LAYOUT_DOC_CARTO_STYLE_DIR, 'fites_delimitacio_1.qml'))
-                layer.triggerRepaint()
-
-            elif layer.name() == 'Punt Replantejament':
-                layer.loadNamedStyle(os.path.join(LAYOUT_DOC_CARTO_STYLE_DIR, 'fites_replantejament.qml'))
-                layer.triggerRepaint()
-            elif layer.name() == 'Lin Tram Proposta':
-                layer.loadNamedStyle(os.path.join(LAYOUT_DOC_CARTO_STYLE_DIR, 'linia_terme_delimitacio_1.qml'))
-                layer.triggerRepaint()
-
-            elif layer.name() == 'Lin Tram':
-                layer.loadNamedStyle(os.path.join(LAYOUT_DOC_CARTO_STYLE_DIR, 'linia_terme_replantejament.qml'))
-                layer.triggerRepaint()
+        styles = {
+            'Punt Delimitació': 'fites_delimitacio_1.qml',
+            'Punt Replantejament': 'fites_replantejament.qml',
+            'Lin Tram Proposta': 'linia_terme_delimitacio_1.qml',
+            'Lin Tram': 'linia_terme_replantejament.qml'
+        }
+        if self.proposta_2_exists:
+            styles['Punt Delimitació 2'] = 'fites_delimitacio_2.qml'
+            styles['Lin Tram Proposta 2'] = 'linia_terme_delimitacio_2.qml'
 
-            if self.proposta_2_exists:
-                if layer.name() == 'Punt Delimitació 2':
-                    layer.loadNamedStyle(os.path.join(LAYOUT_DOC_CARTO_STYLE_DIR, 'fites_delimitacio_2.qml'))
-                    layer.triggerRepaint()
-                elif layer.name() == 'Lin Tram Proposta 2':
-                    layer.loadNamedStyle(os.path.join(LAYOUT_DOC_CARTO_STYLE_DIR, 'linia_terme_delimitacio_2.qml'))
-                    layer.triggerRepaint()
+        style_registry = StyleRegistry(LAYOUT_DOC_CARTO_STYLE_DIR, styles)
+        style_registry.apply_styles(self.project.mapLayers().values())
 
     # #######################
     # Generate atlas
@@ -402,10 +395,10 @@ class CartographicDocument:
         it later
         """
         lin_tram_ppta = self.project.mapLayersByName('Lin Tram Proposta')[0]
-        parameters = {'INPUT': lin_tram_ppta, 'OUTPUT': os.path.join(TEMP_DIR, f'doc-carto-{self.line_id}_dissolve_temp.shp')}
+        parameters = {'INPUT': lin_tram_ppta, 'OUTPUT': self.workspace.get_path('dissolve_temp.shp')}
         processing.run("native:dissolve", parameters)
         # Set the layer as class variable
-        self.dissolve_temp = QgsVectorLayer(os.path.join(TEMP_DIR, f'doc-carto-{self.line_id}_dissolve_temp.shp'),
+        self.dissolve_temp = QgsVectorLayer(self.workspace.get_path('dissolve_temp.shp'),
                                             'dissolve-temp', 'ogr')
 
     def split_dissolved_layer(self):
@@ -420,9 +413,9 @@ class CartographicDocument:
         elif self.scale == '1:2 500':
             length = 750
         parameters = {'input': self.dissolve_temp, 'length': length, 'units': 1,
-                      'output': os.path.join(TEMP_DIR, f'doc-carto-{self.line_id}_split_temp.shp')}
+                      'output': self.workspace.get_path('split_temp.shp')}
         processing.run("grass7:v.split", parameters)
-        self.split_temp = QgsVectorLayer(os.path.join(TEMP_DIR, f'doc-carto-{self.line_id}_split_temp.shp'),
+        self.split_temp = QgsVectorLayer(self.workspace.get_path('split_temp.shp'),
                                          'split-temp', 'ogr')
 
     def sort_splitted_layer(self):
@@ -530,7 +523,7 @@ class CartographicDocument:
         export = QgsLayoutExporter(self.legend)
         settings = QgsLayoutExporter.ImageExportSettings()
         settings.dpi = 150
-        export.exportToImage(os.path.join(TEMP_DIR, f'legend-{self.line_id}.tiff'), settings)
+        export.exportToImage(self.workspace.get_path('legend.tiff'), settings)
 
     def export_atlas(self):
         """ Export every atlas layout as a .jpg file """
@@ -545,7 +538,7 @@ class CartographicDocument:
             current_feature_number = str(self.atlas.currentFeatureNumber() + 1)
             atlas_count = str(self.atlas.count())
             QgsMessageLog.logMessage(f'Exportant arxiu: {current_feature_number} de {atlas_count}', level=Qgis.Info)
-            exporter.exportToImage(os.path.join(TEMP_DIR, f'{self.atlas.currentFilename()}-{self.line_id}.tiff'),
+            exporter.exportToImage(self.workspace.get_path(f'{self.atlas.currentFilename()}.tiff'),
                                    settings)
             # Create next Layout
             self.atlas.next()
@@ -575,11 +568,11 @@ class CartographicDocument:
         # First get a list with the path of the JPG files
         jpg_list = []
         # Append the legend as the first item in the JPG files
-        legend_path = os.path.join(TEMP_DIR, f'legend-{self.line_id}.tiff')
+        legend_path = self.workspace.get_path('legend.tiff')
         if os.path.exists(legend_path):
             jpg_list.append(legend_path)
         # Append the rest of the JPG files
-        for root, dirs, files in os.walk(TEMP_DIR):
+        for root, dirs, files in os.walk(self.workspace.path):
             for f in files:
                 f_path = os.path.join(root, f)
                 if f.endswith('.tiff') and f_path not in jpg_list:
@@ -638,7 +631,7 @@ class CartographicDocument:
     def reset_environment(self):
         """ Environment reset's entry point. The function involves the following processes:
             - Remove the coverage layer from the map canvas
-            - Remove the temporal files in the temp directory
+            - Release the temporal layers of the workspace
         """
         self.rm_split_map_layer()
         self.rm_temp()
@@ -648,18 +641,5 @@ class CartographicDocument:
         self.project.removeMapLayer(self.split_temp)
 
     def rm_temp(self):
-        """ Remove the temporal files from the temp directory """
-        QgsMessageLog.logMessage('Esborrant arxius temporals...', level=Qgis.Info)
-        rm = True
+        """ Release the temporal layers, so the workspace can remove their files """
         self.dissolve_temp, self.split_temp = None, None   # In order to avoid process locks and be able to delete the Shapefiles and DBF
-        for filename in os.listdir(TEMP_DIR):
-            file_path = os.path.join(TEMP_DIR, filename)
-            try:
-                if os.path.exists(file_path) and self.line_id in filename:
-                    os.remove(file_path)
-            except Exception as e:
-                QgsMessageLog.logMessage(f"Error esborrant l'arxiu {filename} => {e}", level=Qgis.Critical)
-                rm = False
-
-        if rm:
-            QgsMessageLog.logMessage('Arxius temporals esborrats', level=Qgis.Info)
@@ -24,6 +24,7 @@ from qgis.core import (QgsVectorLayer,
                        Qgis)
 
 from ..config import *
+from ..utils import get_attributes_request, get_features_attributes
 from .adt_postgis_connection import PgADTConnection
 
 
@@ -43,10 +44,10 @@ class CheckMM:
         self.report_path = os.path.join(CHECK_MM_LOCAL_DIR, f'Nous_MM_{self.current_date}.txt')
         # Entities
         self.area_muni_cat_table = self.pg_adt.get_table('area_muni_cat')
-        self.line_table = self.pg_adt.get_table('linia')
-        self.dic_municipality_table = self.pg_adt.get_table('dic_municipality')
-        self.mapa_muni_table = self.pg_adt.get_table('mapa_muni_icc')
-        self.mtt_table = self.pg_adt.get_table('memoria_treb_top')
+        self.line_table = self.pg_adt.get_cached_table('linia')
+        self.dic_municipality_table = self.pg_adt.get_cached_table('dic_municipality')
+        self.mapa_muni_table = self.pg_adt.get_cached_table('mapa_muni_icc')
+        self.mtt_table = self.pg_adt.get_cached_table('memoria_treb_top')
 
     def get_new_mm(self):
         """
@@ -54,7 +55,7 @@ class CheckMM:
         be done. Then writes that list in a text file.
         """
         QgsMessageLog.logMessage('Comprovant llistat de nous Mapes municipals...', level=Qgis.Info)
-        for municipality in self.area_muni_cat_table.getFeatures():
+        for municipality in get_features_attributes(self.area_muni_cat_table, ['codi_muni', 'id_area']):
             municipality_ine = municipality['codi_muni']
             # Check if the municipality has a considered MM
             municipality_mm_exists = self.check_municipality_mm(municipality_ine)
@@ -100,7 +101,7 @@ class CheckMM:
         self.line_table.selectByExpression(f'"id_area_1"={municipality_id} or "id_area_2"={municipality_id}',
                                                 QgsVectorLayer.SetSelection)
         municipality_line_list = []
-        for line in self.line_table.getSelectedFeatures():
+        for line in self.line_table.getSelectedFeatures(get_attributes_request(self.line_table, ['id_linia'])):
             line_id = line['id_linia']
             municipality_line_list.append(int(line_id))
 
@@ -5,21 +5,24 @@
 
 In this file is where the decimetritzador class is defined. The main function
 of this class is to take both points and lines layers and transform them
-decimals in order to round them to 1.
+decimals in order to round them to 1. The BatchDecimetritzador class applies
+the same process to every DocDelim directory found into a root directory.
 ***************************************************************************/
 """
 
 import os
+import numpy as np
+from datetime import datetime
 
 from ..utils import *
 
-from qgis.core.additions.edit import edit
 from qgis.core import (QgsVectorLayer,
                        QgsDataSourceUri,
                        QgsProviderRegistry,
                        QgsPoint,
                        QgsPointXY,
                        QgsGeometry,
+                       QgsFeatureRequest,
                        QgsMessageLog,
                        Qgis)
 from PyQt5.QtWidgets import QMessageBox
@@ -46,113 +49,98 @@ class Decimetritzador:
         """ Set the input layers as PyQGIS Vector layers """
         self.point_layer = QgsVectorLayer(os.path.join(self.doc_delim, 'Cartografia', 'Punt.shp'))
         self.line_layer = QgsVectorLayer(os.path.join(self.doc_delim, 'Cartografia', 'Lin_TramPpta.shp'))
-        if self.line_layer.featureCount() == 0:
+        if not self.line_layer.isValid() or self.line_layer.featureCount() == 0:
             self.line_layer = QgsVectorLayer(os.path.join(self.doc_delim, 'Cartografia', 'Lin_Tram.shp'))
             QgsMessageLog.logMessage('Es decimetritzarà la capa Lin_Tram', level=Qgis.Info)
         else:
             QgsMessageLog.logMessage('Es decimetritzarà la capa Lin_TramPpta', level=Qgis.Info)
 
     def decimetritzar_points(self):
-        """ Edit the points' geometry in order to round the coordinates decimals """
+        """
+        Edit the points' geometry in order to round the coordinates decimals. All the coordinates are rounded at once
+        and only the points that change are written, with a single provider call
+        """
         QgsMessageLog.logMessage('Decimetritzant capa de punts...', level=Qgis.Info)
-        with edit(self.point_layer):
-            for point in self.point_layer.getFeatures():
-                geom = point.geometry()
-                coord_x = geom.get().x()
-                coord_y = geom.get().y()
-                z = geom.get().z()
-                # Round coordinates
-                x, y = round_coordinates(coord_x, coord_y)
-                if z != 0.0:
-                    z = round(z, 1)
-                # Create new geometry
-                rounded_point = QgsPoint(x, y, z)
-                rounded_geom = QgsGeometry(rounded_point)
-                # Set new geometry
-                self.point_layer.changeGeometry(point.id(), rounded_geom)
-        QgsMessageLog.logMessage('Capa de punts decimetritzada', level=Qgis.Info)
+        point_ids, coords = [], []
+        for point in self.point_layer.getFeatures(QgsFeatureRequest().setNoAttributes()):
+            geom = point.geometry().constGet()
+            point_ids.append(point.id())
+            coords.append((geom.x(), geom.y(), geom.z()))
+        if not point_ids:
+            QgsMessageLog.logMessage('La capa de punts no té cap punt', level=Qgis.Warning)
+            return
+
+        arr_coords = np.array(coords, dtype=float)
+        arr_rounded = round_coordinates_array(arr_coords)
+        # Z coordinates equal to 0 are kept as they are, and NaN means that the point doesn't have Z coordinate
+        arr_rounded[:, 2] = np.where(arr_coords[:, 2] == 0.0, 0.0, arr_rounded[:, 2])
+        # Skip the points that are already rounded
+        changed = np.any(~np.isclose(arr_coords, arr_rounded, rtol=0, atol=0, equal_nan=True), axis=1)
+
+        geometry_map = {}
+        for index in np.flatnonzero(changed):
+            x, y, z = arr_rounded[index]
+            geometry_map[point_ids[index]] = QgsGeometry(QgsPoint(x, y, z))
+        if geometry_map:
+            self.point_layer.dataProvider().changeGeometryValues(geometry_map)
+        QgsMessageLog.logMessage(f'Capa de punts decimetritzada: {len(geometry_map)} de {len(point_ids)} punts '
+                                 f'modificats', level=Qgis.Info)
 
     def decimetritzar_lines(self):
-        """ Edit the lines' geometry in order to round the endpoint's coordinates decimals """
+        """
+        Edit the lines' geometry in order to round the endpoint's coordinates decimals. All the endpoints are rounded
+        at once and only the lines that change are written, with a single provider call
+        """
         QgsMessageLog.logMessage('Decimetritzant capa de trams de línia...', level=Qgis.Info)
-        with edit(self.line_layer):
-            for line in self.line_layer.getFeatures():
-                tram = line.geometry().asMultiPolyline()
-                verts = tram[0]
-                # Comprovar si el primer i últim vertex del tram ja estan decimetritzats i per tant no s'han
-                # de decimetritzar
-                first_vert_decim, last_vert_decim = self.check_tram_decimals(verts)
-                if first_vert_decim and last_vert_decim:
-                    continue
-                first_vertex = verts[0]
-                last_vertex = verts[-1]
-                if len(verts) > 2:
-                    if first_vert_decim and not last_vert_decim:
-                        tram_vertex = verts[:-1]
-                    elif not first_vert_decim and last_vert_decim:
-                        tram_vertex = verts[1:]
-                    else:
-                        tram_vertex = verts[1:-1]
-                # Round first and last vertex
-                # First
-                if not first_vert_decim:
-                    first_coord_x = first_vertex.x()
-                    first_coord_y = first_vertex.y()
-                    first_x, first_y = round_coordinates(first_coord_x, first_coord_y)
-                    rounded_first_vert = QgsPointXY(first_x, first_y)
-                # Last
-                if not last_vert_decim:
-                    last_coord_x = last_vertex.x()
-                    last_coord_y = last_vertex.y()
-                    last_x, last_y = round_coordinates(last_coord_x, last_coord_y)
-                    rounded_last_vert = QgsPointXY(last_x, last_y)
-                # Create new geometry
-                if len(verts) > 2:
-                    if not first_vert_decim:
-                        tram_vertex.insert(0, rounded_first_vert)
-                    if not last_vert_decim:
-                        tram_vertex.insert(len(tram_vertex), rounded_last_vert)
-                    rounded_geom = QgsGeometry.fromMultiPolylineXY([tram_vertex])
-                else:
-                    pairs_vertex = [rounded_first_vert, rounded_last_vert]
-                    rounded_geom = QgsGeometry.fromMultiPolylineXY([pairs_vertex])
-
-                # Set new geometry
-                self.line_layer.changeGeometry(line.id(), rounded_geom)
-        QgsMessageLog.logMessage('Capa de trams de línia decimetritzada', level=Qgis.Info)
+        line_ids, trams, endpoints = [], [], []
+        for line in self.line_layer.getFeatures(QgsFeatureRequest().setNoAttributes()):
+            verts = line.geometry().asMultiPolyline()[0]
+            line_ids.append(line.id())
+            trams.append(verts)
+            endpoints.append((verts[0].x(), verts[0].y(), verts[-1].x(), verts[-1].y()))
+        if not line_ids:
+            QgsMessageLog.logMessage('La capa de trams de línia no té cap tram', level=Qgis.Warning)
+            return
+
+        arr_endpoints = np.array(endpoints, dtype=float)
+        arr_rounded = round_coordinates_array(arr_endpoints)
+        # Comprovar si el primer i últim vertex del tram ja estan decimetritzats i per tant no s'han
+        # de decimetritzar
+        first_vert_decim, last_vert_decim = self.check_tram_decimals(arr_endpoints, arr_rounded)
+
+        geometry_map = {}
+        for index in np.flatnonzero(~(first_vert_decim & last_vert_decim)):
+            first_x, first_y, last_x, last_y = arr_rounded[index]
+            tram_vertex = trams[index]
+            if not first_vert_decim[index]:
+                tram_vertex[0] = QgsPointXY(first_x, first_y)
+            if not last_vert_decim[index]:
+                tram_vertex[-1] = QgsPointXY(last_x, last_y)
+            geometry_map[line_ids[index]] = QgsGeometry.fromMultiPolylineXY([tram_vertex])
+        if geometry_map:
+            self.line_layer.dataProvider().changeGeometryValues(geometry_map)
+        QgsMessageLog.logMessage(f'Capa de trams de línia decimetritzada: {len(geometry_map)} de {len(line_ids)} '
+                                 f'trams modificats', level=Qgis.Info)
 
     @staticmethod
-    def check_tram_decimals(verts):
+    def check_tram_decimals(arr_endpoints, arr_rounded):
         """
-        Check if a line's endpoints have them coordinates decimals already rounded or not
+        Check if the lines' endpoints have them coordinates decimals already rounded or not
 
-        :param verts: List with the first and last vertex of the line
-        :type verts: tuple
+        :param arr_endpoints: Array with the first and last vertex coordinates of every line, as [x1, y1, x2, y2]
+        :type arr_endpoints: numpy.ndarray
 
-        :return: Indicates if the point's coordinates decimals are rounded or not
-        :rtype: bool
+        :param arr_rounded: Array with the same coordinates already rounded
+        :type arr_rounded: numpy.ndarray
+
+        :return: Arrays that indicate if the first and last vertex coordinates decimals of every line are rounded
+        :rtype: numpy.ndarray
         """
-        first_vertex = verts[0]
-        last_vertex = verts[-1]
-        # Check first
-        first_coord_x = first_vertex.x()
-        first_coord_y = first_vertex.y()
-        first_dif_x = abs(first_coord_x - round(first_coord_x, 1))
-        first_dif_y = abs(first_coord_y - round(first_coord_y, 1))
-        # Check last
-        last_coord_x = last_vertex.x()
-        last_coord_y = last_vertex.y()
-        last_dif_x = abs(last_coord_x - round(last_coord_x, 1))
-        last_dif_y = abs(last_coord_y - round(last_coord_y, 1))
-        # Check
-        if (first_dif_x > 0.0001 or first_dif_y > 0.0001) and (last_dif_x > 0.0001 or last_dif_y > 0.0001):
-            return False, False
-        elif (first_dif_x > 0.0001 or first_dif_y > 0.0001) and (last_dif_x < 0.01 or last_dif_y < 0.01):
-            return False, True
-        elif (first_dif_x < 0.01 or first_dif_y < 0.01) and (last_dif_x > 0.0001 or last_dif_y > 0.0001):
-            return True, False
-        else:
-            return True, True
+        arr_dif = np.abs(arr_endpoints - arr_rounded)
+        first_vert_decim = np.all(arr_dif[:, 0:2] <= 0.0001, axis=1)
+        last_vert_decim = np.all(arr_dif[:, 2:4] <= 0.0001, axis=1)
+
+        return first_vert_decim, last_vert_decim
 
     def check_input_data(self):
         """
@@ -161,18 +149,120 @@ class Decimetritzador:
         :return: Indicates if exists all the necessary input data
         :rtype: bool
         """
-        cartography_directory = os.path.join(self.doc_delim, 'Cartografia')
-        if os.path.isdir(cartography_directory):
-            points_layer = os.path.join(cartography_directory, 'Punt.shp')
-            lines_layer = os.path.join(cartography_directory, 'Lin_TramPpta.shp')
-            if os.path.exists(points_layer) and os.path.exists(lines_layer):
-                return True
-            else:
-                self.box_error.setText("Falta la capa de Punts o Trams a la carpeta de Cartografia")
-                self.box_error.exec_()
-                return False
-        else:
-            self.box_error.setText("El directori introduït no té carpeta de Cartografia")
+        input_data_error = self.get_input_data_error()
+        if input_data_error:
+            self.box_error.setText(input_data_error)
             self.box_error.exec_()
             return False
 
+        return True
+
+    def get_input_data_error(self):
+        """
+        Get the error of the input data into the input directory, without showing it
+
+        :return: Error message, or None if exists all the necessary input data
+        :rtype: str
+        """
+        cartography_directory = os.path.join(self.doc_delim, 'Cartografia')
+        if not os.path.isdir(cartography_directory):
+            return "El directori introduït no té carpeta de Cartografia"
+        points_layer = os.path.join(cartography_directory, 'Punt.shp')
+        lines_layer = os.path.join(cartography_directory, 'Lin_TramPpta.shp')
+        if not os.path.exists(points_layer) or not os.path.exists(lines_layer):
+            return "Falta la capa de Punts o Trams a la carpeta de Cartografia"
+
+        return None
+
+
+class BatchDecimetritzador:
+    """ Decimetritzador of all the DocDelim directories that are into a root directory """
+
+    def __init__(self, root_directory):
+        """
+        Constructor
+
+        :param root_directory: Path to the root directory that contains the DocDelim directories
+        :type root_directory: str
+        """
+        self.root_directory = root_directory
+        self.report_path = os.path.join(root_directory, 'decimetritzador_log.txt')
+        self.doc_delim_list = []
+        self.results = {}
+
+    def decimetritzar(self):
+        """
+        Main entry point of the BatchDecimetritzador's class. Decimetritze all the DocDelim directories one after the
+        other, as the layers are edited in the main thread, and write the log report
+
+        :return: Number of DocDelim directories decimetritzed without errors
+        :rtype: int
+        """
+        self.doc_delim_list = self.get_doc_delim_list()
+        QgsMessageLog.logMessage(f"S'han trobat {len(self.doc_delim_list)} carpetes DocDelim per decimetritzar",
+                                 level=Qgis.Info)
+        for doc_delim in self.doc_delim_list:
+            self.results[doc_delim] = self.decimetritzar_line(Decimetritzador(doc_delim))
+        self.write_report()
+
+        return len([result for result in self.results.values() if result == 'OK'])
+
+    def get_doc_delim_list(self):
+        """
+        Get the DocDelim directories that are into the root directory, which are the ones that have a Cartografia
+        directory with the points and line's trams layers
+
+        :return: List with the paths to the DocDelim directories
+        :rtype: list
+        """
+        doc_delim_list = []
+        for dirpath, dirnames, filenames in os.walk(self.root_directory):
+            if 'Cartografia' not in dirnames:
+                continue
+            cartography_directory = os.path.join(dirpath, 'Cartografia')
+            points_layer = os.path.join(cartography_directory, 'Punt.shp')
+            lines_layers = (os.path.join(cartography_directory, 'Lin_TramPpta.shp'),
+                            os.path.join(cartography_directory, 'Lin_Tram.shp'))
+            if os.path.exists(points_layer) and any(os.path.exists(layer) for layer in lines_layers):
+                doc_delim_list.append(dirpath)
+
+        return sorted(doc_delim_list)
+
+    @staticmethod
+    def decimetritzar_line(decimetritzador):
+        """
+        Decimetritze the layers of a single DocDelim directory, if it has all the necessary input data
+
+        :param decimetritzador: Decimetritzador of the DocDelim directory
+        :type decimetritzador: Decimetritzador
+
+        :return: Result of the process, 'OK' or the error message
+        :rtype: str
+        """
+        input_data_error = decimetritzador.get_input_data_error()
+        if input_data_error:
+            QgsMessageLog.logMessage(f"No s'ha pogut decimetritzar {decimetritzador.doc_delim} => {input_data_error}",
+                                     level=Qgis.Warning)
+            return f'Error => {input_data_error}'
+        try:
+            decimetritzador.decimetritzar()
+        except Exception as e:
+            QgsMessageLog.logMessage(f"No s'ha pogut decimetritzar {decimetritzador.doc_delim} => {e}",
+                                     level=Qgis.Critical)
+            return f'Error => {e}'
+
+        return 'OK'
+
+    def write_report(self):
+        """ Write the log report with the result of every DocDelim directory """
+        n_ok = len([result for result in self.results.values() if result == 'OK'])
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            f.write("--------------------------------------------------------------------\n")
+            f.write("Decimetritzador de línies\n")
+            f.write(f"Data: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write("--------------------------------------------------------------------\n")
+            f.write("\n")
+            for doc_delim, result in self.results.items():
+                f.write(f'{os.path.relpath(doc_delim, self.root_directory)}:        {result}\n')
+            f.write("-------------------------\n")
+            f.write(f'Nº total de línies decimetritzades: {n_ok} de {len(self.results)}\n')
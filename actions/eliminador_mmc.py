@@ -13,6 +13,10 @@ import os
 import numpy as np
 
 from qgis.core import (QgsVectorLayer,
+                       QgsFeatureRequest,
+                       QgsGeometry,
+                       QgsPointXY,
+                       QgsSpatialIndex,
                        QgsMessageLog,
                        Qgis)
 from qgis.core.additions.edit import edit
@@ -22,6 +26,9 @@ from ..config import *
 from ..utils import *
 from .adt_postgis_connection import PgADTConnection
 
+# Maximum distance, in meters, between a point and the lines that reach it
+FITA_LINE_TOLERANCE = 0.2
+
 
 class EliminadorMMC:
     """ MMC Deletion class """
@@ -111,7 +118,7 @@ class EliminadorMMC:
         """
         mapa_muni_table, expression = None, None
         if layer == 'postgis':
-            mapa_muni_table = self.pg_adt.get_table('mapa_muni_icc')
+            mapa_muni_table = self.pg_adt.get_cached_table('mapa_muni_icc')
             expression = f'"codi_muni"=\'{municipality_codi_ine}\' and "vig_mm" is True'
         elif layer == 'input':
             mapa_muni_table = self.input_polygons_layer
@@ -213,68 +220,77 @@ class EliminadorMMC:
                 self.input_full_bt5_table.deleteFeature(line.id())
 
     def remove_points_layer(self):
-        """
-        Remove the municipality's points from the database's layer
-        Atenció: en alguns casos no esborra correctament les fites 3 termes.
-        """
+        """ Remove the municipality's points from the database's layer """
         point_id_remove_list = self.get_points_to_remove()
+        point_fids = [feature.id() for feature in get_features_attributes(self.input_points_layer, ['IdFita'])
+                      if feature['IdFita'] in point_id_remove_list]
         with edit(self.input_points_layer):
-            for point_id in point_id_remove_list:
-                self.input_points_layer.selectByExpression(f'"IdFita"=\'{point_id}\'', QgsVectorLayer.SetSelection)
-                for feature in self.input_points_layer.getSelectedFeatures():
-                    self.input_points_layer.deleteFeature(feature.id())
-
-        box = QMessageBox()
-        box.setIcon(QMessageBox.Warning)
-        box.setText("Enrecorda't de revisar que s'han esborrat\ncorrectament totes les fites 3 termes.")
-        box.exec_()
+            self.input_points_layer.deleteFeatures(point_fids)
 
     def get_points_to_remove(self):
         """
         Get the points that the class has to remove, in order to avoid removing points that have to exists
-        due they also pertain to another municipality that have MM.
+        due they also pertain to another municipality that have MM. The F2T points of the removed lines are always
+        removed, while the F3T and F4T points are only removed if none of the lines that remain in the lines layer
+        reaches them.
 
         :return point_id_remove_list: List with the ID of all the points to remove from the points layer
-        :rtype: tuple
+        :rtype: set
         """
         fita_mem_layer = self.pg_adt.get_layer('v_fita_mem', 'id_fita')
-        point_id_remove_list = []
+        point_id_remove_list = set()
         delete_lines_list, edit_lines_dict = self.get_lines_to_manage()
-
-        for line_id in delete_lines_list:
-            fita_mem_layer.selectByExpression(f'"id_linia"=\'{line_id}\'', QgsVectorLayer.SetSelection)
-            for feature in fita_mem_layer.getSelectedFeatures():
-                # Check that the point has correctly filled the coordinates fields
-                if feature['point_x'] and feature['point_y']:
-                    point_id_fita = coordinates_to_id_fita(feature['point_x'], feature['point_y'])
-                    if feature['num_termes'] == 'F2T':
-                        point_id_remove_list.append(point_id_fita)
-                    elif feature['num_termes'] != 'F2T' and feature['num_termes']:
-                        '''
-                        No es pot fer una selecció espacial fita - linia de terme, de manera que no es 
-                        pot comprovar de manera 100% fiable si una fita 3 termes té una línia veïna amb MM o no.
-                        El que es fa és el següent:
-                            1. Per cada línia veïna, saber si cap dels municipis de la línia de terme té MM al MMC.
-                            2. Si en té, no s'elimina la fita 3 termes.
-                        '''
-                        neighbor_lines = self.get_neighbor_lines(line_id)
-                        neighbor_mm = False
-                        for neighbor_line in neighbor_lines:
-                            # Get neighbors municipalities
-                            neighbor_municipality_1_codi_ine, neighbor_municipality_2_codi_ine = self.get_neighbors_ine(
-                                neighbor_line)
-                            # Check if any of neighbors has MM
-                            neighbor_municipality_1_mm = self.check_mm_exists(neighbor_municipality_1_codi_ine, 'input')
-                            neighbor_municipality_2_mm = self.check_mm_exists(neighbor_municipality_2_codi_ine, 'input')
-                            if (neighbor_municipality_1_mm or neighbor_municipality_2_mm) and not neighbor_mm:
-                                neighbor_mm = True
-
-                        # If there is not any neighbor municipality with MM, remove the point
-                        if not neighbor_mm:
-                            point_id_remove_list.append(point_id_fita)
+        lines_index = None
+
+        delete_lines_ids = [int(line_id) for line_id in delete_lines_list]
+        # Check that the points have correctly filled the coordinates fields
+        features = [feature for feature in get_features_by_in_list(fita_mem_layer, 'id_linia', delete_lines_ids)
+                    if feature['point_x'] and feature['point_y'] and feature['num_termes']]
+        points_id_fita = coordinates_to_id_fita_array([feature['point_x'] for feature in features],
+                                                      [feature['point_y'] for feature in features])
+        for feature, point_id_fita in zip(features, points_id_fita.tolist()):
+            if feature['num_termes'] == 'F2T':
+                point_id_remove_list.add(point_id_fita)
+                continue
+            # The index is built only if there is any F3T or F4T point, after the lines have been removed
+            if lines_index is None:
+                lines_index = QgsSpatialIndex(self.input_lines_layer.getFeatures(),
+                                              flags=QgsSpatialIndex.FlagStoreFeatureGeometries)
+            incident_lines = self.get_incident_lines(lines_index, feature['point_x'], feature['point_y'])
+            if not incident_lines:
+                point_id_remove_list.add(point_id_fita)
+            else:
+                QgsMessageLog.logMessage(f"La fita {feature['num_termes']} {point_id_fita} es conserva per les línies "
+                                         f"{', '.join(sorted(incident_lines))}", level=Qgis.Info)
 
         return point_id_remove_list
 
+    def get_incident_lines(self, lines_index, point_x, point_y):
+        """
+        Get the lines of the lines layer that reach the given point, within the tolerance
+
+        :param lines_index: Spatial index of the lines layer, storing the lines' geometries
+        :type lines_index: QgsSpatialIndex
+
+        :param point_x: X coordinate of the point
+        :type point_x: float
+
+        :param point_y: Y coordinate of the point
+        :type point_y: float
+
+        :return: Set with the ID of the lines that reach the point
+        :rtype: set
+        """
+        point_geom = QgsGeometry.fromPointXY(QgsPointXY(point_x, point_y))
+        search_rectangle = point_geom.boundingBox().buffered(FITA_LINE_TOLERANCE)
+        incident_fids = [fid for fid in lines_index.intersects(search_rectangle)
+                         if lines_index.geometry(fid).distance(point_geom) <= FITA_LINE_TOLERANCE]
+        if not incident_fids:
+            return set()
+
+        request = QgsFeatureRequest().setFilterFids(incident_fids)
+        return {str(line['IdLinia']) for line in get_features_attributes(self.input_lines_layer, ['IdLinia'], request)}
+
     def remove_points_table(self):
         """ Remove the municipality's points from the database's table """
         for line_id in self.municipality_lines:
@@ -284,24 +300,6 @@ class EliminadorMMC:
                 for feature in self.input_points_table.getSelectedFeatures():
                     self.input_points_table.deleteFeature(feature.id())
 
-    def get_neighbor_lines(self, line_id):
-        """
-        Get the neighbor lines from the given boundary line
-
-        :param line_id: ID of the line to obtain its neighbor boundary lines
-        :type line_id: str
-
-        :return neighbor_lines: List with the line ID of the neighbor lines
-        :rtype: tuple
-        """
-        neighbor_lines = []
-        linia_veina_table = self.pg_adt.get_table('linia_veina')
-        linia_veina_table.selectByExpression(f'"id_linia"=\'{line_id}\'', QgsVectorLayer.SetSelection)
-        for line in linia_veina_table.getSelectedFeatures():
-            neighbor_lines.append(int(line['id_linia_veina']))
-
-        return neighbor_lines
-
     def remove_lines_layer(self):
         """ Remove the municipality's boundary lines from the database's layer """
         # Remove boundary lines
@@ -374,24 +372,6 @@ class EliminadorMMC:
 
         return neighbor_municipality_id
 
-    def get_neighbors_municipalities(self, line_id):
-        """
-        Get the IDs of both municipalities than share a boundary line
-
-        :param line_id: ID of the line
-        :type line_id: str
-
-        :return neighbor_municipality_1_id: ID of the first neighbor municipality
-        :rtype: neighbor_municipality_1_id: str
-
-        :return neighbor_municipality_2_id: ID of the second neighbor municipality
-        :rtype: neighbor_municipality_2_id: str
-        """
-        line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
-        neighbor_municipality_1_id, neighbor_municipality_2_id = line_data['CODIMUNI1'][0], line_data['CODIMUNI2'][0]
-
-        return neighbor_municipality_1_id, neighbor_municipality_2_id
-
     def get_neighbor_ine(self, line_id):
         """
         Get the INE ID of the neighbor municipality
@@ -407,25 +387,6 @@ class EliminadorMMC:
 
         return neighbor_municipality_codi_ine
 
-    def get_neighbors_ine(self, line_id):
-        """
-        Get the INE IDs of both municipalities than share a boundary line
-
-        :param line_id: ID of the line
-        :type line_id: str
-
-        :return neighbor_municipality_1_codi_ine: INE ID of the first neighbor municipality
-        :rtype: neighbor_municipality_1_codi_ine: str
-
-        :return neighbor_municipality_2_codi_ine: INE ID of the second neighbor municipality
-        :rtype: neighbor_municipality_2_codi_ine: str
-        """
-        neighbor_municipality_1_id, neighbor_municipality_2_id = self.get_neighbors_municipalities(line_id)
-        neighbor_municipality_1_codi_ine = self.get_municipality_codi_ine(neighbor_municipality_1_id)
-        neighbor_municipality_2_codi_ine = self.get_municipality_codi_ine(neighbor_municipality_2_id)
-
-        return neighbor_municipality_1_codi_ine, neighbor_municipality_2_codi_ine
-
     def get_neighbor_dates(self, neighbor_ine):
         """
         Get the Data Alta and Valid De dates of the neighbor municipality
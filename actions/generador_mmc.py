@@ -12,7 +12,6 @@ and generates the metadata of a municipal map.
 import numpy as np
 import os
 import shutil
-import xml.etree.ElementTree as ET
 
 from qgis.core import (QgsVectorLayer,
                        QgsDataSourceUri,
@@ -23,7 +22,6 @@ from qgis.core import (QgsVectorLayer,
                        QgsField,
                        QgsCoordinateTransform,
                        QgsFeature,
-                       QgsGeometry,
                        QgsProject)
 from qgis.core.additions.edit import edit
 from PyQt5.QtWidgets import QMessageBox
@@ -32,11 +30,24 @@ from PyQt5.QtWidgets import QMessageBox
 from ..config import *
 from ..utils import *
 from .adt_postgis_connection import PgADTConnection
+from .layer_staging import LayerStaging
+from .line_documents import LineDocuments
+from .metadata_template import get_metadata_template
+from .workspace import Workspace
 
 
 # TODO comment correctly
 
 
+# Placeholders of the metadata template replaced by plain text, and the ones replaced by XML blocks
+METADATA_TEXT_PLACEHOLDERS = ('id_xml', 'info_dades_titol', 'creacio_data', 'info_dades_data', 'info_dades_clau_lloc',
+                              'info_dades_descripcio', 'font', 'verEspSHP', 'cita_data', 'nomInstitut',
+                              'nomDepartament', 'long_limit_W', 'long_limit_E', 'long_limit_N', 'long_limit_S',
+                              'qualitat_data_1', 'qualitat_data_2', 'qualitat_data_3', 'qualitat_data_4',
+                              'qualitat_data_5', 'f_dogc')
+METADATA_FRAGMENT_PLACEHOLDERS = ('dates_acth', 'dates_rep', 'dates_dogc', 'dates_rec', 'dates_mtt')
+
+
 class GeneradorMMC(object):
     """ MMC Generation class """
 
@@ -151,7 +162,7 @@ class GeneradorMMC(object):
         :rtype: tuple
         """
         line_list = []
-        for line in lines_layer.getFeatures():
+        for line in get_features_attributes(lines_layer, ['id_linia']):
             line_id = line['id_linia']
             line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
             if line_data['LIMCOSTA'] == 'N':
@@ -170,7 +181,7 @@ class GeneradorMMC(object):
         :rtype: str
         """
         coast_line_id = ''
-        for line in lines_layer.getFeatures():
+        for line in get_features_attributes(lines_layer, ['id_linia']):
             line_id = line['id_linia']
             line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
             if line_data['LIMCOSTA'] == 'S':
@@ -190,11 +201,11 @@ class GeneradorMMC(object):
         :rtype: dict
         """
         dict_valid_de = {}
-        mtt_table = self.pg_adt.get_table('memoria_treb_top')
-        for line in lines_layer.getFeatures():
+        mtt_table = self.pg_adt.get_cached_table('memoria_treb_top')
+        for line in get_features_attributes(lines_layer, ['id_linia']):
             line_id = line['id_linia']
             mtt_table.selectByExpression(f'"id_linia"=\'{line_id}\' and "vig_mtt" is True', QgsVectorLayer.SetSelection)
-            for feature in mtt_table.getSelectedFeatures():
+            for feature in mtt_table.getSelectedFeatures(get_attributes_request(mtt_table, ['data_cdt'])):
                 line_cdt = feature['data_cdt']
                 line_cdt_str = line_cdt.toString('yyyyMMdd')
                 dict_valid_de[line_id] = line_cdt_str
@@ -208,7 +219,7 @@ class GeneradorMMC(object):
         :return: municipality_cdt_str: Date of the Valid De from the CDT date
         :rtype: str
         """
-        mapa_muni_table = self.pg_adt.get_table('mapa_muni_icc')
+        mapa_muni_table = self.pg_adt.get_cached_table('mapa_muni_icc')
         mapa_muni_table.selectByExpression(f'"codi_muni"=\'{self.municipality_codi_ine}\' and "vig_mm" is True',
                                            QgsVectorLayer.SetSelection)
         municipality_cdt_str = ''
@@ -308,27 +319,41 @@ class GeneradorMMCLayers(GeneradorMMC):
 
     def generate_mmc_layers(self):
         """ Main entry point. Here is where is done all the MMC layer and metadata generation """
-        # ########################
-        # SET DATA
-        # Copy data to work directory
-        self.copy_data_to_work()
-        # Set the layers paths
-        self.work_point_layer, self.work_line_layer, self.work_polygon_layer = self.set_layers_paths()
-
-        # ########################
-        # LAYERS GENERATION PROCESS
+        with Workspace(GENERADOR_WORK_DIR, f'generador-{self.municipality_id}-') as workspace:
+            # ########################
+            # LAYERS GENERATION PROCESS
+            self.generate_layers(workspace.path)
+
+            ##########################
+            # DATA EXPORTING
+            # Make the output directories if they don't exist
+            self.make_output_directories()
+            # Write the output report
+            self.write_report()
+            # Export the data to the output directory
+            self.export_data()
+
+    def generate_layers(self, work_dir):
+        """
+        Stage the input data and generate the MMC layers and tables
+
+        :param work_dir: Scratch directory of the run
+        :type work_dir: str
+        """
+        # Stage the input data
+        self.work_point_layer, self.work_line_layer, self.work_polygon_layer = self.stage_input_layers(work_dir)
         # Lines
         generador_mmc_lines = GeneradorMMCLines(self.municipality_id, self.data_alta, self.work_line_layer,
                                                 self.dict_valid_de, self.coast)
-        generador_mmc_lines.generate_lines_layer()   # Layer
+        self.work_line_layer = generador_mmc_lines.generate_lines_layer()   # Layer
         self.work_lines_table = generador_mmc_lines.generate_lines_table()   # Table
         # Fites
         generador_mmc_fites = GeneradorMMCFites(self.municipality_id, self.data_alta, self.work_point_layer,
                                                 self.dict_valid_de)
-        generador_mmc_fites.generate_fites_layer()
+        self.work_point_layer = generador_mmc_fites.generate_fites_layer()
         # Polygon
         self.generador_mmc_polygon = GeneradorMMCPolygon(self.municipality_id, self.data_alta, self.work_polygon_layer)
-        self.generador_mmc_polygon.generate_polygon_layer()
+        self.work_polygon_layer = self.generador_mmc_polygon.generate_polygon_layer()
         # Costa
         generador_mmc_costa = GeneradorMMCCosta(self.municipality_id, self.data_alta, self.work_line_layer,
                                                 self.dict_valid_de, self.coast)
@@ -336,42 +361,20 @@ class GeneradorMMCLayers(GeneradorMMC):
         self.work_coast_line_table = generador_mmc_costa.generate_coast_line_table()
         self.work_coast_line_full = generador_mmc_costa.generate_coast_full_bt5m_table()
 
-        ##########################
-        # DATA EXPORTING
-        # Make the output directories if they don't exist
-        self.make_output_directories()
-        # Write the output report
-        self.write_report()
-        # Export the data to the output directory
-        self.export_data()
-        # Remove redundant cpg files
-        self.remove_cpg_files()
-
-    def copy_data_to_work(self):
-        """ Import input data to the work directory """
-        # Set paths
-        input_points_layer = QgsVectorLayer(os.path.join(self.shapefiles_input_dir, 'MM_Fites.shp'))
-        input_lines_layer = QgsVectorLayer(os.path.join(self.shapefiles_input_dir, 'MM_Linies.shp'))
-        input_polygon_layer = QgsVectorLayer(os.path.join(self.shapefiles_input_dir, 'MM_Poligons.shp'))
-        # Export
-        QgsVectorFileWriter.writeAsVectorFormat(input_points_layer, os.path.join(GENERADOR_WORK_DIR, 'MM_Fites.shp'),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-        QgsVectorFileWriter.writeAsVectorFormat(input_lines_layer, os.path.join(GENERADOR_WORK_DIR, 'MM_Linies.shp'),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-        QgsVectorFileWriter.writeAsVectorFormat(input_polygon_layer, os.path.join(GENERADOR_WORK_DIR, 'MM_Poligons.shp'),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-
-    @staticmethod
-    def set_layers_paths():
+    def stage_input_layers(self, work_dir):
         """
-        Set the paths to the layers and directories to be managed
+        Stage the input points, lines and polygon layers, without re-encoding them
+
+        :param work_dir: Scratch directory of the run
+        :type work_dir: str
 
-        :return: Points, lines and polygon layers of the municipalitye
+        :return: Points, lines and polygon layers of the municipality
         :rtype: QgsVectorLayer
         """
-        points_layer = QgsVectorLayer(os.path.join(GENERADOR_WORK_DIR, 'MM_Fites.shp'))
-        lines_layer = QgsVectorLayer(os.path.join(GENERADOR_WORK_DIR, 'MM_Linies.shp'))
-        polygon_layer = QgsVectorLayer(os.path.join(GENERADOR_WORK_DIR, 'MM_Poligons.shp'))
+        layer_staging = LayerStaging(work_dir, self.crs)
+        points_layer = layer_staging.stage_shapefile(os.path.join(self.shapefiles_input_dir, 'MM_Fites.shp'))
+        lines_layer = layer_staging.stage_shapefile(os.path.join(self.shapefiles_input_dir, 'MM_Linies.shp'))
+        polygon_layer = layer_staging.stage_shapefile(os.path.join(self.shapefiles_input_dir, 'MM_Poligons.shp'))
 
         return points_layer, lines_layer, polygon_layer
 
@@ -438,10 +441,10 @@ class GeneradorMMCLayers(GeneradorMMC):
         output_points_layer = f'mapa-municipal-v1r0-{self.municipality_normalized_name}-fita-{self.municipality_valid_de}.shp'
         output_lines_layer = f'mapa-municipal-v1r0-{self.municipality_normalized_name}-liniaterme-{self.municipality_valid_de}.shp'
         output_polygon_layer = f'mapa-municipal-v1r0-{self.municipality_normalized_name}-poligon-{self.municipality_valid_de}.shp'
-        output_lines_table = f'mapa-municipal-v1r0-{self.municipality_normalized_name}-liniatermetaula-{self.municipality_valid_de}.shp'
+        output_lines_table = f'mapa-municipal-v1r0-{self.municipality_normalized_name}-liniatermetaula-{self.municipality_valid_de}.dbf'
         output_coast_line_layer = f'mapa-municipal-v1r0-{self.municipality_normalized_name}-liniacosta-{self.municipality_valid_de}.shp'
-        output_coast_line_table = f'mapa-municipal-v1r0-{self.municipality_normalized_name}-liniacostataula-{self.municipality_valid_de}.shp'
-        output_coast_line_full = f'mapa-municipal-v1r0-{self.municipality_normalized_name}-tallfullbt5m-{self.municipality_valid_de}.shp'
+        output_coast_line_table = f'mapa-municipal-v1r0-{self.municipality_normalized_name}-liniacostataula-{self.municipality_valid_de}.dbf'
+        output_coast_line_full = f'mapa-municipal-v1r0-{self.municipality_normalized_name}-tallfullbt5m-{self.municipality_valid_de}.dbf'
         # Export the data
         QgsVectorFileWriter.writeAsVectorFormat(self.work_point_layer, os.path.join(self.output_subdirectory_path, output_points_layer),
                                                 'utf-8', self.crs, 'ESRI Shapefile')
@@ -451,27 +454,12 @@ class GeneradorMMCLayers(GeneradorMMC):
         QgsVectorFileWriter.writeAsVectorFormat(self.work_polygon_layer,
                                                 os.path.join(self.output_subdirectory_path, output_polygon_layer),
                                                 'utf-8', self.crs, 'ESRI Shapefile')
-        QgsVectorFileWriter.writeAsVectorFormat(self.work_lines_table,
-                                                os.path.join(self.output_subdirectory_path, output_lines_table),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
+        export_attribute_table(self.work_lines_table, os.path.join(self.output_subdirectory_path, output_lines_table))
         QgsVectorFileWriter.writeAsVectorFormat(self.work_coast_line_layer,
                                                 os.path.join(self.output_subdirectory_path, output_coast_line_layer),
                                                 'utf-8', self.crs, 'ESRI Shapefile')
-        QgsVectorFileWriter.writeAsVectorFormat(self.work_coast_line_table,
-                                                os.path.join(self.output_subdirectory_path, output_coast_line_table),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-        QgsVectorFileWriter.writeAsVectorFormat(self.work_coast_line_full,
-                                                os.path.join(self.output_subdirectory_path, output_coast_line_full),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-
-    def remove_cpg_files(self):
-        """  """
-        output_files = os.listdir(self.output_subdirectory_path)
-        for file in output_files:
-            if 'taula' in file or 'tall' in file:
-                if file.endswith('.cpg'):
-                    file_path = os.path.join(self.output_subdirectory_path, file)
-                    os.remove(file_path)
+        export_attribute_table(self.work_coast_line_table, os.path.join(self.output_subdirectory_path, output_coast_line_table))
+        export_attribute_table(self.work_coast_line_full, os.path.join(self.output_subdirectory_path, output_coast_line_full))
 
 
 class GeneradorMMCFites(GeneradorMMCLayers):
@@ -497,30 +485,32 @@ class GeneradorMMCFites(GeneradorMMCLayers):
         :rtype: dict
         """
         GeneradorMMC.__init__(self, municipality_id, data_alta)
-        self.work_point_layer = fites_layer
+        self.input_point_layer = fites_layer
+        self.work_point_layer = None
         self.dict_valid_de = dict_valid_de
 
     def generate_fites_layer(self):
-        """ Main entry point """
-        self.delete_fields()
-        self.add_fields()
-        self.fill_fields()
-        self.delete_fields(True)
-
-    def delete_fields(self, remainder_fields=False):
-        """ Delete non necessary fields """
-        # List of indices of the fields to be deleted. The deleteAttributes method doesn't catch fields by name but
-        # by index instead
-        if remainder_fields:
-            delete_fields_list = list((0, 1))
-        else:
-            delete_fields_list = list((2, 3, 4, 5, 6, 7))
-        self.work_point_layer.dataProvider().deleteAttributes(delete_fields_list)
-        self.work_point_layer.updateFields()
+        """
+        Main entry point. Read the input points once and write them into a layer with the final MMC schema
 
-    def add_fields(self):
-        """ Add necessary fields """
-        # Set new fields
+        :return: work_point_layer: Points layer with the MMC schema
+        :rtype: QgsVectorLayer
+        """
+        self.work_point_layer = create_memory_layer('MM_Fites', self.input_point_layer.wkbType(), self.crs,
+                                                    self.get_fields())
+        self.work_point_layer.dataProvider().addFeatures(self.get_features(self.work_point_layer.fields()))
+        self.work_point_layer.updateExtents()
+
+        return self.work_point_layer
+
+    @staticmethod
+    def get_fields():
+        """
+        Get the fields of the MMC points layer
+
+        :return: List with the layer's fields
+        :rtype: list
+        """
         id_u_fita_field = QgsField(name='IdUfita', type=QVariant.String, typeName='text', len=10)
         id_fita_field = QgsField(name='IdFita', type=QVariant.String, typeName='text', len=18)
         id_sector_field = QgsField(name='IdSector', type=QVariant.String, typeName='text', len=1)
@@ -528,44 +518,59 @@ class GeneradorMMCFites(GeneradorMMCLayers):
         num_termes_field = QgsField(name='NumTermes', type=QVariant.String, typeName='text', len=3)
         monument_field = QgsField(name='Monument', type=QVariant.String, typeName='text', len=1)
         id_linia_field, valid_de_field, valid_a_field, data_alta_field, data_baixa_field = get_common_fields()
-        new_fields_list = [id_u_fita_field, id_fita_field, id_sector_field, id_fita_r_field, num_termes_field,
-                           monument_field, valid_de_field, valid_a_field, data_alta_field, data_baixa_field,
-                           id_linia_field]
-        self.work_point_layer.dataProvider().addAttributes(new_fields_list)
-        self.work_point_layer.updateFields()
 
-    def fill_fields(self):
-        """ Fill the layer's fields """
-        point_id_u_fita, point_id_fita, point_r_fita, point_sector, point_num_termes, point_monumentat = ('',) * 6
-        fita_mem_layer = self.pg_adt.get_layer('v_fita_mem', 'id_fita')
+        return [id_u_fita_field, id_fita_field, id_sector_field, id_fita_r_field, num_termes_field, monument_field,
+                valid_de_field, valid_a_field, data_alta_field, data_baixa_field, id_linia_field]
 
-        with edit(self.work_point_layer):
-            for point in self.work_point_layer.getFeatures():
-                point_id = point['id_punt']
-                fita_mem_layer.selectByExpression(f'"id_punt"=\'{point_id}\'', QgsVectorLayer.SetSelection)
-                for feature in fita_mem_layer.getSelectedFeatures():
-                    point_id_u_fita = feature['id_u_fita']
-                    point_id_fita = coordinates_to_id_fita(feature['point_x'], feature['point_y'])
-                    point_r_fita = point_num_to_text(feature['num_fita'])
-                    point_sector = feature['num_sector']
-                    point_num_termes = feature['num_termes']
-                    point_monumentat = feature['trobada']
-
-                point['IdUFita'] = point_id_u_fita[:-2]
-                point['IdFita'] = point_id_fita
-                point['IdFitaR'] = point_r_fita
-                point['IdSector'] = point_sector
-                point['NumTermes'] = point_num_termes
-                line_id_txt = line_id_2_txt(point['id_linia'])
-                point['IdLinia'] = line_id_txt
-                point['DataAlta'] = self.data_alta
-                point['ValidDe'] = self.dict_valid_de[point['id_linia']]
-                if point_monumentat:
-                    point['Monument'] = 'S'
-                else:
-                    point['Monument'] = 'N'
+    def get_features(self, fields):
+        """
+        Get the MMC points, with their fields filled, from the input points
 
-                self.work_point_layer.updateFeature(point)
+        :param fields: Fields of the MMC points layer
+        :type fields: QgsFields
+
+        :return: List with the MMC points
+        :rtype: list
+        """
+        point_id_u_fita, point_id_fita, point_r_fita, point_sector, point_num_termes, point_monumentat = ('',) * 6
+        input_points = list(self.input_point_layer.getFeatures())
+        # Get all the points' data with a single query
+        fita_mem_layer = self.pg_adt.get_layer('v_fita_mem', 'id_fita')
+        fita_mem_features = list(get_features_by_in_list(fita_mem_layer, 'id_punt',
+                                                         [point['id_punt'] for point in input_points]))
+        fita_mem_ids = coordinates_to_id_fita_array([feature['point_x'] for feature in fita_mem_features],
+                                                    [feature['point_y'] for feature in fita_mem_features])
+        fites_mem = {str(feature['id_punt']): (feature, id_fita)
+                     for feature, id_fita in zip(fita_mem_features, fita_mem_ids.tolist())}
+
+        features = []
+        for point in input_points:
+            feature, id_fita = fites_mem.get(str(point['id_punt']), (None, None))
+            if feature:
+                point_id_u_fita = feature['id_u_fita']
+                point_id_fita = id_fita
+                point_r_fita = point_num_to_text(feature['num_fita'])
+                point_sector = feature['num_sector']
+                point_num_termes = feature['num_termes']
+                point_monumentat = feature['trobada']
+
+            fita = QgsFeature(fields)
+            fita.setGeometry(point.geometry())
+            fita['IdUfita'] = point_id_u_fita[:-2]
+            fita['IdFita'] = point_id_fita
+            fita['IdFitaR'] = point_r_fita
+            fita['IdSector'] = point_sector
+            fita['NumTermes'] = point_num_termes
+            fita['IdLinia'] = line_id_2_txt(point['id_linia'])
+            fita['DataAlta'] = self.data_alta
+            fita['ValidDe'] = self.dict_valid_de[point['id_linia']]
+            if point_monumentat:
+                fita['Monument'] = 'S'
+            else:
+                fita['Monument'] = 'N'
+            features.append(fita)
+
+        return features
 
 
 class GeneradorMMCLines(GeneradorMMCLayers):
@@ -595,15 +600,25 @@ class GeneradorMMCLines(GeneradorMMCLayers):
         :type coast: bool
         """
         GeneradorMMC.__init__(self, municipality_id, data_alta, coast)
-        self.work_line_layer = lines_layer
-        self.temp_line_table = QgsVectorLayer('LineString', 'Line_table', 'memory')
+        self.input_line_layer = lines_layer
+        self.work_line_layer = None
+        self.temp_line_table = QgsVectorLayer('None', 'Line_table', 'memory')
         self.dict_valid_de = dict_valid_de
 
     def generate_lines_layer(self):
-        """ Main entry point for generating the lines layer """
-        self.add_fields('layer')
-        self.fill_fields_layer()
-        self.delete_fields()
+        """
+        Main entry point for generating the lines layer. Read the input lines once and write them into a layer with
+        the final MMC schema
+
+        :return: work_line_layer: Lines layer with the MMC schema
+        :rtype: QgsVectorLayer
+        """
+        self.work_line_layer = create_memory_layer('MM_Linies', self.input_line_layer.wkbType(), self.crs,
+                                                   self.get_fields())
+        self.work_line_layer.dataProvider().addFeatures(self.get_features(self.work_line_layer.fields()))
+        self.work_line_layer.updateExtents()
+
+        return self.work_line_layer
 
     def generate_lines_table(self):
         """
@@ -612,108 +627,98 @@ class GeneradorMMCLines(GeneradorMMCLayers):
         :return: lines_table: DBF attributes table of the lines layer
         :rtype: QgsVectorLayer
         """
-        self.add_fields('table')
+        self.add_table_fields()
         self.fill_fields_table()
-        self.export_table()
 
-        lines_table = QgsVectorLayer(os.path.join(GENERADOR_WORK_DIR, 'MM_LiniesTaula.dbf'))
-        return lines_table
+        return self.temp_line_table
 
-    def delete_fields(self):
-        """ Delete non necessary fields """
-        delete_fields_list = list((0, 1))
-        self.work_line_layer.dataProvider().deleteAttributes(delete_fields_list)
-        self.work_line_layer.updateFields()
+    @staticmethod
+    def get_fields():
+        """
+        Get the fields of the MMC lines layer
 
-    def add_fields(self, entity):
-        """ Add necessary fields """
-        # Set new fields
+        :return: List with the layer's fields
+        :rtype: list
+        """
         name_municipality_1_field = QgsField(name='NomTerme1', type=QVariant.String, typeName='text', len=100)
         name_municipality_2_field = QgsField(name='NomTerme2', type=QVariant.String, typeName='text', len=100)
         tipus_ua_field = QgsField(name='TipusUA', type=QVariant.String, typeName='text', len=17)
         limit_prov_field = QgsField(name='LimitProvi', type=QVariant.String, typeName='text', len=1)
         limit_vegue_field = QgsField(name='LimitVegue', type=QVariant.String, typeName='text', len=1)
         tipus_linia_field = QgsField(name='TipusLinia', type=QVariant.String, typeName='text', len=8)
-        codi_muni_field = QgsField(name='CodiMuni', type=QVariant.String, typeName='text', len=6)
         id_linia_field, valid_de_field, valid_a_field, data_alta_field, data_baixa_field = get_common_fields()
 
-        if entity == 'layer':
-            new_fields_list = [id_linia_field, name_municipality_1_field, name_municipality_2_field, tipus_ua_field, limit_prov_field,
-                               limit_vegue_field, tipus_linia_field, valid_de_field, valid_a_field, data_alta_field,
-                               data_baixa_field]
-            self.work_line_layer.dataProvider().addAttributes(new_fields_list)
-            self.work_line_layer.updateFields()
-        elif entity == 'table':
-            new_fields_list = [id_linia_field, codi_muni_field]
-            self.temp_line_table.dataProvider().addAttributes(new_fields_list)
-            self.temp_line_table.updateFields()
-
-    def fill_fields_layer(self):
-        """ Fill the layer's new fields with necessary data """
-        with edit(self.work_line_layer):
-            for line in self.work_line_layer.getFeatures():
-                line_id = line['id_linia']
-                line_id_txt = line_id_2_txt(line_id)
-                line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
-                # Get the Tipus UA type
-                tipus_ua = line_data['TIPUSUA'][0]
-                if tipus_ua == 'M':
-                    line['TipusUA'] = 'Municipi'
-                elif tipus_ua == 'C':
-                    line['TipusUA'] = 'Comarca'
-                elif tipus_ua == 'A':
-                    line['TipusUA'] = 'Comunitat Autònoma'
-                elif tipus_ua == 'E':
-                    line['TipusUA'] = 'Estat'
-                elif tipus_ua == 'I':
-                    line['TipusUA'] = 'Inframunicipal'
-                # Get the Limit Vegue type
-                limit_vegue = line_data['LIMVEGUE'][0]
-                if limit_vegue == 'verdadero':
-                    line['LimitVegue'] = 'S'
-                else:
-                    line['LimitVegue'] = 'N'
-                # Get the tipus Linia type
-                tipus_linia = line_data['TIPUSREG']
-                if tipus_linia == 'internes':
-                    line['TipusLinia'] = 'MMC'
-                else:
-                    line['TipusLinia'] = 'Exterior'
-                # Non dependant fields
-                line['IdLinia'] = line_id_txt
-                line['NomTerme1'] = str(line_data['NOMMUNI1'][0])
-                line['NomTerme2'] = str(line_data['NOMMUNI2'][0])
-                line['LimitProvi'] = str(line_data['LIMPROV'][0])
-                line['ValidDe'] = self.dict_valid_de[line['id_linia']]
-                line['DataAlta'] = self.data_alta
+        return [id_linia_field, name_municipality_1_field, name_municipality_2_field, tipus_ua_field, limit_prov_field,
+                limit_vegue_field, tipus_linia_field, valid_de_field, valid_a_field, data_alta_field,
+                data_baixa_field]
 
-                self.work_line_layer.updateFeature(line)
+    def add_table_fields(self):
+        """ Add the necessary fields to the lines table """
+        codi_muni_field = QgsField(name='CodiMuni', type=QVariant.String, typeName='text', len=6)
+        id_linia_field = get_common_fields()[0]
+        self.temp_line_table.dataProvider().addAttributes([id_linia_field, codi_muni_field])
+        self.temp_line_table.updateFields()
+
+    def get_features(self, fields):
+        """
+        Get the MMC lines, with their fields filled, from the input lines
+
+        :param fields: Fields of the MMC lines layer
+        :type fields: QgsFields
+
+        :return: List with the MMC lines
+        :rtype: list
+        """
+        features = []
+        for input_line in self.input_line_layer.getFeatures():
+            line_id = input_line['id_linia']
+            line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
+            line = QgsFeature(fields)
+            line.setGeometry(input_line.geometry())
+            # Get the Tipus UA type
+            tipus_ua = line_data['TIPUSUA'][0]
+            if tipus_ua == 'M':
+                line['TipusUA'] = 'Municipi'
+            elif tipus_ua == 'C':
+                line['TipusUA'] = 'Comarca'
+            elif tipus_ua == 'A':
+                line['TipusUA'] = 'Comunitat Autònoma'
+            elif tipus_ua == 'E':
+                line['TipusUA'] = 'Estat'
+            elif tipus_ua == 'I':
+                line['TipusUA'] = 'Inframunicipal'
+            # Get the Limit Vegue type
+            limit_vegue = line_data['LIMVEGUE'][0]
+            if limit_vegue == 'verdadero':
+                line['LimitVegue'] = 'S'
+            else:
+                line['LimitVegue'] = 'N'
+            # Get the tipus Linia type
+            tipus_linia = line_data['TIPUSREG']
+            if tipus_linia == 'internes':
+                line['TipusLinia'] = 'MMC'
+            else:
+                line['TipusLinia'] = 'Exterior'
+            # Non dependant fields
+            line['IdLinia'] = line_id_2_txt(line_id)
+            line['NomTerme1'] = str(line_data['NOMMUNI1'][0])
+            line['NomTerme2'] = str(line_data['NOMMUNI2'][0])
+            line['LimitProvi'] = str(line_data['LIMPROV'][0])
+            line['ValidDe'] = self.dict_valid_de[line_id]
+            line['DataAlta'] = self.data_alta
+            features.append(line)
+
+        return features
 
     def fill_fields_table(self):
         """ Fill the table's new fields with the necessary data """
         with edit(self.temp_line_table):
-            for line in self.work_line_layer.getFeatures():
+            for line in get_features_attributes(self.work_line_layer, ['IdLinia']):
                 line_id = line['IdLinia']
                 feature = QgsFeature()
-                feature.setGeometry(QgsGeometry.fromWkt('LineString()'))
                 feature.setAttributes([line_id, self.municipality_codi_ine])
                 self.temp_line_table.dataProvider().addFeatures([feature])
 
-    def export_table(self):
-        """
-        Export the lines table as a dbf file.
-
-        PyQGIS is not able to manage and export a standalone DBF file, so the working way is exporting the table as shapefile
-        and then deleting all the associated files except the DBF one.
-        """
-        # Export the shapefile
-        QgsVectorFileWriter.writeAsVectorFormat(self.temp_line_table,
-                                                os.path.join(GENERADOR_WORK_DIR, 'MM_LiniesTaula.shp'),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-        #  Delete the useless files
-        for rm_format in ('.shp', '.shx', '.prj', '.cpg'):
-            os.remove(os.path.join(GENERADOR_WORK_DIR, f'MM_LiniesTaula{rm_format}'))
-
 
 class GeneradorMMCPolygon(GeneradorMMCLayers):
 
@@ -734,41 +739,66 @@ class GeneradorMMCPolygon(GeneradorMMCLayers):
         :type polygon_layer: QgsVectorLayer
         """
         GeneradorMMC.__init__(self, municipality_id, data_alta)
+        self.input_polygon_layer = polygon_layer
         self.work_polygon_layer = polygon_layer
 
     def generate_polygon_layer(self):
-        """ Main entry point """
-        self.add_fields()
-        self.fill_fields()
-        self.delete_fields()
+        """
+        Main entry point. Read the input polygon once and write it into a layer with the final MMC schema
 
-    def delete_fields(self):
-        """ Delete non necessary fields """
-        self.work_polygon_layer.dataProvider().deleteAttributes([0])
-        self.work_polygon_layer.updateFields()
+        :return: work_polygon_layer: Polygon layer with the MMC schema
+        :rtype: QgsVectorLayer
+        """
+        self.work_polygon_layer = create_memory_layer('MM_Poligons', self.input_polygon_layer.wkbType(), self.crs,
+                                                      self.get_fields())
+        self.work_polygon_layer.dataProvider().addFeatures(self.get_features(self.work_polygon_layer.fields()))
+        self.work_polygon_layer.updateExtents()
+        # Release the input layer, so its staged files can be removed
+        self.input_polygon_layer = None
 
-    def add_fields(self):
-        """ Add necessary fields """
-        # Set new fields
+        return self.work_polygon_layer
+
+    def get_fields(self):
+        """
+        Get the fields of the MMC polygon layer, which are the input fields but the first one plus the new ones
+
+        :return: List with the layer's fields
+        :rtype: list
+        """
+        input_fields = [field for field in self.input_polygon_layer.fields()][1:]
         codi_muni_field = QgsField(name='CodiMuni', type=QVariant.String, typeName='text', len=6)
         area_muni_field = QgsField(name='AreaMunMMC', type=QVariant.String, typeName='text', len=8)
         name_muni_field = QgsField(name='NomMuni', type=QVariant.String, typeName='text', len=100)
         id_linia_field, valid_de_field, valid_a_field, data_alta_field, data_baixa_field = get_common_fields()
-        new_fields_list = [codi_muni_field, area_muni_field, name_muni_field, valid_de_field, valid_a_field,
-                           data_alta_field, data_baixa_field]
-        self.work_polygon_layer.dataProvider().addAttributes(new_fields_list)
-        self.work_polygon_layer.updateFields()
 
-    def fill_fields(self):
-        """ Fill the new fields with the necessary data """
-        with edit(self.work_polygon_layer):
-            for polygon in self.work_polygon_layer.getFeatures():
-                polygon['CodiMuni'] = self.municipality_codi_ine
-                polygon['AreaMunMMC'] = polygon['Sup_CDT']
-                polygon['NomMuni'] = str(self.municipality_name)
-                polygon['ValidDe'] = self.municipality_valid_de
-                polygon['DataAlta'] = self.data_alta
-                self.work_polygon_layer.updateFeature(polygon)
+        return input_fields + [codi_muni_field, area_muni_field, name_muni_field, valid_de_field, valid_a_field,
+                               data_alta_field, data_baixa_field]
+
+    def get_features(self, fields):
+        """
+        Get the MMC polygons, with their fields filled, from the input polygons
+
+        :param fields: Fields of the MMC polygon layer
+        :type fields: QgsFields
+
+        :return: List with the MMC polygons
+        :rtype: list
+        """
+        input_field_names = self.input_polygon_layer.fields().names()[1:]
+        features = []
+        for input_polygon in self.input_polygon_layer.getFeatures():
+            polygon = QgsFeature(fields)
+            polygon.setGeometry(input_polygon.geometry())
+            for field_name in input_field_names:
+                polygon[field_name] = input_polygon[field_name]
+            polygon['CodiMuni'] = self.municipality_codi_ine
+            polygon['AreaMunMMC'] = input_polygon['Sup_CDT']
+            polygon['NomMuni'] = str(self.municipality_name)
+            polygon['ValidDe'] = self.municipality_valid_de
+            polygon['DataAlta'] = self.data_alta
+            features.append(polygon)
+
+        return features
 
     def return_superficie_cdt(self):
         """
@@ -778,7 +808,7 @@ class GeneradorMMCPolygon(GeneradorMMCLayers):
         :rtype: str
         """
         superficie_cdt = ''
-        for polygon in self.work_polygon_layer.getFeatures():
+        for polygon in get_features_attributes(self.work_polygon_layer, ['AreaMunMMC']):
             superficie_cdt = polygon['AreaMunMMC']
 
         return superficie_cdt
@@ -835,8 +865,8 @@ class GeneradorMMCCosta(GeneradorMMCLayers):
         self.work_lines_layer = lines_layer
         # Es important indicar el crs al crear la capa, si no la geometria no es veu correctament
         self.temp_coast_line_layer = QgsVectorLayer('LineString?crs=epsg:25831', 'Coast_line', 'memory')
-        self.temp_coast_line_table = QgsVectorLayer('LineString', 'Coast_line_table', 'memory')
-        self.temp_coast_full_table = QgsVectorLayer('LineString', 'Coast_full_table', 'memory')
+        self.temp_coast_line_table = QgsVectorLayer('None', 'Coast_line_table', 'memory')
+        self.temp_coast_full_table = QgsVectorLayer('None', 'Coast_full_table', 'memory')
         self.dict_valid_de = dict_valid_de
 
     def generate_coast_line_layer(self):
@@ -849,10 +879,8 @@ class GeneradorMMCCosta(GeneradorMMCLayers):
         self.add_fields('layer')
         if self.coast:
             self.export_coast_line_layer()
-        self.export_layer()
 
-        coast_line_layer = QgsVectorLayer(os.path.join(GENERADOR_WORK_DIR, 'MM_LiniaCosta.shp'))
-        return coast_line_layer
+        return self.temp_coast_line_layer
 
     def generate_coast_line_table(self):
         """
@@ -864,10 +892,8 @@ class GeneradorMMCCosta(GeneradorMMCLayers):
         self.add_fields('table')
         if self.coast:
             self.fill_fields_table()
-        self.export_table('table')
 
-        coast_line_table = QgsVectorLayer(os.path.join(GENERADOR_WORK_DIR, 'MM_LiniaCostaTaula.dbf'))
-        return coast_line_table
+        return self.temp_coast_line_table
 
     def generate_coast_full_bt5m_table(self):
         """
@@ -879,10 +905,8 @@ class GeneradorMMCCosta(GeneradorMMCLayers):
         self.add_fields('full')
         if self.coast:
             self.fill_fields_full_table()
-        self.export_table('full')
 
-        coast_line_full = QgsVectorLayer(os.path.join(GENERADOR_WORK_DIR, 'MM_FullBT5MCosta.dbf'))
-        return coast_line_full
+        return self.temp_coast_full_table
 
     def add_fields(self, entity):
         """ Add the necessary fields to the selected layer """
@@ -932,10 +956,9 @@ class GeneradorMMCCosta(GeneradorMMCLayers):
     def fill_fields_table(self):
         """ FIll the table's fields with the necessary data """
         with edit(self.temp_coast_line_table):
-            for line in self.temp_coast_line_layer.getFeatures():
+            for line in get_features_attributes(self.temp_coast_line_layer, ['IdLinia']):
                 line_id = line['IdLinia']
                 feature = QgsFeature()
-                feature.setGeometry(QgsGeometry.fromWkt('LineString()'))
                 feature.setAttributes([line_id, self.municipality_codi_ine])
                 self.temp_coast_line_table.dataProvider().addFeatures([feature])
 
@@ -951,40 +974,9 @@ class GeneradorMMCCosta(GeneradorMMCLayers):
                 revisio = full[-3:-1]
                 correccio = full[-1]
                 feature = QgsFeature()
-                feature.setGeometry(QgsGeometry.fromWkt('LineString()'))
                 feature.setAttributes([id_full, versio, revisio, correccio, self.coast_line_id])
                 self.temp_coast_full_table.dataProvider().addFeatures([feature])
 
-    def export_layer(self):
-        """ Export the coast line layer """
-        QgsVectorFileWriter.writeAsVectorFormat(self.temp_coast_line_layer,
-                                                os.path.join(GENERADOR_WORK_DIR, 'MM_LiniaCosta.shp'),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-
-    def export_table(self, table_type):
-        """
-        Export the coast line table as a dbf file.
-
-        PyQGIS is not able to manage and export a standalone DBF file, so the working way is exporting the table as shapefile
-        and then deleting all the associated files except the DBF one.
-
-        :param table_type: indicates whic table to export
-        :type table_type: str
-        """
-        if table_type == 'table':
-            table_name = 'MM_LiniaCostaTaula'
-            table = self.temp_coast_line_table
-        elif table_type == 'full':
-            table_name = 'MM_FullBT5MCosta'
-            table = self.temp_coast_full_table
-        # Export the shapefile
-        QgsVectorFileWriter.writeAsVectorFormat(table,
-                                                os.path.join(GENERADOR_WORK_DIR, f'{table_name}.shp'),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-        #  Delete the useless files
-        for rm_format in ('.shp', '.shx', '.prj', '.cpg'):
-            os.remove(os.path.join(GENERADOR_WORK_DIR, f'{table_name}{rm_format}'))
-
 
 class GeneradorMMCChecker(GeneradorMMC):
     def __init__(self, municipality_id):
@@ -1011,7 +1003,7 @@ class GeneradorMMCChecker(GeneradorMMC):
 
     def check_mm_exists(self):
         """ Check if the input municipality exists as a Municipal Map into the database """
-        mapa_muni_table = self.pg_adt.get_table('mapa_muni_icc')
+        mapa_muni_table = self.pg_adt.get_cached_table('mapa_muni_icc')
         mapa_muni_table.selectByExpression(f'"codi_muni"=\'{self.municipality_codi_ine}\' and "vig_mm" is True',
                                            QgsVectorLayer.SetSelection)
         count = mapa_muni_table.selectedFeatureCount()
@@ -1077,9 +1069,10 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
 
     def __init__(self, municipality_id, data_alta):
         GeneradorMMC.__init__(self, municipality_id, data_alta)
+        self.line_documents = LineDocuments(self.pg_adt)
         if self.municipality_metadata_table:
             os.remove(self.metadata_table_path)
-        self.municipality_metadata_table = QgsVectorLayer('LineString', 'Metadata_table', 'memory')
+        self.municipality_metadata_table = QgsVectorLayer('None', 'Metadata_table', 'memory')
 
     def generate_metadata_table(self):
         """ Main entry point for generating the metadata table """
@@ -1130,6 +1123,7 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
 
     def fill_fields(self):
         """ Fill the new metadata fields with the necessary data """
+        self.line_documents.fetch(self.municipality_lines)
         with edit(self.municipality_metadata_table):
             for line_id in self.municipality_lines:
                 nom_muni1 = self.municipalities_names_lines[line_id][0]
@@ -1153,7 +1147,6 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
                 mtt_data, mtt_abast, mtt_vig = self.get_mtt_data(line_id)
                 # Add the feature
                 feature = QgsFeature()
-                feature.setGeometry(QgsGeometry.fromWkt('LineString()'))
                 feature.setAttributes([str(line_id), str(nom_muni1), str(nom_muni2), str(tipus_ua), str(tipus_reg),
                                        str(lim_prov), codi_muni1, codi_muni2, acta_h_date, acta_h_id, rep_date, rep_tip,
                                        rep_abast, rep_org, rep_fi, dogc_date, dogc_pub_date, dogc_tipus, dogc_tit, dogc_esm,
@@ -1240,11 +1233,9 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
     def get_dogc_data(self, line_id):
         """ Get the line's DOGC data """
         dogc_date, dogc_pub_date, dogc_tit, dogc_tipus, dogc_esm, dogc_vig = ('',) * 6
-        dogc_table = self.pg_adt.get_table('pa_pub_dogc')
-        dogc_table.selectByExpression(f'"id_linia"=\'{line_id}\' and "vig_pub_dogc" is True',
-                                      QgsVectorLayer.SetSelection)
-        if dogc_table.selectedFeatureCount() == 1:
-            for feature in dogc_table.getSelectedFeatures():
+        dogc_list = self.line_documents.get_dogc(line_id)
+        if len(dogc_list) == 1:
+            for feature in dogc_list:
                 dogc_date = feature['data_doc'].toString('yyyyMMdd')
                 dogc_pub_date = feature['data_pub_dogc'].toString('yyyyMMdd')
                 dogc_tit = feature['tit_pub_dogc']
@@ -1257,7 +1248,7 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
                     dogc_vig = '1'
                 else:
                     dogc_vig = '0'
-        elif dogc_table.selectedFeatureCount() > 1:
+        elif len(dogc_list) > 1:
             box = QMessageBox()
             box.setIcon(QMessageBox.Warning)
             box.setText(f"La linia {line_id} té més d'un DOGC vigent. Si us plau, "
@@ -1266,11 +1257,11 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
             # Si hi ha més d'un DOGC vigent, fer una llista amb les dates d'aquelles publicacions que no siguin
             # correccions d'errades o alteracions i agafar la data del DOGC més nou
             date_list = []
-            for feature in dogc_table.getSelectedFeatures():
+            for feature in dogc_list:
                 if feature['tip_pub_dogc'] != 2 and 'alteració' not in feature['obs_pub_dogc']:
                     date_list.append(feature['data_pub_dogc'].toString('yyyyMMdd'))
             newest = max(date_list)
-            for feature in dogc_table.getSelectedFeatures():
+            for feature in dogc_list:
                 if feature['data_pub_dogc'] == newest:
                     dogc_date = feature['data_doc'].toString('yyyyMMdd')
                     dogc_pub_date = newest
@@ -1291,11 +1282,9 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
     def get_rec_data(self, line_id):
         """ Get the line's reconeixement data """
         rec_data, rec_tipus, rec_vig, rec_vig_aterm = ('',) * 4
-        rec_table = self.pg_adt.get_table('reconeixement')
-        rec_table.selectByExpression(f'"id_linia"=\'{line_id}\' and "vig_act_rec" is True',
-                                     QgsVectorLayer.SetSelection)
-        if rec_table.selectedFeatureCount() == 1:
-            for feature in rec_table.getSelectedFeatures():
+        rec_list = self.line_documents.get_rec(line_id)
+        if len(rec_list) == 1:
+            for feature in rec_list:
                 rec_data = feature['data_act_rec'].toString('yyyyMMdd')
                 if feature['act_aterm'] is True:
                     rec_tipus = 'ATERMENAMENT'
@@ -1311,17 +1300,17 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
                     rec_vig_aterm = '1'
                 else:
                     rec_vig_aterm = '0'
-        elif rec_table.selectedFeatureCount() > 1:
+        elif len(rec_list) > 1:
             box = QMessageBox()
             box.setIcon(QMessageBox.Warning)
             box.setText(f"La linia {line_id} té més d'una Acta de reconeixement vigent. Si us plau, "
                         f"revisa la data a la taula de metadades.")
             box.exec_()
             date_list = []
-            for feature in rec_table.getSelectedFeatures():
+            for feature in rec_list:
                 date_list.append(feature['data_act_rec'].toString('yyyyMMdd'))
             newest = max(date_list)
-            for feature in rec_table.getSelectedFeatures():
+            for feature in rec_list:
                 if feature['data_act_rec'] == newest:
                     rec_data = newest
                     if feature['act_aterm'] is True:
@@ -1345,23 +1334,21 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
     def get_mtt_data(self, line_id):
         """ Get the line's MTT data """
         mtt_data, mtt_abast, mtt_vig = ('',) * 3
-        mtt_table = self.pg_adt.get_table('memoria_treb_top')
-        mtt_table.selectByExpression(f'"id_linia"=\'{line_id}\' and "vig_mtt" is True',
-                                     QgsVectorLayer.SetSelection)
-        if mtt_table.selectedFeatureCount() == 1:
-            for feature in mtt_table.getSelectedFeatures():
+        mtt_list = self.line_documents.get_mtt(line_id)
+        if len(mtt_list) == 1:
+            for feature in mtt_list:
                 mtt_data = feature['data_doc'].toString('yyyyMMdd')
                 mtt_abast = feature['abast_mtt']
                 if feature['vig_mtt'] is True:
                     mtt_vig = '1'
                 else:
                     mtt_vig = '0'
-        elif mtt_table.selectedFeatureCount() > 1:
+        elif len(mtt_list) > 1:
             date_list = []
-            for feature in mtt_table.getSelectedFeatures():
+            for feature in mtt_list:
                 date_list.append(feature['data_doc'].toString('yyyyMMdd'))
             newest = max(date_list)
-            for feature in mtt_table.getSelectedFeatures():
+            for feature in mtt_list:
                 if feature['data'] == newest:
                     mtt_data = newest
                     mtt_abast = feature['abast_mtt']
@@ -1375,20 +1362,15 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
 
     def export_table(self):
         """ Export the metadata table """
-        # Export the shapefile
-        QgsVectorFileWriter.writeAsVectorFormat(self.municipality_metadata_table,
-                                                os.path.join(GENERADOR_TAULES_ESPEC, f'{self.metadata_table_name}.shp'),
-                                                'utf-8', self.crs, 'ESRI Shapefile')
-        #  Delete the useless files
-        for rm_format in ('.shp', '.shx', '.prj', '.cpg'):
-            os.remove(os.path.join(GENERADOR_TAULES_ESPEC, f'{self.metadata_table_name}{rm_format}'))
+        export_attribute_table(self.municipality_metadata_table,
+                               os.path.join(GENERADOR_TAULES_ESPEC, f'{self.metadata_table_name}.dbf'))
 
 
 class GeneradorMMCMetadata(GeneradorMMC):
 
     def __init__(self, municipality_id, data_alta, coast=False):
         GeneradorMMC.__init__(self, municipality_id, data_alta, coast)
-        self.work_metadatata_file = os.path.join(GENERADOR_WORK_DIR, 'MM_Metadades.xml')
+        self.line_documents = LineDocuments(self.pg_adt)
         self.output_metadata_name = f'mapa-municipal-{self.municipality_normalized_name}-ca-{self.municipality_valid_de}.xml'
         self.output_metadata_path = os.path.join(self.output_subdirectory_path, self.output_metadata_name)
         self.conv_valid_de = self.convert_date(self.municipality_valid_de)
@@ -1414,54 +1396,44 @@ class GeneradorMMCMetadata(GeneradorMMC):
 
     def generate_metadata_file(self):
         """ Main entry point for generating the metadata file """
-        shutil.copyfile(GENERADOR_METADATA_TEMPLATE, self.work_metadatata_file)
-
-        # Open as xml file to replace values inside xml blocks that already exists
-        with open(self.work_metadatata_file, encoding='utf-8') as f:
-            tree = ET.parse(f)
-            root = tree.getroot()
-
-            for elem in root.iter():
-                try:
-                    elem.text = elem.text.replace('id_xml', f'limits-municipals-v1r0-{self.municipality_codi_ine}-{self.municipality_valid_de}')
-                    elem.text = elem.text.replace('info_dades_titol', f'Mapa Municipal {self.municipality_nomens}')
-                    elem.text = elem.text.replace('creacio_data', self.conv_data_alta)
-                    elem.text = elem.text.replace('info_dades_data', self.conv_valid_de)
-                    elem.text = elem.text.replace('info_dades_clau_lloc', self.municipality_name)
-                    elem.text = elem.text.replace('info_dades_descripcio', f'Terme municipal {self.municipality_nomens}')
-                    elem.text = elem.text.replace('font', self.pairs)
-                    elem.text = elem.text.replace('verEspSHP', v_esp_shp)
-                    elem.text = elem.text.replace('cita_data', data_esp_shp)
-                    elem.text = elem.text.replace('nomInstitut', nom_institut)
-                    elem.text = elem.text.replace('nomDepartament', nom_departament)
-                    elem.text = elem.text.replace('long_limit_W', str(self.x_min))
-                    elem.text = elem.text.replace('long_limit_E', str(self.x_max))
-                    elem.text = elem.text.replace('long_limit_N', str(self.y_max))
-                    elem.text = elem.text.replace('long_limit_S', str(self.y_min))
-                    elem.text = elem.text.replace('qualitat_data_1', f'{self.rep_quality_date}T00:00:00')
-                    elem.text = elem.text.replace('qualitat_data_2', f'{self.dogc_quality_date}T00:00:00')
-                    elem.text = elem.text.replace('qualitat_data_3', f'{self.rec_quality_date}T00:00:00')
-                    elem.text = elem.text.replace('qualitat_data_4', f'{self.mtt_quality_date}T00:00:00')
-                    elem.text = elem.text.replace('qualitat_data_5', self.conv_valid_de)
-                    elem.text = elem.text.replace('f_dogc', self.pub_dogc_text)
-                except AttributeError:
-                    pass
-
-        tree.write(self.output_metadata_path, encoding='utf-8')
-
-        # Open as a simple txt file to add the dates inside xml block that doesn't exist into the file
-        with open(self.output_metadata_path) as f:
-            xml_str = f.read()
-        xml_str = xml_str.replace('dates_acth', self.dates_actes_h_xml)
-        xml_str = xml_str.replace('dates_rep', self.dates_rep_xml)
-        xml_str = xml_str.replace('dates_dogc', self.dates_dogc_xml)
-        xml_str = xml_str.replace('dates_rec', self.dates_rec_xml)
-        xml_str = xml_str.replace('dates_mtt', self.dates_mtt_xml)
-
-        with open(self.output_metadata_path, "w") as f:
-            f.write(xml_str)
-
-        os.remove(self.work_metadatata_file)
+        template = get_metadata_template(GENERADOR_METADATA_TEMPLATE, METADATA_TEXT_PLACEHOLDERS,
+                                         METADATA_FRAGMENT_PLACEHOLDERS)
+        # Plain text values, that replace the placeholders inside the xml blocks that already exist
+        values = {
+            'id_xml': f'limits-municipals-v1r0-{self.municipality_codi_ine}-{self.municipality_valid_de}',
+            'info_dades_titol': f'Mapa Municipal {self.municipality_nomens}',
+            'creacio_data': self.conv_data_alta,
+            'info_dades_data': self.conv_valid_de,
+            'info_dades_clau_lloc': self.municipality_name,
+            'info_dades_descripcio': f'Terme municipal {self.municipality_nomens}',
+            'font': self.pairs,
+            'verEspSHP': v_esp_shp,
+            'cita_data': data_esp_shp,
+            'nomInstitut': nom_institut,
+            'nomDepartament': nom_departament,
+            'long_limit_W': str(self.x_min),
+            'long_limit_E': str(self.x_max),
+            'long_limit_N': str(self.y_max),
+            'long_limit_S': str(self.y_min),
+            'qualitat_data_1': f'{self.rep_quality_date}T00:00:00',
+            'qualitat_data_2': f'{self.dogc_quality_date}T00:00:00',
+            'qualitat_data_3': f'{self.rec_quality_date}T00:00:00',
+            'qualitat_data_4': f'{self.mtt_quality_date}T00:00:00',
+            'qualitat_data_5': self.conv_valid_de,
+            'f_dogc': self.pub_dogc_text
+        }
+        # XML blocks with the dates, that don't exist into the template
+        fragments = {
+            'dates_acth': self.dates_actes_h_xml,
+            'dates_rep': self.dates_rep_xml,
+            'dates_dogc': self.dates_dogc_xml,
+            'dates_rec': self.dates_rec_xml,
+            'dates_mtt': self.dates_mtt_xml
+        }
+
+        with open(self.output_metadata_path, 'w', encoding='utf-8') as f:
+            f.write(template.render(values, fragments))
+
         self.write_metadata_report()
 
     @staticmethod
@@ -1485,7 +1457,7 @@ class GeneradorMMCMetadata(GeneradorMMC):
 
     def get_bounding_box(self):
         """ Get the municipality's bounding box """
-        polygon_layer = QgsVectorLayer(os.path.join(GENERADOR_WORK_DIR, 'MM_Poligons.shp'))
+        polygon_layer = QgsVectorLayer(os.path.join(self.shapefiles_input_dir, 'MM_Poligons.shp'))
         generador_mmc_polygon = GeneradorMMCPolygon(self.municipality_id, self.data_alta, polygon_layer)
         x_min, x_max, y_min, y_max = generador_mmc_polygon.return_bounding_box()
 
@@ -1494,12 +1466,10 @@ class GeneradorMMCMetadata(GeneradorMMC):
     def get_line_rec_list(self):
         """ Get a list with all the reconeixements from the municipality's lines """
         rec_list = []
-        rec_table = self.pg_adt.get_table('reconeixement')
-        for feature in self.municipality_metadata_table.getFeatures():
-            line_id = feature['IdLinia']
-            rec_table.selectByExpression(f'"id_linia"=\'{line_id}\' and "vig_act_rec" is True',
-                                         QgsVectorLayer.SetSelection)
-            for rec in rec_table.getSelectedFeatures():
+        line_ids = get_field_values(self.municipality_metadata_table, 'IdLinia')
+        self.line_documents.fetch(line_ids)
+        for line_id in line_ids:
+            for rec in self.line_documents.get_rec(line_id):
                 if rec['tipus_doc_ref'] == 2:
                     rec_list.append(line_id)
 
@@ -1508,7 +1478,7 @@ class GeneradorMMCMetadata(GeneradorMMC):
     def get_rep_quality_date(self):
         """ Get the newest replantejament date """
         date_list = []
-        for feature in self.municipality_metadata_table.getFeatures():
+        for feature in get_features_attributes(self.municipality_metadata_table, ['TipusRep', 'DataRep']):
             if feature['TipusRep'] == 'REPLANTEJAMENT':
                 date_list.append(feature['DataRep'])
 
@@ -1518,9 +1488,7 @@ class GeneradorMMCMetadata(GeneradorMMC):
 
     def get_dogc_quality_date(self):
         """ Get the newest DOGC date """
-        date_list = []
-        for feature in self.municipality_metadata_table.getFeatures():
-            date_list.append(feature['DataPubDOG'])
+        date_list = get_field_values(self.municipality_metadata_table, 'DataPubDOG')
 
         max_date = max(date_list)
         max_date_conv = self.convert_date(max_date)
@@ -1528,9 +1496,7 @@ class GeneradorMMCMetadata(GeneradorMMC):
 
     def get_rec_quality_date(self):
         """ Get the newest reconeixement date """
-        date_list = []
-        for feature in self.municipality_metadata_table.getFeatures():
-            date_list.append(feature['DataActaRe'])
+        date_list = get_field_values(self.municipality_metadata_table, 'DataActaRe')
 
         max_date = max(date_list)
         max_date_conv = self.convert_date(max_date)
@@ -1538,9 +1504,7 @@ class GeneradorMMCMetadata(GeneradorMMC):
 
     def get_mtt_quality_date(self):
         """ Get the newest MTT date """
-        date_list = []
-        for feature in self.municipality_metadata_table.getFeatures():
-            date_list.append(feature['DataMTT'])
+        date_list = get_field_values(self.municipality_metadata_table, 'DataMTT')
 
         max_date = max(date_list)
         max_date_conv = self.convert_date(max_date)
@@ -1551,8 +1515,7 @@ class GeneradorMMCMetadata(GeneradorMMC):
         date_list = []
         xml_block_list = []
         # Get a list with all the dates
-        for feature in self.municipality_metadata_table.getFeatures():
-            data = feature[field_name]
+        for data in get_field_values(self.municipality_metadata_table, field_name):
             data_conv = self.convert_date(data)
             date_list.append(data_conv)
 
@@ -1571,7 +1534,7 @@ class GeneradorMMCMetadata(GeneradorMMC):
     def get_resolucions_edictes_dogc(self):
         """ Extract the title from a DOGC """
         pub_list = []
-        for feature in self.municipality_metadata_table.getFeatures():
+        for feature in get_features_attributes(self.municipality_metadata_table, ['TipusDOGC', 'TITDOGC']):
             if feature['TipusDOGC'] == 'EDICTE':
                 pub_title = feature['TipusDOGC'].split(',')[0]
                 pub_title = pub_title.replace('EDICTE', 'Edicte')
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the LayerStaging class is defined. The main function
+of this class is to stage the input layers of a process as editable work
+layers without re-encoding them: small inputs are loaded straight into
+memory layers and big shapefiles are copied byte by byte to the work
+directory.
+***************************************************************************/
+"""
+
+import os
+import shutil
+
+from qgis.core import (QgsVectorLayer,
+                       QgsFeatureRequest,
+                       QgsProject,
+                       QgsMessageLog,
+                       Qgis)
+
+# Maximum size, in bytes, of a shapefile staged as a memory layer. Bigger shapefiles are copied to the work directory
+STAGING_MEMORY_MAX_SIZE = 100 * 1024 * 1024
+# Extensions of the shapefile's sidecar files
+SHAPEFILE_EXTENSIONS = ('.shp', '.shx', '.dbf', '.prj', '.cpg', '.qpj', '.sbn', '.sbx', '.qix')
+
+
+class LayerStaging:
+    """ Input layers staging class """
+
+    def __init__(self, work_dir, crs, max_memory_size=STAGING_MEMORY_MAX_SIZE):
+        """
+        Constructor
+
+        :param work_dir: Directory where the shapefiles that need a disk copy are copied
+        :type work_dir: str
+
+        :param crs: CRS of the staged layers
+        :type crs: QgsCoordinateReferenceSystem
+
+        :param max_memory_size: Maximum size, in bytes, of a shapefile staged as a memory layer
+        :type max_memory_size: int
+        """
+        self.work_dir = work_dir
+        self.crs = crs
+        self.max_memory_size = max_memory_size
+
+    def stage_shapefile(self, shapefile_path):
+        """
+        Stage a shapefile. It's loaded into a memory layer, reprojected if needed, unless it's bigger than the size
+        threshold and already has the staging CRS, in which case its files are copied to the work directory
+
+        :param shapefile_path: Path to the input shapefile
+        :type shapefile_path: str
+
+        :return: Staged layer
+        :rtype: QgsVectorLayer
+        """
+        layer_name = os.path.splitext(os.path.basename(shapefile_path))[0]
+        input_layer = QgsVectorLayer(shapefile_path, layer_name)
+        if self.get_shapefile_size(shapefile_path) <= self.max_memory_size or input_layer.crs() != self.crs:
+            return self.stage_layer(input_layer, layer_name)
+
+        work_path = self.copy_shapefile(shapefile_path)
+        QgsMessageLog.logMessage(f"Capa {layer_name} copiada al directori de treball", level=Qgis.Info)
+        return QgsVectorLayer(work_path, layer_name)
+
+    def stage_layer(self, input_layer, layer_name, expression=None):
+        """
+        Stage the features of a layer, optionally filtered, into a memory layer with the staging CRS
+
+        :param input_layer: Input layer
+        :type input_layer: QgsVectorLayer
+
+        :param layer_name: Name of the staged layer
+        :type layer_name: str
+
+        :param expression: Expression to filter the features to stage
+        :type expression: str
+
+        :return: Staged memory layer
+        :rtype: QgsVectorLayer
+        """
+        request = QgsFeatureRequest()
+        if expression:
+            request.setFilterExpression(expression)
+        request.setDestinationCrs(self.crs, QgsProject.instance().transformContext())
+        staged_layer = input_layer.materialize(request)
+        staged_layer.setName(layer_name)
+
+        return staged_layer
+
+    def copy_shapefile(self, shapefile_path):
+        """
+        Copy the files of a shapefile to the work directory, without decoding them
+
+        :param shapefile_path: Path to the input shapefile
+        :type shapefile_path: str
+
+        :return: Path to the copied shapefile
+        :rtype: str
+        """
+        for file_path in self.get_shapefile_files(shapefile_path):
+            shutil.copyfile(file_path, os.path.join(self.work_dir, os.path.basename(file_path)))
+
+        return os.path.join(self.work_dir, os.path.basename(shapefile_path))
+
+    def get_shapefile_size(self, shapefile_path):
+        """
+        Get the size of all the shapefile's files
+
+        :param shapefile_path: Path to the shapefile
+        :type shapefile_path: str
+
+        :return: Size of the shapefile, in bytes
+        :rtype: int
+        """
+        return sum(os.path.getsize(file_path) for file_path in self.get_shapefile_files(shapefile_path))
+
+    @staticmethod
+    def get_shapefile_files(shapefile_path):
+        """
+        Get the paths of the existing files of the shapefile
+
+        :param shapefile_path: Path to the shapefile
+        :type shapefile_path: str
+
+        :return: List with the paths of the shapefile's files
+        :rtype: list
+        """
+        base_path = os.path.splitext(shapefile_path)[0]
+        return [f'{base_path}{extension}' for extension in SHAPEFILE_EXTENSIONS
+                if os.path.exists(f'{base_path}{extension}')]
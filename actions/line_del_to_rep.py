@@ -24,6 +24,8 @@ from qgis.core import (QgsVectorLayer,
                        Qgis)
 from qgis.core.additions.edit import edit
 
+from ..utils import get_features_attributes, get_field_values
+
 
 class DelimitationToReplantejament:
     """ Delimitation to Replantejament transformation class """
@@ -108,7 +110,7 @@ class DelimitationToReplantejament:
         geo_tram_provider = self.geo_tram.dataProvider()
         geo_tram_fields = geo_tram_provider.fields()
         self.lin_tram = QgsVectorLayer(os.path.join(self.carto_dir, 'Lin_Tram.shp'), 'Lin Tram')
-        tram_id_list = [tram['ID_TRAM'] for tram in self.lin_tram.getFeatures()]
+        tram_id_list = get_field_values(self.lin_tram, 'ID_TRAM')
 
         geo_tram_feats = []
         for tram_id in tram_id_list:
@@ -135,7 +137,7 @@ class DelimitationToReplantejament:
         :rtype: str
         """
         line_id = None
-        for tram in self.lin_tram_ppta.getFeatures():
+        for tram in get_features_attributes(self.lin_tram_ppta, ['ID_LINIA']):
             line_id = tram['ID_LINIA']
             break
 
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the LineDocuments and LineTexts classes are defined.
+LineDocuments fetches, with a single query per table, the vigent reconeixement,
+DOGC publication and MTT documents of a set of boundary lines. LineTexts
+assembles the titles of those documents. Both documents and texts are cached
+by line ID, so every action of the session can reuse them.
+***************************************************************************/
+"""
+
+import numpy as np
+
+from qgis.core import (QgsMessageLog,
+                       Qgis)
+
+from ..config import *
+from ..utils import get_features_by_in_list, normalize_dogc_title
+
+# Source table and vigent filter of every document type
+LINE_DOCUMENTS_TABLES = {
+    'rec': ('reconeixement', '"vig_act_rec" IS TRUE'),
+    'dogc': ('pa_pub_dogc', '"vig_pub_dogc" IS TRUE'),
+    'mtt': ('memoria_treb_top', '"vig_mtt" IS TRUE')
+}
+
+# Documents of every type grouped by line ID, the lines already fetched and the texts of every line, shared between
+# all the instances of the session
+_LINE_DOCUMENTS = {doc_type: {} for doc_type in LINE_DOCUMENTS_TABLES}
+_FETCHED_LINES = set()
+_LINE_TEXTS = {}
+
+
+class LineDocuments:
+    """ Vigent documents of a set of boundary lines """
+
+    def __init__(self, pg_adt):
+        """
+        Constructor
+
+        :param pg_adt: Connection to the ADT PostGIS database
+        :type pg_adt: PgADTConnection
+        """
+        self.pg_adt = pg_adt
+        self.documents = _LINE_DOCUMENTS
+        self.fetched_lines = _FETCHED_LINES
+
+    def fetch(self, line_ids):
+        """
+        Fetch the vigent documents of the given lines. Only the lines that haven't been fetched before are queried,
+        with one query for every document type
+
+        :param line_ids: List of the lines ID
+        :type line_ids: list
+        """
+        new_line_ids = [int(line_id) for line_id in line_ids if int(line_id) not in self.fetched_lines]
+        if not new_line_ids:
+            return
+
+        for doc_type, (table_name, vig_filter) in LINE_DOCUMENTS_TABLES.items():
+            table = self.pg_adt.get_table(table_name)
+            table.setSubsetString(vig_filter)
+            for doc in get_features_by_in_list(table, 'id_linia', new_line_ids):
+                self.documents[doc_type].setdefault(int(doc['id_linia']), []).append(doc)
+        self.fetched_lines.update(new_line_ids)
+        QgsMessageLog.logMessage(f'Documents vigents obtinguts per {len(new_line_ids)} línies', level=Qgis.Info)
+
+    def get_rec(self, line_id):
+        """
+        Get the vigent actes de reconeixement of the line
+
+        :param line_id: ID of the line
+        :type line_id: int
+
+        :return: List with the line's actes de reconeixement
+        :rtype: list
+        """
+        return self.documents['rec'].get(int(line_id), [])
+
+    def get_dogc(self, line_id):
+        """
+        Get the vigent DOGC publications of the line
+
+        :param line_id: ID of the line
+        :type line_id: int
+
+        :return: List with the line's DOGC publications
+        :rtype: list
+        """
+        return self.documents['dogc'].get(int(line_id), [])
+
+    def get_mtt(self, line_id):
+        """
+        Get the vigent MTT of the line
+
+        :param line_id: ID of the line
+        :type line_id: int
+
+        :return: List with the line's MTT
+        :rtype: list
+        """
+        return self.documents['mtt'].get(int(line_id), [])
+
+
+class LineTexts:
+    """ Titles of the vigent documents of the boundary lines """
+
+    def __init__(self, line_documents, arr_lines_data):
+        """
+        Constructor
+
+        :param line_documents: Vigent documents of the lines
+        :type line_documents: LineDocuments
+
+        :param arr_lines_data: Array with the lines data, as read from the layout's lines data CSV
+        :type arr_lines_data: numpy.ndarray
+        """
+        self.line_documents = line_documents
+        self.arr_lines_data = arr_lines_data
+
+    def get_texts(self, line_ids):
+        """
+        Get the titles of the actes de reconeixement, DOGC publications and MTT of the given lines
+
+        :param line_ids: List of the lines ID
+        :type line_ids: list
+
+        :return: rec_text_list - List with the titles of the actes de reconeixement or DOGC publications
+        :rtype: list
+
+        :return: mtt_text_list - List with the titles of the MTT
+        :rtype: list
+
+        :return: mtt_dates - Dictionary with the line ID as key and the MTT date, as yyyyMMdd, as value
+        :rtype: dict
+
+        :return: act_rec_exists - Indicates if any line has an acta de reconeixement
+        :rtype: bool
+
+        :return: pub_dogc_exists - Indicates if any line has a DOGC publication
+        :rtype: bool
+        """
+        self.line_documents.fetch(line_ids)
+        rec_text_list, mtt_text_list, mtt_dates = [], [], {}
+        act_rec_exists, pub_dogc_exists = False, False
+        for line_id in line_ids:
+            line_texts = self.get_line_texts(line_id)
+            for rec_text, rec_type in line_texts['rec']:
+                act_rec_exists = act_rec_exists or rec_type == 'rec'
+                pub_dogc_exists = pub_dogc_exists or rec_type == 'dogc'
+                rec_text_list.append(rec_text)
+            if line_texts['mtt']:
+                mtt_text_list.append(line_texts['mtt'])
+                mtt_dates[line_id] = line_texts['mtt_date']
+
+        return rec_text_list, mtt_text_list, mtt_dates, act_rec_exists, pub_dogc_exists
+
+    def get_line_texts(self, line_id):
+        """
+        Get the titles of the vigent documents of the line, assembling them only the first time
+
+        :param line_id: ID of the line
+        :type line_id: int
+
+        :return: Dictionary with the line's reconeixement texts and their type ('rec', 'dogc' or None), the MTT
+                 text and the MTT date
+        :rtype: dict
+        """
+        if line_id not in _LINE_TEXTS:
+            mtt_text, mtt_date = self.get_mtt_text(line_id)
+            _LINE_TEXTS[line_id] = {'rec': self.get_rec_dogc_texts(line_id), 'mtt': mtt_text, 'mtt_date': mtt_date}
+
+        return _LINE_TEXTS[line_id]
+
+    def get_rec_dogc_texts(self, line_id):
+        """
+        Get the title of the DOGC publication or acta de reconeixement of every line's reconeixement.
+
+        :param line_id: ID of the line
+        :type line_id: int
+
+        :return: List with the text and the type of every reconeixement
+        :rtype: list
+        """
+        rec_texts = []
+        for rec in self.line_documents.get_rec(line_id):
+            text, rec_type = '', None
+            rec_date = rec['data_act_rec']
+            obs_act_rec = rec['obs_act_rec'] if isinstance(rec['obs_act_rec'], str) else str(rec['obs_act_rec'].value())
+            if rec['tipus_doc_ref'] == 2 and 'DOGC' not in obs_act_rec:
+                rec_type = 'rec'
+                text = self.get_rec_text(line_id, rec_date)
+            elif rec['tipus_doc_ref'] == 1 or 'DOGC' in obs_act_rec:
+                rec_type = 'dogc'
+                text = self.get_dogc_text(line_id, rec_date)
+            rec_texts.append((text, rec_type))
+
+        return rec_texts
+
+    def get_rec_text(self, line_id, date):
+        """
+        Get the title of the acta de reconeixement of the boundary line
+
+        :return: rec_text: Title of the line's Acta de reconeixement
+        :rtype: str
+        """
+        muni_1_nomens, muni_2_nomens = self.get_municipality_nomens(line_id)
+        string_date = self.get_string_date(date)
+        rec_text = f'Acta de reconeixement de la línia de terme i assenyalament de les fites comunes dels termes ' \
+                   f'municipals {muni_1_nomens} i {muni_2_nomens}, de {string_date}.\n'
+
+        return rec_text
+
+    def get_dogc_text(self, line_id, date):
+        """
+        Get the title of the DOGC publication of the boundary line
+
+        :return: dogc_text: Title of the line's DOGC publication
+        :rtype: str
+        """
+        dogc_text = ''
+        date = self.get_date_key(date)
+        for dogc in self.line_documents.get_dogc(line_id):
+            # tip_pub_dogc = 2 -> Correcció d'errades, que no poden sortir al document
+            if self.get_date_key(dogc['data_doc']) != date or str(dogc['tip_pub_dogc']) == '2':
+                continue
+            dogc_text = normalize_dogc_title(dogc['tit_pub_dogc'])
+            break
+
+        return dogc_text
+
+    def get_mtt_text(self, line_id):
+        """
+        Get the title of the MTT of the boundary line
+
+        :return: mtt_text: Title of the line's MTT, or None if the line doesn't have MTT
+        :rtype: str
+
+        :return: mtt_date: Date of the line's MTT, as yyyyMMdd
+        :rtype: str
+        """
+        for mtt in self.line_documents.get_mtt(line_id):
+            muni_1_nomens, muni_2_nomens = self.get_municipality_nomens(line_id)
+            date = mtt['data_doc']
+            string_date = self.get_string_date(date)
+            mtt_text = f'Memòria dels treballs topogràfics de la línia de delimitació entre els' \
+                       f' termes municipals {muni_1_nomens} i {muni_2_nomens}, de {string_date}.\n'
+            return mtt_text, date.toString("yyyyMMdd")
+
+        return None, None
+
+    def get_municipality_nomens(self, line_id):
+        """
+        Get the way to name the municipality
+
+        :param line_id: ID of the line
+        :type line_id: str
+
+        :return: muni_1_nomens - Way to name the first municipality
+        :rtype: muni_1_nomens: str
+
+        :return: muni_2_nomens - Way to name the second municipality
+        :rtype: muni_2_nomens: str
+        """
+        muni_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)][0]
+        muni_1_nomens = muni_data[3]
+        muni_2_nomens = muni_data[4]
+
+        return muni_1_nomens, muni_2_nomens
+
+    @staticmethod
+    def get_date_key(date):
+        """
+        Get a date as a comparable string, whether it's a QDate, a QDateTime or a plain value
+
+        :param date: Date to convert
+        :type date: QDate
+
+        :return: Date as yyyy-MM-dd
+        :rtype: str
+        """
+        return date.toString('yyyy-MM-dd') if hasattr(date, 'toString') else str(date)
+
+    @staticmethod
+    def get_string_date(date):
+        """
+        Get the current date as a string
+
+        :return: string_date: Current date as string, with format [day month year]
+        :rtype: str
+        """
+        date = date.toString("yyyy-MM-dd")
+        date_splitted = date.split('-')
+        day = date_splitted[-1]
+        if day[0] == '0':
+            day = day[1]
+        year = date_splitted[0]
+        month = MESOS_CAT[date_splitted[1]]
+        string_date = f'{day} {month} {year}'
+
+        return string_date
+
+
+def clear_line_documents():
+    """ Remove all the cached documents and texts, forcing them to be fetched again """
+    for documents in _LINE_DOCUMENTS.values():
+        documents.clear()
+    _FETCHED_LINES.clear()
+    _LINE_TEXTS.clear()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the LineExtentIndex class is defined. The main function
+of this class is to keep, for every searched layer, the bounding box of each
+line ID, so the toolbar's line finder can zoom to a line without scanning the
+whole layer. The index of a layer is built the first time it's searched and
+dropped whenever the layer is edited or filtered.
+***************************************************************************/
+"""
+
+from qgis.core import (QgsFeatureRequest,
+                       QgsRectangle)
+
+# Names of the fields that can be searched by line ID
+LINE_ID_FIELD_NAMES = ('id_linia', 'idlinia', 'IDLINIA', 'ID_LINIA')
+
+
+class LineExtentIndex:
+    """ Line ID to bounding box index of the searched layers """
+
+    def __init__(self):
+        """ Constructor """
+        # Layer ID as key and the layer's index, with the line ID as key and its bounding box as value, as value
+        self.indexes = {}
+        # ID of the layers whose edition signals are already connected as key and the connected signals and slots
+        # as value
+        self.connections = {}
+
+    @staticmethod
+    def get_line_id_field(layer):
+        """
+        Get the line ID searchable field
+
+        :param layer: QGIS project layer
+        :type layer: QgsVectorLayer
+
+        :return: Name of the line ID searchable field, or None if the layer doesn't have any
+        :rtype: str
+        """
+        field_names = layer.fields().names()
+        for field_name in LINE_ID_FIELD_NAMES:
+            if field_name in field_names:
+                return field_name
+
+        return None
+
+    def get_index(self, layer):
+        """
+        Get the index of the layer, building it if it doesn't exist yet
+
+        :param layer: QGIS project layer with a line ID searchable field
+        :type layer: QgsVectorLayer
+
+        :return: Dictionary with the line ID as key and its bounding box as value
+        :rtype: dict
+        """
+        if layer.id() not in self.indexes:
+            self.indexes[layer.id()] = self.build_index(layer)
+            self.connect_layer_signals(layer)
+
+        return self.indexes[layer.id()]
+
+    def is_indexed(self, layer):
+        """
+        Check if the index of the layer has already been built
+
+        :param layer: QGIS project layer
+        :type layer: QgsVectorLayer
+
+        :return: Indicates if the layer is indexed
+        :rtype: bool
+        """
+        return layer is not None and layer.id() in self.indexes
+
+    def get_indexed_line_ids(self, layer):
+        """
+        Get the line IDs of the layer if its index has already been built
+
+        :param layer: QGIS project layer
+        :type layer: QgsVectorLayer
+
+        :return: Sorted list with the line IDs of the layer, or an empty list if the layer isn't indexed
+        :rtype: list
+        """
+        if not self.is_indexed(layer):
+            return []
+
+        return sorted(self.indexes[layer.id()])
+
+    def build_index(self, layer):
+        """
+        Build the index of the layer in a single pass, reading only the line ID field and the geometries
+
+        :param layer: QGIS project layer with a line ID searchable field
+        :type layer: QgsVectorLayer
+
+        :return: Dictionary with the line ID as key and its bounding box as value
+        :rtype: dict
+        """
+        line_id_field = self.get_line_id_field(layer)
+        request = QgsFeatureRequest().setSubsetOfAttributes([line_id_field], layer.fields())
+        index = {}
+        for feature in layer.getFeatures(request):
+            try:
+                line_id = int(feature[line_id_field])
+            except (TypeError, ValueError):
+                continue
+            if not feature.hasGeometry():
+                continue
+            bounding_box = feature.geometry().boundingBox()
+            if line_id in index:
+                index[line_id].combineExtentWith(bounding_box)
+            else:
+                index[line_id] = QgsRectangle(bounding_box)
+
+        return index
+
+    def connect_layer_signals(self, layer):
+        """
+        Drop the index of the layer when it's edited, filtered or removed
+
+        :param layer: QGIS project layer
+        :type layer: QgsVectorLayer
+        """
+        layer_id = layer.id()
+        if layer_id in self.connections:
+            return
+        connections = [(layer.layerModified, lambda: self.invalidate(layer_id)),
+                       (layer.afterCommitChanges, lambda: self.invalidate(layer_id)),
+                       (layer.dataChanged, lambda: self.invalidate(layer_id)),
+                       (layer.subsetStringChanged, lambda: self.invalidate(layer_id)),
+                       (layer.willBeDeleted, lambda: self.remove_layer(layer_id))]
+        for signal, slot in connections:
+            signal.connect(slot)
+        self.connections[layer_id] = connections
+
+    def disconnect_layers(self):
+        """ Disconnect the signals of every connected layer and drop all the indexes, as when the plugin is unloaded """
+        for connections in self.connections.values():
+            for signal, slot in connections:
+                try:
+                    signal.disconnect(slot)
+                except (RuntimeError, TypeError):
+                    # The layer has already been deleted
+                    pass
+        self.connections.clear()
+        self.indexes.clear()
+
+    def invalidate(self, layer_id):
+        """
+        Drop the index of the layer, so it's built again the next time the layer is searched
+
+        :param layer_id: ID of the QGIS project layer
+        :type layer_id: str
+        """
+        self.indexes.pop(layer_id, None)
+
+    def remove_layer(self, layer_id):
+        """
+        Forget a layer that has been removed from the project
+
+        :param layer_id: ID of the QGIS project layer
+        :type layer_id: str
+        """
+        self.invalidate(layer_id)
+        self.connections.pop(layer_id, None)
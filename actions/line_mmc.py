@@ -9,19 +9,18 @@ and generates the metadata of a municipal line.
 ***************************************************************************/
 """
 
-import os
 import numpy as np
 
 from PyQt5.QtCore import QVariant
 from qgis.core import (QgsVectorLayer,
                        QgsCoordinateReferenceSystem,
-                       QgsVectorFileWriter,
                        QgsMessageLog,
                        QgsField,
                        QgsProject)
 
 from ..config import *
 from .adt_postgis_connection import PgADTConnection
+from .layer_staging import LayerStaging
 from ..utils import *
 
 # TODO in progress...
@@ -70,10 +69,8 @@ class LineMMC(object):
         """  """
         # ########################
         # SET DATA
-        # Copy data to work directory
-        self.copy_data_to_work()
-        # Set the layers paths
-        self.work_points_layer, self.work_lines_layer = self.set_layers_paths()
+        # Stage the input data
+        self.work_points_layer, self.work_lines_layer = self.stage_input_layers()
 
         # ########################
         # GENERATION PROCESS
@@ -88,26 +85,19 @@ class LineMMC(object):
         # Make the output directories if they don't exist
         # TODO export, saber nombre de los archivos de salida
 
-    def copy_data_to_work(self):
-        """  """
-        # Points layer
+    def stage_input_layers(self):
+        """
+        Stage the line's points and lines from the PostGIS views into memory layers
+
+        :return: Points and lines layers of the line
+        :rtype: QgsVectorLayer
+        """
+        layer_staging = LayerStaging(LINIA_WORK_DIR, self.crs)
+        line_filter = f'"id_linia"=\'{self.line_id}\''
         fita_mem_layer = self.pg_adt.get_layer('v_fita_mem', 'id_fita')
-        fita_mem_layer.selectByExpression(f'"id_linia"=\'{self.line_id}\'', QgsVectorLayer.SetSelection)
-        # Lines layer
+        work_points_layer = layer_staging.stage_layer(fita_mem_layer, f'fites_{self.line_id}', line_filter)
         line_mem_layer = self.pg_adt.get_layer('v_tram_linia_mem', 'id_tram_linia')
-        line_mem_layer.selectByExpression(f'"id_linia"=\'{self.line_id}\'', QgsVectorLayer.SetSelection)
-
-        # Export layers to the work space
-        QgsVectorFileWriter.writeAsVectorFormat(fita_mem_layer, os.path.join(LINIA_WORK_DIR, f'fites_{self.line_id}.shp'),
-                                                'utf-8', self.crs, 'ESRI Shapefile', True)
-        QgsVectorFileWriter.writeAsVectorFormat(line_mem_layer, os.path.join(LINIA_WORK_DIR, f'tram_linia_{self.line_id}.shp'),
-                                                'utf-8', self.crs, 'ESRI Shapefile', True)
-        # TODO: sin proyección
-
-    def set_layers_paths(self):
-        """  """
-        work_points_layer = QgsVectorLayer(os.path.join(LINIA_WORK_DIR, f'fites_{self.line_id}.shp'))
-        work_lines_layer = QgsVectorLayer(os.path.join(LINIA_WORK_DIR, f'tram_linia_{self.line_id}.shp'))
+        work_lines_layer = layer_staging.stage_layer(line_mem_layer, f'tram_linia_{self.line_id}', line_filter)
 
         return work_points_layer, work_lines_layer
 
@@ -142,8 +132,10 @@ class LineMMCPoints(LineMMC):
     def fill_fields(self):
         """  """
         self.work_points_layer.startEditing()
-        for point in self.work_points_layer.getFeatures():
-            point_id_fita = coordinates_to_id_fita(point['point_x'], point['point_y'])
+        points = list(self.work_points_layer.getFeatures())
+        points_id_fita = coordinates_to_id_fita_array([point['point_x'] for point in points],
+                                                      [point['point_y'] for point in points])
+        for point, point_id_fita in zip(points, points_id_fita.tolist()):
             point_r_fita = point_num_to_text(point['num_fita'])
 
             point['IdUFita'] = point['id_u_fita'][:-2]
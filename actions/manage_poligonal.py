@@ -12,12 +12,9 @@ with the poligonal's point layer reprojected ETRS89 coordinates.
 import os
 
 from qgis.core import (QgsVectorLayer,
-                       QgsField,
-                       QgsVectorLayerJoinInfo,
+                       QgsFeatureRequest,
                        QgsMessageLog,
                        Qgis)
-from qgis.core.additions.edit import edit
-from PyQt5.QtCore import QVariant
 from PyQt5.QtWidgets import QMessageBox
 
 
@@ -33,7 +30,7 @@ class ManagePoligonal:
         """
         # Layers and paths
         self.doc_delim = doc_delim_directory
-        self.polig_points_layer, self.polig_table, self.join_object = None, None, None
+        self.polig_points_layer, self.polig_table = None, None
         # Message box
         self.box_error = QMessageBox()
         self.box_error.setIcon(QMessageBox.Critical)
@@ -46,12 +43,8 @@ class ManagePoligonal:
         """
         QgsMessageLog.logMessage('Procés iniciat: actualització de la Poligonal', level=Qgis.Info)
         self.set_layers()
-        self.add_fields()
-        self.populate_fields()
-        self.join()
-        self.update()
-        self.polig_table.removeJoin(self.join_object.joinLayerId())
-        self.remove_fields()
+        polig_points_coords = self.get_polig_points_coords()
+        self.update(polig_points_coords)
         QgsMessageLog.logMessage('Procés finalitzat: Poligonal actualitzada', level=Qgis.Info)
 
     def set_layers(self):
@@ -59,89 +52,43 @@ class ManagePoligonal:
         self.polig_points_layer = QgsVectorLayer(os.path.join(self.doc_delim, 'Cartografia/Pto_Polig.shp'))
         self.polig_table = QgsVectorLayer(os.path.join(self.doc_delim, 'Taules/POLIGONA.dbf'))
 
-    # #######################
-    # Add fields
-    def add_fields(self):
-        """ Add the necessary fields to both poligonal's layer and table """
-        self.add_fields_layer()
-        self.add_fields_table()
-
-    def add_fields_layer(self):
-        """ Add the necessary fields to the poliognal's point layer """
-        concat_field = QgsField(name='Concat_1', type=QVariant.String, typeName='text', len=12)
-        x_coord_field = QgsField(name='X_Coord', type=QVariant.Double, len=19, prec=5)
-        y_coord_field = QgsField(name='Y_Coord', type=QVariant.Double, len=19, prec=5)
-
-        new_fields_list = (x_coord_field, y_coord_field, concat_field)
-        self.polig_points_layer.dataProvider().addAttributes(new_fields_list)
-        self.polig_points_layer.updateFields()
-        QgsMessageLog.logMessage('Camps de Join afegits a la capa de punts de la Poligonal', level=Qgis.Info)
-
-    def add_fields_table(self):
-        """ Add the necessary fields to the poligonal's table """
-        concat_field = QgsField(name='Concat_2', type=QVariant.String, typeName='text', len=12)
-
-        self.polig_table.dataProvider().addAttributes([concat_field])
-        self.polig_table.updateFields()
-        QgsMessageLog.logMessage('Camps de Join afegits a la taula de la Poligonal', level=Qgis.Info)
+    @staticmethod
+    def get_polig_point_key(feature):
+        """
+        Get the key that relates a poligonal's point with its record of the poligonal's table
 
-    # #######################
-    # Populate fields
-    def populate_fields(self):
-        """ Populate the new fields of both poligonal's layer and table """
-        self.populate_fields_layer()
-        self.populate_fields_table()
-
-    def populate_fields_layer(self):
-        """ Populate the new fields of the poligonal's layer """
-        with edit(self.polig_points_layer):
-            fields = self.polig_points_layer.fields()
-            for feature in self.polig_points_layer.getFeatures():
-                concat = f"{feature['ID_POLIG']}_{int(feature['ID_VIS'])}"
-                x_coord = round(feature.geometry().asPoint()[0], 5)
-                y_coord = round(feature.geometry().asPoint()[1], 5)
-                attrs = {
-                    fields.indexFromName("X_Coord"): x_coord,
-                    fields.indexFromName("Y_Coord"): y_coord,
-                    fields.indexFromName("Concat_1"): concat
-                }
-                self.polig_points_layer.dataProvider().changeAttributeValues({feature.id(): attrs})
-
-        QgsMessageLog.logMessage('Camps de Join de la capa de punts de la Poligonal correctament emplenats', level=Qgis.Info)
-
-    def populate_fields_table(self):
-        """ Populate the new fields of the poligonal's table+ """
-        with edit(self.polig_table):
-            fields = self.polig_table.fields()
-            id_field = fields.indexFromName("Concat_2")
-            for feature in self.polig_table.getFeatures():
-                concat = f"{feature['ID_POLIG']}_{int(feature['ID_VIS'])}"
-                attr = {id_field: concat}
-                self.polig_table.dataProvider().changeAttributeValues({feature.id(): attr})
-
-        QgsMessageLog.logMessage('Camps de Join de la taula de la Poligonal correctament emplenats', level=Qgis.Info)
+        :param feature: Poligonal's point or poligonal's table record
+        :type feature: QgsFeature
 
-    # #######################
-    # Join
-    def join(self):
-        """ Perform and add a left join to the poligonal's table, adding the poligonal's layer """
-        # Join parameters
-        self.join_object = QgsVectorLayerJoinInfo()
-        self.join_object.setJoinLayerId(self.polig_points_layer.id())
-        self.join_object.setJoinFieldName('Concat_1')
-        self.join_object.setTargetFieldName('Concat_2')
-        self.join_object.setJoinLayer(self.polig_points_layer)
-        self.join_object.memoryCache = True
-
-        # Perform join
-        self.polig_table.addJoin(self.join_object)
-
-        QgsMessageLog.logMessage('Taula i capa de punts de la Poligonal unides amb un Join', level=Qgis.Info)
+        :return: Key of the poligonal's point, as ID_POLIG_ID_VIS
+        :rtype: str
+        """
+        return f"{feature['ID_POLIG']}_{int(feature['ID_VIS'])}"
+
+    def get_polig_points_coords(self):
+        """
+        Get the reprojected coordinates of every poligonal's point
+
+        :return: Dictionary with the poligonal's point key as key and its rounded coordinates as value
+        :rtype: dict
+        """
+        request = QgsFeatureRequest().setSubsetOfAttributes(['ID_POLIG', 'ID_VIS'], self.polig_points_layer.fields())
+        polig_points_coords = {}
+        for feature in self.polig_points_layer.getFeatures(request):
+            point = feature.geometry().asPoint()
+            polig_points_coords[self.get_polig_point_key(feature)] = (round(point.x(), 5), round(point.y(), 5))
+
+        return polig_points_coords
 
     # #######################
     # Update
-    def update(self):
-        """ Update the poligonal's table with the poligonal's layer values of the reprojected coordinates """
+    def update(self, polig_points_coords):
+        """
+        Update the poligonal's table with the poligonal's layer values of the reprojected coordinates
+
+        :param polig_points_coords: Dictionary with the poligonal's point key as key and its coordinates as value
+        :type polig_points_coords: dict
+        """
         QgsMessageLog.logMessage('Actualitzant taula de la poligonal...', level=Qgis.Info)
         # Fields parameters
         fields = self.polig_table.fields()
@@ -150,55 +97,29 @@ class ManagePoligonal:
         id_x_conv = fields.indexFromName("X_CONV")
         id_y_conv = fields.indexFromName("Y_CONV")
 
-        with edit(self.polig_table):
-            # Compensades
-            self.polig_table.selectByExpression('"X_COMP" != 0')
-            for feature in self.polig_table.getSelectedFeatures():
-                new_x_coord = feature['_X_Coord']
-                new_y_coord = feature['_Y_Coord']
-                comp_attrs = {
-                    id_x_comp: new_x_coord,
-                    id_y_comp: new_y_coord
-                }
-                self.polig_table.dataProvider().changeAttributeValues({feature.id(): comp_attrs})
-
-            # No compensades
-            self.polig_table.invertSelection()
-            for feature in self.polig_table.getSelectedFeatures():
-                new_x_coord = feature['_X_Coord']
-                new_y_coord = feature['_Y_Coord']
-                conv_attrs = {
-                    id_x_conv: new_x_coord,
-                    id_y_conv: new_y_coord
-                }
-                self.polig_table.dataProvider().changeAttributeValues({feature.id(): conv_attrs})
-
+        request = QgsFeatureRequest().setSubsetOfAttributes(['ID_POLIG', 'ID_VIS', 'X_COMP'], fields)
+        attr_map = {}
+        not_found = 0
+        for feature in self.polig_table.getFeatures(request):
+            coords = polig_points_coords.get(self.get_polig_point_key(feature))
+            if coords is None:
+                not_found += 1
+                continue
+            new_x_coord, new_y_coord = coords
+            if feature['X_COMP'] and feature['X_COMP'] != 0:
+                # Compensades
+                attr_map[feature.id()] = {id_x_comp: new_x_coord, id_y_comp: new_y_coord}
+            else:
+                # No compensades
+                attr_map[feature.id()] = {id_x_conv: new_x_coord, id_y_conv: new_y_coord}
+
+        if attr_map:
+            self.polig_table.dataProvider().changeAttributeValues(attr_map)
+        if not_found:
+            QgsMessageLog.logMessage(f"{not_found} registres de la taula de la Poligonal no tenen punt a la capa de "
+                                     f"punts i no s'han actualitzat", level=Qgis.Warning)
         QgsMessageLog.logMessage('Taula de la Poligonal actualitzada', level=Qgis.Info)
 
-    # #######################
-    # Remove fields
-    def remove_fields(self):
-        """ Remove the fields added before to perform the process """
-        self.remove_fields_layer()
-        self.remove_fields_table()
-        QgsMessageLog.logMessage('Camps de Join de la taula i la capa de punts de la Poligonal esborrats', level=Qgis.Info)
-
-    def remove_fields_layer(self):
-        """ Remove the fields added to the poligonal's layer """
-        fields = self.polig_points_layer.fields()
-        delete_fields_list = list((fields.indexFromName("X_Coord"), fields.indexFromName("Y_Coord"), fields.indexFromName("Concat_1")))
-
-        with edit(self.polig_points_layer):
-            self.polig_points_layer.dataProvider().deleteAttributes(delete_fields_list)
-
-    def remove_fields_table(self):
-        """ Remove the fields added to the poligonal's table """
-        fields = self.polig_table.fields()
-        delete_field = fields.indexFromName("Concat_2")
-
-        with edit(self.polig_table):
-            self.polig_table.dataProvider().deleteAttributes([delete_field])
-
     # #######################
     # Check
     def check_input_data(self):
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the MetadataTemplate class is defined. The main function
+of this class is to parse a metadata XML template only once, index the elements
+that have placeholders and render the template with the values of every
+municipality in a single pass.
+***************************************************************************/
+"""
+
+import copy
+import re
+import xml.etree.ElementTree as ET
+
+# Parsed templates, shared between all the instances of the session and keyed by the template path and placeholders
+_PARSED_TEMPLATES = {}
+
+
+def get_placeholders_regex(placeholders):
+    """
+    Get a regular expression that matches any of the given placeholders, trying the longest ones first
+
+    :param placeholders: Placeholders to match
+    :type placeholders: list
+
+    :return: Compiled regular expression
+    :rtype: re.Pattern
+    """
+    sorted_placeholders = sorted(placeholders, key=len, reverse=True)
+    return re.compile('|'.join(re.escape(placeholder) for placeholder in sorted_placeholders))
+
+
+class MetadataTemplate:
+    """ Metadata XML template """
+
+    def __init__(self, template_path, text_placeholders, fragment_placeholders):
+        """
+        Constructor
+
+        :param template_path: Path to the metadata XML template
+        :type template_path: str
+
+        :param text_placeholders: Placeholders of the elements' text, which are replaced by plain text values
+        :type text_placeholders: tuple
+
+        :param fragment_placeholders: Placeholders replaced by XML fragments, so they can't be set as text
+        :type fragment_placeholders: tuple
+        """
+        self.template_path = template_path
+        self.text_regex = get_placeholders_regex(text_placeholders)
+        self.fragment_regex = get_placeholders_regex(fragment_placeholders)
+        with open(template_path, encoding='utf-8') as f:
+            self.root = ET.parse(f).getroot()
+        # Position, in document order, of every element whose text has a placeholder
+        self.index = [position for position, elem in enumerate(self.root.iter())
+                      if elem.text and self.text_regex.search(elem.text)]
+
+    def render(self, values, fragments):
+        """
+        Render the template with the given values
+
+        :param values: Dictionary with the text placeholder as key and its value as value
+        :type values: dict
+
+        :param fragments: Dictionary with the fragment placeholder as key and its XML fragment as value
+        :type fragments: dict
+
+        :return: Rendered XML
+        :rtype: str
+        """
+        root = copy.deepcopy(self.root)
+        elements = list(root.iter())
+        for position in self.index:
+            elem = elements[position]
+            elem.text = self.text_regex.sub(lambda match: values[match.group(0)], elem.text)
+        xml_str = ET.tostring(root, encoding='unicode')
+
+        return self.fragment_regex.sub(lambda match: fragments[match.group(0)], xml_str)
+
+
+def get_metadata_template(template_path, text_placeholders, fragment_placeholders):
+    """
+    Get the parsed metadata template, parsing it only the first time it is requested
+
+    :param template_path: Path to the metadata XML template
+    :type template_path: str
+
+    :param text_placeholders: Placeholders of the elements' text, which are replaced by plain text values
+    :type text_placeholders: tuple
+
+    :param fragment_placeholders: Placeholders replaced by XML fragments, so they can't be set as text
+    :type fragment_placeholders: tuple
+
+    :return: Parsed metadata template
+    :rtype: MetadataTemplate
+    """
+    key = (template_path, tuple(text_placeholders), tuple(fragment_placeholders))
+    if key not in _PARSED_TEMPLATES:
+        _PARSED_TEMPLATES[key] = MetadataTemplate(template_path, text_placeholders, fragment_placeholders)
+
+    return _PARSED_TEMPLATES[key]
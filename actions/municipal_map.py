@@ -6,28 +6,56 @@
 In this file is where the MunicipalMap class is defined. The main function
 of this class is to run the automation process that edits a Municipal map layout,
 in order to automatically add some information related to the document and the municipality
-and make the layout editable for the user.
+and make the layout editable for the user. The MunicipalMapBatch class renders
+and exports the layouts of several municipalities reusing the project layers.
 ***************************************************************************/
 """
 
+import hashlib
 import numpy as np
 import os
 import shutil
+import time
 
 from qgis.core import (QgsVectorLayer,
                        QgsProject,
+                       QgsLayoutExporter,
                        QgsMessageLog,
                        QgsRasterLayer,
                        QgsField,
-                       QgsMessageLog,
                        Qgis,
                        QgsRectangle)
 import processing
 from qgis.core.additions.edit import edit
+from osgeo import gdal
 
 from ..config import *
 from ..utils import *
 from .adt_postgis_connection import PgADTConnection
+from .style_registry import StyleRegistry
+from .line_documents import LineDocuments, LineTexts
+
+# Z factor, sun azimuth and sun altitude of the hillshade
+HILLSHADE_Z_FACTOR = 4
+HILLSHADE_AZIMUTH = 315
+HILLSHADE_ALTITUDE = 45
+# Number of rows of the DTM read and shaded at once by the windowed hillshade
+HILLSHADE_STRIP_ROWS = 1024
+# Maximum size, in bytes, of the hillshade cache. The least recently used hillshades are evicted beyond it
+HILLSHADE_CACHE_MAX_SIZE = 2 * 1024 * 1024 * 1024
+# Maximum age, in seconds, of an unused cached hillshade
+HILLSHADE_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# QML style file of every Municipal map layer
+MUNICIPAL_MAP_STYLES = {
+    'MM_Poligons': 'poligon.qml',
+    'MM_Fites': 'fites.qml',
+    'MM_Lveines': 'linies_veines.qml',
+    'MM_Linies': 'linies.qml',
+    'MM_Municipisveins': 'etiquetes_municipi_veins.qml',
+    'Nuclis': 'nuclis.qml',
+    'Ombra': 'ombra.qml'
+}
 
 
 class MunicipalMap:
@@ -36,7 +64,8 @@ class MunicipalMap:
     def __init__(self,
                  municipality_id,
                  input_directory,
-                 iface):
+                 iface,
+                 line_documents=None):
         """
         Constructor
 
@@ -50,6 +79,9 @@ class MunicipalMap:
             which provides the hook by which you can manipulate the QGIS
             application at run time.
         :type iface: QgsInterface
+
+        :param line_documents: Vigent documents of the lines, shared between several municipal maps
+        :type line_documents: LineDocuments
         """
         # ######
         # Initialize instance attributes
@@ -63,9 +95,7 @@ class MunicipalMap:
         # ADT PostGIS connection
         self.pg_adt = PgADTConnection(HOST, DBNAME, USER, PWD, SCHEMA)
         self.pg_adt.connect()
-        self.rec_table = self.pg_adt.get_table('reconeixement')
-        self.dogc_table = self.pg_adt.get_table('pa_pub_dogc')
-        self.mtt_table = self.pg_adt.get_table('memoria_treb_top')
+        self.line_documents = line_documents or LineDocuments(self.pg_adt)
         self.project = QgsProject.instance()
         self.arr_municipality_data = np.genfromtxt(LAYOUT_MUNI_DATA, dtype=None, encoding='utf-8-sig', delimiter=';', names=True)
         self.arr_lines_data = np.genfromtxt(LAYOUT_LINE_DATA, dtype=None, encoding='utf-8-sig', delimiter=';', names=True)
@@ -85,8 +115,7 @@ class MunicipalMap:
         self.municipality_sup = self.get_municipality_sup()
         self.municipality_lines = self.get_municipality_lines()
         self.mtt_dates = {}
-        self.rec_text = self.get_rec_dogc_text()
-        self.mtt_text = self.get_mtt_text()
+        self.rec_text, self.mtt_text = self.get_rec_mtt_texts()
 
     def log_environment_variables(self):
         """ Log as a MessageLog the environment variables of the DCD """
@@ -121,7 +150,7 @@ class MunicipalMap:
         :rtype: str
         """
         sup = None
-        for polygon in self.polygon_layer.getFeatures():
+        for polygon in get_features_attributes(self.polygon_layer, ['Sup_CDT']):
             sup = polygon['Sup_CDT']
             QgsMessageLog.logMessage(f'Superfície del municipi: {sup} km quadrats', level=Qgis.Info)
             break
@@ -135,148 +164,51 @@ class MunicipalMap:
         :return: line list: List of the municipality's boundary lines
         :rtype: tuple
         """
-        line_list = []
-        for line in self.lines_layer.getFeatures():
-            line_id = int(line['id_linia'])
-            if not 5000 < line_id < 6000:
-                line_list.append(int(line_id))
+        line_list = self.read_municipality_lines(self.lines_layer)
 
         QgsMessageLog.logMessage(f"Línies del municipi: {''.join(str(line_list))}", level=Qgis.Info)
 
         return line_list
 
-    def get_rec_dogc_text(self):
-        """
-        Get the title of the DOGC publication or acta de reconeixement of every municipality's boundary line, in order
-        to write them later in the layout. First of all, the function checks if the line has a DOGC publication
-        or acta de reconeixement.
-
-        :return: rec_text_list - List with the title of whether the DOGC titles or Acta de reconeixement titles
-                                 of every line
-        :rtype: tuple
+    @staticmethod
+    def read_municipality_lines(lines_layer):
         """
-        rec_text_list = []
-        for line_id in self.municipality_lines:
-            self.rec_table.selectByExpression(f'"id_linia"={line_id} and "vig_act_rec" is True')
-
-            for rec in self.rec_table.getSelectedFeatures():
-                text = ''
-                rec_date = rec['data_act_rec']
-                if isinstance(rec['obs_act_rec'], str):
-                    if rec['tipus_doc_ref'] == 2 and 'DOGC' not in rec['obs_act_rec']:
-                        self.act_rec_exists = True
-                        text = self.get_rec_text(line_id, rec_date)
-                    elif rec['tipus_doc_ref'] == 1 or 'DOGC' in rec['obs_act_rec']:
-                        self.pub_dogc_exits = True
-                        text = self.get_dogc_text(line_id, rec_date)
-                else:
-                    if rec['tipus_doc_ref'] == 2 and 'DOGC' not in str(rec['obs_act_rec'].value()):
-                        self.act_rec_exists = True
-                        text = self.get_rec_text(line_id, rec_date)
-                    elif rec['tipus_doc_ref'] == 1 or 'DOGC' in str(rec['obs_act_rec'].value()):
-                        self.pub_dogc_exits = True
-                        text = self.get_dogc_text(line_id, rec_date)
-                rec_text_list.append(text)
+        Read the boundary lines ID of the given lines layer, without the coast lines
 
-        QgsMessageLog.logMessage(f"Textos d'actes de reconeixement i publicacions al DOGC: "
-                                 f"{''.join(str(rec_text_list))}", level=Qgis.Info)
+        :param lines_layer: Municipal map lines layer
+        :type lines_layer: QgsVectorLayer
 
-        return rec_text_list
-
-    def get_rec_text(self, line_id, date):
-        """
-        Get the title of the acta de reconeixement of the boundary line
-
-        :return: rec_text: Title of the line's Acta de reconeixement
-        :rtype: str
+        :return: line list: List of the boundary lines
+        :rtype: list
         """
-        muni_1_nomens, muni_2_nomens = self.get_municipality_nomens(line_id)
-        string_date = self.get_string_date(date)
-        rec_text = f'Acta de reconeixement de la línia de terme i assenyalament de les fites comunes dels termes ' \
-                   f'municipals {muni_1_nomens} i {muni_2_nomens}, de {string_date}.\n'
-
-        return rec_text
+        line_list = []
+        for line in get_features_attributes(lines_layer, ['id_linia']):
+            line_id = int(line['id_linia'])
+            if not 5000 < line_id < 6000:
+                line_list.append(line_id)
 
-    def get_dogc_text(self, line_id, date):
-        """
-        Get the title of the DOGC publication of the boundary line
+        return line_list
 
-        :return: dogc_text: Title of the line's DOGC publication
-        :rtype: str
+    def get_rec_mtt_texts(self):
         """
-        date_ = date.toString("yyyy-MM-dd")
-        self.dogc_table.selectByExpression(f'"id_linia"={line_id} AND "vig_pub_dogc" is True AND '
-                                           f'"data_doc"=\'{date_}\' AND "tip_pub_dogc" != \'2\'')   # tip_pub_dogc = 2 -> Correcció d'errades, que no poden sortir al document
-        dogc_text = ''
-        for dogc in self.dogc_table.getSelectedFeatures():
-            title = dogc['tit_pub_dogc']
-            dogc_text = normalize_dogc_title(title)
-            break
-
-        return dogc_text
+        Get the titles of the DOGC publications or actes de reconeixement and the MTT of every municipality's
+        boundary line, in order to write them later in the layout.
 
-    def get_mtt_text(self):
-        """
-        Get the title of the MTT of the boundary line
+        :return: rec_text_list - List with the title of whether the DOGC titles or Acta de reconeixement titles
+                                 of every line
+        :rtype: list
 
         :return: mtt_text_list: List of the municipal's boundary lines MTT's titles
-        :rtype: tuple
+        :rtype: list
         """
-        mtt_text_list = []
-        for line_id in self.municipality_lines:
-            muni_1_nomens, muni_2_nomens = self.get_municipality_nomens(line_id)
-            self.mtt_table.selectByExpression(f'"id_linia" = {line_id} AND "vig_mtt" is True')
-
-            for mtt in self.mtt_table.getSelectedFeatures():
-                date = mtt['data_doc']
-                self.mtt_dates[line_id] = date.toString("yyyyMMdd")   # Add to the MTT dates dict, will be used later
-                string_date = self.get_string_date(date)
-                mtt_text = f'Memòria dels treballs topogràfics de la línia de delimitació entre els' \
-                           f' termes municipals {muni_1_nomens} i {muni_2_nomens}, de {string_date}.\n'
-                mtt_text_list.append(mtt_text)
-                break
-
+        line_texts = LineTexts(self.line_documents, self.arr_lines_data)
+        rec_text_list, mtt_text_list, self.mtt_dates, self.act_rec_exists, self.pub_dogc_exits = \
+            line_texts.get_texts(self.municipality_lines)
+        QgsMessageLog.logMessage(f"Textos d'actes de reconeixement i publicacions al DOGC: "
+                                 f"{''.join(str(rec_text_list))}", level=Qgis.Info)
         QgsMessageLog.logMessage(f"Textos de les MTT: {''.join(str(mtt_text_list))}", level=Qgis.Info)
 
-        return mtt_text_list
-
-    def get_municipality_nomens(self, line_id):
-        """
-        Get the way to name the municipality
-
-        :param line_id: ID of the line
-        :type line_id: str
-
-        :return: muni_1_nomens - Way to name the first municipality
-        :rtype: muni_1_nomens: str
-
-        :return: muni_2_nomens - Way to name the second municipality
-        :rtype: muni_2_nomens: str
-        """
-        muni_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)][0]
-        muni_1_nomens = muni_data[3]
-        muni_2_nomens = muni_data[4]
-
-        return muni_1_nomens, muni_2_nomens
-
-    @staticmethod
-    def get_string_date(date):
-        """
-        Get the current date as a string
-
-        :return: string_date: Current date as string, with format [day month year]
-        :rtype: str
-        """
-        date = date.toString("yyyy-MM-dd")
-        date_splitted = date.split('-')
-        day = date_splitted[-1]
-        if day[0] == '0':
-            day = day[1]
-        year = date_splitted[0]
-        month = MESOS_CAT[date_splitted[1]]
-        string_date = f'{day} {month} {year}'
-
-        return string_date
+        return rec_text_list, mtt_text_list
 
     @staticmethod
     def get_raster_layer():
@@ -328,6 +260,85 @@ class MunicipalMap:
 
         QgsMessageLog.logMessage('Procés finalitzat: generació de Mapa municipal', level=Qgis.Info)
 
+    def render_municipal_map(self, hillshade_size=None):
+        """
+        Render and export the Municipal map layouts without using the map canvas. If the project already has the
+        municipal map layers, their data source is swapped in place, keeping their style
+
+        :param hillshade_size: Size of the layout whose extent is shaded, or None to export the layouts without
+                               the hillshade
+        :type hillshade_size: str
+        """
+        QgsMessageLog.logMessage('Procés iniciat: exportació de Mapa municipal', level=Qgis.Info)
+        if not self.swap_map_layers_sources():
+            self.remove_map_layers()
+            self.add_map_layers()
+            self.add_layers_styles()
+        self.add_labeling_field()
+        self.edit_layout()
+        self.zoom_layouts_to_polygon_layer()
+        self.update_hillshade(hillshade_size)
+        self.export_layouts()
+        self.copy_mtt()
+        QgsMessageLog.logMessage('Procés finalitzat: exportació de Mapa municipal', level=Qgis.Info)
+
+    def update_hillshade(self, hillshade_size):
+        """
+        Set the hillshade of the municipality's layout extent as the 'ombra' layer. If it can't be generated, the
+        hillshade of a previous municipality is removed instead of being exported with this municipal map
+
+        :param hillshade_size: Size of the layout whose extent is shaded, or None to not use any hillshade
+        :type hillshade_size: str
+        """
+        if hillshade_size and Hillshade.check_dtm_raster():
+            Hillshade(self.main_directory, hillshade_size).generate_hillshade()
+            return
+
+        for layer in self.project.mapLayersByName('ombra'):
+            self.project.removeMapLayer(layer.id())
+        QgsMessageLog.logMessage(f"No s'ha pogut generar l'ombra del municipi {self.municipality_id}. "
+                                 f"El Mapa municipal s'exporta sense ombra", level=Qgis.Warning)
+
+    def swap_map_layers_sources(self):
+        """
+        Swap the data source of the project's municipal map layers with the municipality layers
+
+        :return: Indicates if all the municipal map layers were in the project and have been swapped
+        :rtype: bool
+        """
+        project_layers = []
+        for layer in self.map_layers:
+            same_name_layers = self.project.mapLayersByName(layer.name())
+            if not same_name_layers:
+                return False
+            project_layers.append(same_name_layers[0])
+
+        for project_layer, layer in zip(project_layers, self.map_layers):
+            project_layer.setDataSource(layer.source(), layer.name(), layer.providerType())
+        # Work with the project layers from now on
+        self.polygon_layer, self.neighbor_lines_layer, self.lines_layer, self.place_name_layer, \
+            self.points_layer, self.neighbor_polygons_layer = project_layers
+        self.map_layers = project_layers
+
+        return True
+
+    def zoom_layouts_to_polygon_layer(self):
+        """ Zoom the map of every layout to the polygon layer """
+        extent = self.polygon_layer.extent()
+        for layout in self.layout_manager.printLayouts():
+            reference_map = layout.referenceMap()
+            if reference_map:
+                reference_map.zoomToExtent(extent)
+
+    def export_layouts(self):
+        """ Export every layout as a PDF file into the municipal map directory """
+        for layout in self.layout_manager.printLayouts():
+            exporter = QgsLayoutExporter(layout)
+            output = os.path.join(self.main_directory, f'{layout.name()}.pdf')
+            result = exporter.exportToPdf(output, QgsLayoutExporter.PdfExportSettings())
+            if result != QgsLayoutExporter.Success:
+                QgsMessageLog.logMessage(f"No s'ha pogut exportar la composició {layout.name()}", level=Qgis.Critical)
+
     def zoom_to_polygon_layer(self):
         """" Zoom the map canvas to the polygon layer """
         # The plugin only zooms correctly if previously exist layers in the map canvas
@@ -364,29 +375,8 @@ class MunicipalMap:
 
     def add_layers_styles(self):
         """ Add style to the newly added layers """
-        layers = self.project.mapLayers().values()
-        for layer in layers:
-            if layer.name() == 'MM_Poligons':
-                layer.loadNamedStyle(os.path.join(LAYOUT_MAPA_MUNICIPAL_STYLE_DIR, 'poligon.qml'))
-                layer.triggerRepaint()
-            elif layer.name() == 'MM_Fites':
-                layer.loadNamedStyle(os.path.join(LAYOUT_MAPA_MUNICIPAL_STYLE_DIR, 'fites.qml'))
-                layer.triggerRepaint()
-            elif layer.name() == 'MM_Lveines':
-                layer.loadNamedStyle(os.path.join(LAYOUT_MAPA_MUNICIPAL_STYLE_DIR, 'linies_veines.qml'))
-                layer.triggerRepaint()
-            elif layer.name() == 'MM_Linies':
-                layer.loadNamedStyle(os.path.join(LAYOUT_MAPA_MUNICIPAL_STYLE_DIR, 'linies.qml'))
-                layer.triggerRepaint()
-            elif layer.name() == 'MM_Municipisveins':
-                layer.loadNamedStyle(os.path.join(LAYOUT_MAPA_MUNICIPAL_STYLE_DIR, 'etiquetes_municipi_veins.qml'))
-                layer.triggerRepaint()
-            elif layer.name() == 'Nuclis':
-                layer.loadNamedStyle(os.path.join(LAYOUT_MAPA_MUNICIPAL_STYLE_DIR, 'nuclis.qml'))
-                layer.triggerRepaint()
-            elif layer.name() == 'Ombra':
-                layer.loadNamedStyle(os.path.join(LAYOUT_MAPA_MUNICIPAL_STYLE_DIR, 'ombra.qml'))
-                layer.triggerRepaint()
+        style_registry = StyleRegistry(LAYOUT_MAPA_MUNICIPAL_STYLE_DIR, MUNICIPAL_MAP_STYLES)
+        style_registry.apply_styles(self.project.mapLayers().values())
 
     def add_labeling_field(self):
         """ Add a labeling field to the points layer, in order to be able to move every point label """
@@ -552,12 +542,73 @@ class MunicipalMap:
         QgsMessageLog.logMessage('MTT copiades', level=Qgis.Info)
 
 
+class MunicipalMapBatch:
+    """ Municipal map batch rendering class """
+
+    def __init__(self,
+                 municipalities,
+                 iface,
+                 hillshade_size=None):
+        """
+        Constructor
+
+        :param municipalities: Dictionary with the municipality ID as key and its input directory as value
+        :type municipalities: dict
+
+        :param iface: An interface instance that will be passed to this class
+            which provides the hook by which you can manipulate the QGIS
+            application at run time.
+        :type iface: QgsInterface
+
+        :param hillshade_size: Size of the layout whose extent is shaded for every municipality, or None to export
+                               the layouts without the hillshade
+        :type hillshade_size: str
+        """
+        self.municipalities = municipalities
+        self.iface = iface
+        self.hillshade_size = hillshade_size
+        self.pg_adt = PgADTConnection(HOST, DBNAME, USER, PWD, SCHEMA)
+        self.pg_adt.connect()
+        self.line_documents = LineDocuments(self.pg_adt)
+        self.results = {}
+
+    def render_municipal_maps(self):
+        """
+        Entry point for rendering the Municipal map of every municipality
+
+        :return: Number of Municipal maps rendered without errors
+        :rtype: int
+        """
+        self.prefetch_line_documents()
+        for municipality_id, input_directory in self.municipalities.items():
+            try:
+                municipal_map = MunicipalMap(municipality_id, input_directory, self.iface, self.line_documents)
+                municipal_map.render_municipal_map(self.hillshade_size)
+                self.results[municipality_id] = True
+            except Exception as e:
+                QgsMessageLog.logMessage(f"No s'ha pogut generar el Mapa municipal del municipi {municipality_id} "
+                                         f"=> {e}", level=Qgis.Critical)
+                self.results[municipality_id] = False
+
+        return len([result for result in self.results.values() if result])
+
+    def prefetch_line_documents(self):
+        """ Fetch at once the documents of the lines of all the municipalities that have their lines layer """
+        line_list = []
+        for input_directory in self.municipalities.values():
+            lines_path = os.path.join(input_directory, 'ESRI/Shapefiles', 'MM_Linies.shp')
+            if os.path.exists(lines_path):
+                line_list.extend(MunicipalMap.read_municipality_lines(QgsVectorLayer(lines_path)))
+        self.line_documents.fetch(line_list)
+
+
 class Hillshade:
     """ Hillshade generation class """
 
     def __init__(self,
                  input_directory,
-                 size):
+                 size,
+                 windowed=True):
         """
         Constructor
 
@@ -566,6 +617,10 @@ class Hillshade:
 
         :param size: size of the layout where the class has to extract the hillshade
         :type: str
+
+        :param windowed: Indicates if the hillshade is computed with NumPy over windowed reads of the DTM or with
+                         the GDAL processing algorithms
+        :type windowed: bool
         """
         # ######
         # Initialize instance attributes
@@ -573,11 +628,14 @@ class Hillshade:
         self.project = QgsProject.instance()
         self.input_directory = input_directory
         self.size = size
+        self.windowed = windowed
         self.layout_name = self.get_layout_name()
         self.xmin, self.ymin, self.xmax, self.ymax = self.get_bounding_box()
         self.log_environment_variables()
         # Input depending variables
         self.output_directory = os.path.join(input_directory, 'ESRI')
+        self.hillshade_path = os.path.join(self.output_directory, 'ombra.tif')
+        self.cache_directory = os.path.join(TEMP_DIR, 'hillshade_cache')
 
     def log_environment_variables(self):
         """ Log as a MessageLog the environment variables of the DCD """
@@ -659,11 +717,79 @@ class Hillshade:
     # #######################
     # Generate the hillshade
     def generate_hillshade(self):
-        """ Generate the municipal map hillshade """
-        # Clip the DTM raster layer by the Municipal map extent
-        self.clip_raster()
-        # Generate the hillshade from the clipped raster and add it to the map
-        self.hillshade_raster()
+        """
+        Generate the municipal map hillshade. The hillshades are cached by extent, so an extent that has already
+        been shaded is copied from the cache instead of being computed again
+        """
+        cache_path = self.get_cache_path()
+        if os.path.exists(cache_path):
+            QgsMessageLog.logMessage("Ombra recuperada de la memòria cau", level=Qgis.Info)
+            shutil.copyfile(cache_path, self.hillshade_path)
+            # Mark the hillshade as recently used, so it's the last one to be evicted
+            os.utime(cache_path)
+            self.add_hillshade_layer()
+            return
+        if self.windowed:
+            # Shade only the bounding box window of the DTM and add it to the map
+            self.hillshade_window()
+            self.add_hillshade_layer()
+        else:
+            # Clip the DTM raster layer by the Municipal map extent
+            self.clip_raster()
+            # Generate the hillshade from the clipped raster and add it to the map
+            self.hillshade_raster()
+        # Cache the hillshade. The file is copied with a temporal name and then renamed, so concurrent runs never
+        # read a partially copied hillshade
+        os.makedirs(self.cache_directory, exist_ok=True)
+        temp_cache_path = f'{cache_path}.{os.getpid()}.{id(self)}.tmp'
+        shutil.copyfile(self.hillshade_path, temp_cache_path)
+        os.replace(temp_cache_path, cache_path)
+        self.evict_cache()
+
+    def get_cache_path(self):
+        """
+        Get the path of the cached hillshade of the bounding box. The cache key is a hash of the DTM raster source,
+        its modification time and size, the bounding box and the Z factor, so a change of any of them, including
+        replacing the DTM file, produces a different hillshade
+
+        :return: Path to the cached hillshade
+        :rtype: str
+        """
+        dtm_source = self.get_raster_layer().source()
+        dtm_stat = os.stat(dtm_source) if os.path.exists(dtm_source) else None
+        dtm_version = f'{dtm_stat.st_mtime}|{dtm_stat.st_size}' if dtm_stat else ''
+        key = f'{dtm_source}|{dtm_version}|{self.xmin:.2f}|{self.ymin:.2f}|{self.xmax:.2f}|{self.ymax:.2f}|' \
+              f'{HILLSHADE_Z_FACTOR}|{self.windowed}'
+        extent_hash = hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+        return os.path.join(self.cache_directory, f'ombra_{extent_hash}.tif')
+
+    def evict_cache(self):
+        """
+        Remove the cached hillshades that haven't been used for longer than the maximum age and, if the cache is
+        still bigger than its maximum size, the least recently used ones
+        """
+        now = time.time()
+        cached_files = []
+        for file_name in os.listdir(self.cache_directory):
+            if not (file_name.startswith('ombra_') and file_name.endswith('.tif')):
+                continue
+            file_path = os.path.join(self.cache_directory, file_name)
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                continue
+            cached_files.append((file_stat.st_mtime, file_stat.st_size, file_path))
+
+        cache_size = sum(file_size for _, file_size, _ in cached_files)
+        for file_mtime, file_size, file_path in sorted(cached_files):
+            if now - file_mtime <= HILLSHADE_CACHE_MAX_AGE and cache_size <= HILLSHADE_CACHE_MAX_SIZE:
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+            cache_size -= file_size
 
     def clip_raster(self):
         """ Clip the parent raster layer with the layout bounding box """
@@ -675,9 +801,8 @@ class Hillshade:
     def hillshade_raster(self):
         """ Generate the hillshade from the translated input raster """
         clip_raster = self.get_clip_layer()
-        output = os.path.join(self.output_directory, 'ombra.tif')
-        hillshade_parameters = {'INPUT': clip_raster, 'BAND': 1, 'Z_FACTOR': 4,
-                                'OUTPUT': output}
+        hillshade_parameters = {'INPUT': clip_raster, 'BAND': 1, 'Z_FACTOR': HILLSHADE_Z_FACTOR,
+                                'OUTPUT': self.hillshade_path}
         processing.runAndLoadResults('gdal:hillshade', hillshade_parameters)
 
         # Remove the clipped raster
@@ -687,6 +812,111 @@ class Hillshade:
         # Add style
         self.add_hillshade_style()
 
+    def hillshade_window(self):
+        """
+        Generate the hillshade reading only the bounding box window of the DTM, by strips of rows, and write it
+        directly as a compressed GeoTIFF
+        """
+        dtm = gdal.Open(self.get_raster_layer().source())
+        dtm_band = dtm.GetRasterBand(1)
+        nodata = dtm_band.GetNoDataValue()
+        x_origin, ew_res, _, y_origin, _, ns_res = dtm.GetGeoTransform()
+        # Window of the bounding box, in pixels of the DTM
+        col_off = max(int((self.xmin - x_origin) / ew_res), 0)
+        row_off = max(int((self.ymax - y_origin) / ns_res), 0)
+        col_end = min(int(np.ceil((self.xmax - x_origin) / ew_res)), dtm.RasterXSize)
+        row_end = min(int(np.ceil((self.ymin - y_origin) / ns_res)), dtm.RasterYSize)
+        cols, rows = col_end - col_off, row_end - row_off
+
+        driver = gdal.GetDriverByName('GTiff')
+        hillshade = driver.Create(self.hillshade_path, cols, rows, 1, gdal.GDT_Byte,
+                                  options=['COMPRESS=DEFLATE', 'TILED=YES'])
+        hillshade.SetGeoTransform((x_origin + col_off * ew_res, ew_res, 0,
+                                   y_origin + row_off * ns_res, 0, ns_res))
+        hillshade.SetProjection(dtm.GetProjection())
+        hillshade_band = hillshade.GetRasterBand(1)
+        hillshade_band.SetNoDataValue(0)
+
+        # Read one extra pixel around every strip, when the DTM has it, for the 3x3 kernel
+        read_col_off, read_col_end = max(col_off - 1, 0), min(col_end + 1, dtm.RasterXSize)
+        for strip_off in range(row_off, row_end, HILLSHADE_STRIP_ROWS):
+            strip_end = min(strip_off + HILLSHADE_STRIP_ROWS, row_end)
+            read_row_off, read_row_end = max(strip_off - 1, 0), min(strip_end + 1, dtm.RasterYSize)
+            dem = dtm_band.ReadAsArray(read_col_off, read_row_off, read_col_end - read_col_off,
+                                       read_row_end - read_row_off).astype(np.float64)
+            # Replicate the edge pixels where the DTM doesn't have the extra pixel
+            dem = np.pad(dem, ((int(read_row_off == strip_off), int(read_row_end == strip_end)),
+                               (int(read_col_off == col_off), int(read_col_end == col_end))), mode='edge')
+            shaded = self.compute_hillshade(dem, ew_res, abs(ns_res), nodata)
+            hillshade_band.WriteArray(shaded, 0, strip_off - row_off)
+
+        hillshade_band.FlushCache()
+        hillshade, dtm = None, None
+        QgsMessageLog.logMessage(f'Ombra generada: {cols}x{rows} píxels', level=Qgis.Info)
+
+    @staticmethod
+    def compute_hillshade(dem, ew_res, ns_res, nodata=None):
+        """
+        Compute the hillshade of an elevation array with the Horn's method, as gdaldem does
+
+        :param dem: Elevation array, with an extra pixel on every side
+        :type dem: numpy.ndarray
+
+        :param ew_res: East-west resolution of the elevation array
+        :type ew_res: float
+
+        :param ns_res: North-south resolution of the elevation array
+        :type ns_res: float
+
+        :param nodata: Nodata value of the elevation array
+        :type nodata: float
+
+        :return: Hillshade array, from 1 to 255 and 0 as nodata, without the extra pixels
+        :rtype: numpy.ndarray
+        """
+        a, b, c = dem[:-2, :-2], dem[:-2, 1:-1], dem[:-2, 2:]
+        d, f = dem[1:-1, :-2], dem[1:-1, 2:]
+        g, h, i = dem[2:, :-2], dem[2:, 1:-1], dem[2:, 2:]
+        dz_dx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * ew_res)
+        dz_dy = ((g + 2 * h + i) - (a + 2 * b + c)) / (8 * ns_res)
+
+        azimuth = np.radians(HILLSHADE_AZIMUTH)
+        altitude = np.radians(HILLSHADE_ALTITUDE)
+        z_factor = HILLSHADE_Z_FACTOR
+        cang = (np.sin(altitude) + (dz_dy * np.cos(azimuth) * np.cos(altitude) * z_factor -
+                                    dz_dx * np.sin(azimuth) * np.cos(altitude) * z_factor)) / \
+            np.sqrt(1 + z_factor ** 2 * (dz_dx ** 2 + dz_dy ** 2))
+        shaded = np.where(cang <= 0, 1, 1 + 254 * cang)
+
+        if nodata is not None:
+            nodata_window = dem == nodata
+            nodata_mask = np.zeros(shaded.shape, dtype=bool)
+            for row in range(3):
+                for col in range(3):
+                    nodata_mask |= nodata_window[row:row + shaded.shape[0], col:col + shaded.shape[1]]
+            shaded[nodata_mask] = 0
+
+        # Round to the nearest value, as gdaldem does when it writes the Byte output
+        return np.floor(shaded + 0.5).astype(np.uint8)
+
+    def add_hillshade_layer(self):
+        """
+        Add the hillshade raster to the map as the basemap. If the map already has a hillshade, its data source is
+        swapped with the new hillshade
+        """
+        hillshade_layers = self.project.mapLayersByName('ombra')
+        if hillshade_layers:
+            hillshade_layers[0].setDataSource(self.hillshade_path, 'ombra', 'gdal')
+            for layer in hillshade_layers[1:]:
+                self.project.removeMapLayer(layer.id())
+            hillshade_layers[0].triggerRepaint()
+            return
+        self.project.addMapLayer(QgsRasterLayer(self.hillshade_path, 'ombra'))
+        # Append the hillshade raster as the last item, in order to see it as the basemap
+        self.rearrange_tree_of_contents()
+        # Add style
+        self.add_hillshade_style()
+
     def rearrange_tree_of_contents(self):
         """ Rearrange the project's tree of contents and add the hillshade raster as the last item """
         hillshade = self.get_hillshade_layer()
@@ -700,5 +930,5 @@ class Hillshade:
     def add_hillshade_style(self, ):
         """ Add style to the hillshade layer """
         hillshade = self.get_hillshade_layer()
-        hillshade.loadNamedStyle(os.path.join(LAYOUT_MAPA_MUNICIPAL_STYLE_DIR, 'ombra.qml'))
-        hillshade.triggerRepaint()
+        style_registry = StyleRegistry(LAYOUT_MAPA_MUNICIPAL_STYLE_DIR, {hillshade.name(): 'ombra.qml'})
+        style_registry.apply_styles([hillshade])
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the PointGridIndex class is defined. The main function
+of this class is to find, in constant time per query, the indexed point that
+is within a tolerance of a given coordinate. The points are hashed into a
+regular grid whose cell size is the tolerance, so only the 3x3 neighbor cells
+have to be checked.
+***************************************************************************/
+"""
+
+import math
+
+import numpy as np
+
+
+class PointGridIndex:
+    """ Grid hash index of points """
+
+    def __init__(self, tolerance):
+        """
+        Constructor
+
+        :param tolerance: Maximum distance, in meters, between two coincident points
+        :type tolerance: float
+        """
+        self.tolerance = tolerance
+        self.cells = {}
+
+    def get_cell(self, x, y):
+        """
+        Get the grid cell of a coordinate
+
+        :param x: X coordinate
+        :type x: float
+
+        :param y: Y coordinate
+        :type y: float
+
+        :return: Column and row of the cell
+        :rtype: tuple
+        """
+        return math.floor(x / self.tolerance), math.floor(y / self.tolerance)
+
+    def add(self, x, y, value):
+        """
+        Add a point to the index
+
+        :param x: X coordinate
+        :type x: float
+
+        :param y: Y coordinate
+        :type y: float
+
+        :param value: Value returned when the point is found, as the point's ID
+        """
+        self.cells.setdefault(self.get_cell(x, y), []).append((x, y, value))
+
+    def add_array(self, coords, values):
+        """
+        Add several points to the index at once
+
+        :param coords: Array with a X, Y row for every point
+        :type coords: numpy.ndarray
+
+        :param values: Value of every point
+        :type values: list
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        cells = np.floor(coords / self.tolerance).astype(np.int64)
+        for (col, row), (x, y), value in zip(cells.tolist(), coords.tolist(), values):
+            self.cells.setdefault((col, row), []).append((x, y, value))
+
+    def nearest(self, x, y):
+        """
+        Get the nearest indexed point within the tolerance of the given coordinate
+
+        :param x: X coordinate
+        :type x: float
+
+        :param y: Y coordinate
+        :type y: float
+
+        :return: Value of the nearest point, or None if there isn't any within the tolerance
+        """
+        col, row = self.get_cell(x, y)
+        nearest_value, nearest_distance = None, self.tolerance
+        for neighbor_col in (col - 1, col, col + 1):
+            for neighbor_row in (row - 1, row, row + 1):
+                for point_x, point_y, value in self.cells.get((neighbor_col, neighbor_row), ()):
+                    distance = math.hypot(point_x - x, point_y - y)
+                    if distance <= nearest_distance:
+                        nearest_value, nearest_distance = value, distance
+
+        return nearest_value
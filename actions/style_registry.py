@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the StyleRegistry class is defined. The main function
+of this class is to read and parse the QML style files only once and import
+the parsed documents into the layers that need them.
+***************************************************************************/
+"""
+
+import os
+
+from qgis.core import (QgsMessageLog,
+                       Qgis)
+from PyQt5.QtXml import QDomDocument
+
+# Parsed styles, shared between all the registry instances of the session and keyed by the QML path
+_PARSED_STYLES = {}
+
+
+class ParsedStyle:
+    """ Style parsed from a QML file """
+
+    def __init__(self, qml_path):
+        """
+        Constructor
+
+        :param qml_path: Path to the QML style file
+        :type qml_path: str
+        """
+        self.qml_path = qml_path
+        self.document = QDomDocument()
+        self.parse()
+
+    def parse(self):
+        """ Read and parse the QML file into a DOM document """
+        with open(self.qml_path, encoding='utf-8') as f:
+            self.document.setContent(f.read())
+
+    def apply(self, layer):
+        """
+        Apply the parsed style to the given layer, importing the whole parsed QML document so every property of the
+        style, as the renderer, labeling, opacity, blend mode, scale visibility, field configuration or diagrams, is
+        applied
+
+        :param layer: Layer to apply the style
+        :type layer: QgsMapLayer
+        """
+        layer.importNamedStyle(self.document)
+        layer.triggerRepaint()
+
+
+class StyleRegistry:
+    """ Layer styles registry class """
+
+    def __init__(self, style_dir, styles):
+        """
+        Constructor
+
+        :param style_dir: Directory where the QML style files are located
+        :type style_dir: str
+
+        :param styles: Dictionary with the layer name as key and the QML file name as value
+        :type styles: dict
+        """
+        self.style_dir = style_dir
+        self.styles = styles
+
+    def get_style(self, qml_name):
+        """
+        Get the parsed style of the given QML file, parsing it only the first time it is requested
+
+        :param qml_name: Name of the QML style file
+        :type qml_name: str
+
+        :return: Parsed style
+        :rtype: ParsedStyle
+        """
+        qml_path = os.path.join(self.style_dir, qml_name)
+        if qml_path not in _PARSED_STYLES:
+            _PARSED_STYLES[qml_path] = ParsedStyle(qml_path)
+
+        return _PARSED_STYLES[qml_path]
+
+    def apply_styles(self, layers):
+        """
+        Apply the registered style to every given layer which name is in the registry
+
+        :param layers: Layers to style
+        :type layers: list
+        """
+        for layer in layers:
+            qml_name = self.styles.get(layer.name())
+            if not qml_name:
+                continue
+            try:
+                self.get_style(qml_name).apply(layer)
+            except OSError as e:
+                QgsMessageLog.logMessage(f"No s'ha pogut carregar l'estil {qml_name} => {e}", level=Qgis.Critical)
+
+
+def clear_parsed_styles():
+    """ Remove all the parsed styles, forcing the QML files to be parsed again """
+    _PARSED_STYLES.clear()
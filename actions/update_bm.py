@@ -10,25 +10,32 @@ of Catalonia with the newest boundary lines.
 """
 
 import datetime
+import json
 import os
 
 from qgis.core import (QgsVectorLayer,
                        QgsVectorFileWriter,
+                       QgsFeatureRequest,
                        QgsCoordinateReferenceSystem,
+                       QgsCoordinateTransform,
+                       QgsProject,
                        QgsGeometry,
                        QgsMessageLog,
                        Qgis,
                        QgsProcessingFeatureSourceDefinition,
                        QgsExpression)
-from qgis.core.additions.edit import edit
 from PyQt5.QtWidgets import QMessageBox
 
-import processing
-
 from ..config import *
 from .adt_postgis_connection import PgADTConnection
+from .workspace import Workspace
+
+from ..utils import in_list_filter, get_features_by_in_list
 
-from ..utils import remove_temp_shapefiles
+# Source tables of the new documents, whose watermarks are kept in the journal
+UPDATE_BM_SOURCE_TABLES = ('replantejament', 'memoria_treb_top')
+# Maximum number of runs kept in the journal
+UPDATE_BM_JOURNAL_MAX_RUNS = 100
 
 # 202102011500
 # 202107011400
@@ -39,23 +46,28 @@ from ..utils import remove_temp_shapefiles
 class UpdateBM:
     """ Update BM-5M class """
 
-    def __init__(self, date_last_update):
+    def __init__(self, date_last_update, incremental=False):
         # Initialize instance attributes
         # Common
         self.date_last_update = date_last_update
+        self.incremental = incremental
         self.crs = QgsCoordinateReferenceSystem("EPSG:25831")
         # ADT PostGIS connection
         self.pg_adt = PgADTConnection(HOST, DBNAME, USER, PWD, SCHEMA)
         self.pg_adt.connect()
+        # Journal config
+        self.journal = self.read_journal()
+        self.new_watermarks = {}
         # Get current datetime and add 1 hour
         self.new_data_alta = self.get_new_data_alta()
-        self.date_last_update_tr = self.convert_str_to_date()
+        # The incremental update starts from the journal's watermarks, so the date is not needed
+        self.date_last_update_tr = None if self.uses_watermarks() else self.convert_str_to_date()
         # Paths and layers
         # Set input layers
         self.lines_input_path = os.path.join(UPDATE_BM_INPUT_DIR, 'bm5mv21sh0tlm1_ACTUAL_0.shp')
         self.lines_input_layer = QgsVectorLayer(self.lines_input_path)
-        # Set work layers
-        self.lines_work_path = os.path.join(UPDATE_BM_WORK_DIR, 'bm5mv21sh0tlm1_WORK_0.shp')
+        # Set work layers. The work path is set in the run's scratch workspace
+        self.lines_work_path = None
         self.lines_work_layer = None
         # Set output layer's path
         self.lines_output_path = os.path.join(UPDATE_BM_OUTPUT_DIR, 'bm5mv21sh0tlm1_NEW_0.shp')
@@ -76,9 +88,11 @@ class UpdateBM:
     def get_new_rep(self):
         """ Return the new Rep lines since the last update """
         rep_table = self.pg_adt.get_table('replantejament')
-        rep_table.selectByExpression(f'"data_doc" > \'{self.date_last_update_tr}\' and "data_doc" != \'9999-12-31\'')
+        rep_table.selectByExpression(self.get_data_doc_expression('replantejament'))
 
         for rep in rep_table.getSelectedFeatures():
+            if not self.register_doc('replantejament', rep):
+                continue
             line_id = rep['id_linia']
             if rep['abast_rep'] == '1':
                 self.new_rep_parcial_list.append(int(line_id))
@@ -91,10 +105,12 @@ class UpdateBM:
 
     def get_new_mtt(self):
         """ Return the new MTT lines since the last update """
-        mtt_table = self.pg_adt.get_table('memoria_treb_top')
-        mtt_table.selectByExpression(f'"data_doc" > \'{self.date_last_update_tr}\' and "data_doc" != \'9999-12-31\'')
+        mtt_table = self.pg_adt.get_cached_table('memoria_treb_top')
+        mtt_table.selectByExpression(self.get_data_doc_expression('memoria_treb_top'))
 
         for mtt in mtt_table.getSelectedFeatures():
+            if not self.register_doc('memoria_treb_top', mtt):
+                continue
             line_id = mtt['id_linia']
             if mtt['abast_mtt'] == '1':
                 self.new_mtt_parcial_list.append(int(line_id))
@@ -105,10 +121,9 @@ class UpdateBM:
         if self.new_mtt_parcial_list:
             QgsMessageLog.logMessage(f'Noves MTT parcials o on falten trams per definir: {", ".join(map(str, self.new_mtt_parcial_list))}', level=Qgis.Info)
 
-    @staticmethod
-    def get_lines_geometry(lines_list, layer_type):
+    def get_lines_geometry(self, lines_list, layer_type):
         """
-        Get the new geometry of every new boundary line
+        Get the new geometry of every new boundary line, dissolving in memory the line's trams from the database
 
         :param lines_list: list of the new lines ID
         :type lines_list: list
@@ -119,38 +134,31 @@ class UpdateBM:
         :return: dict with the geometry of every new line
         :rtype: dict
         """
+        if not lines_list:
+            return {}
         if layer_type == 'rep':
-            layer = QgsVectorLayer(os.path.join(UPDATE_BM_WORK_DIR, 'REP_dissolved_temp.shp'))
+            layer = self.pg_adt.get_layer('v_tram_linia_rep', 'id_tram_linia')
         elif layer_type == 'mtt':
-            layer = QgsVectorLayer(os.path.join(UPDATE_BM_WORK_DIR, 'MTT_dissolved_temp.shp'))
-
+            layer = self.pg_adt.get_layer('v_tram_linia_mem', 'id_tram_linia')
+
+        transform = None
+        if layer.crs() != self.crs:
+            transform = QgsCoordinateTransform(layer.crs(), self.crs, QgsProject.instance())
+        # Group the line's trams by line ID
+        trams_geom_dict = {}
+        request = QgsFeatureRequest().setSubsetOfAttributes(['id_linia'], layer.fields())
+        for tram in get_features_by_in_list(layer, 'id_linia', lines_list, request):
+            tram_geom = tram.geometry()
+            if transform:
+                tram_geom.transform(transform)
+            trams_geom_dict.setdefault(int(tram['id_linia']), []).append(tram_geom)
+        # Dissolve the trams of every line, as the native dissolve algorithm does
         line_geom_dict = {}
-        for line_id in lines_list:
-            layer.selectByExpression(f'"id_linia"={line_id}')
-            for line in layer.getSelectedFeatures():
-                line_geom = line.geometry()
-                line_geom_dict[line_id] = line_geom
+        for line_id, trams_geom in trams_geom_dict.items():
+            line_geom_dict[line_id] = QgsGeometry.unaryUnion(trams_geom).mergeLines()
 
         return line_geom_dict
 
-    @staticmethod
-    def get_expression(lines_list):
-        """
-        Return a QGIS expression with the given lines ID
-
-        :param lines_list: list of the new lines ID
-        :type lines_list: list
-
-        :return: QGIS expression to filter by the new lines ID
-        :rtype: str
-        """
-        expression = f'"id_linia"={lines_list[0]}'
-
-        for id_linia in lines_list[1:]:
-            expression = f'{expression} OR "id_linia"={id_linia}'
-
-        return expression
-
     # ####################
     # Date and time management
     @staticmethod
@@ -182,107 +190,97 @@ class UpdateBM:
 
     # ####################
     # Data management
-    def copy_data_to_work(self):
-        """ Copy the input data to the working environment """
+    def copy_data_to_work(self, workspace):
+        """
+        Copy the input data to the working environment
+
+        :param workspace: Scratch workspace of the run
+        :type workspace: Workspace
+        """
+        self.lines_work_path = workspace.get_path('bm5mv21sh0tlm1_WORK_0.shp')
         QgsVectorFileWriter.writeAsVectorFormat(self.lines_input_layer, self.lines_work_path, 'utf-8', self.crs,
                                                 'ESRI Shapefile')
 
         self.lines_work_layer = QgsVectorLayer(self.lines_work_path)
 
-    def copy_sidm3_to_work(self):
+    def update_new_lines(self):
         """
-        Copy the new lines geometries from the database to the working environment. Only copies the selected
-        lines that are ready for updating
+        Endpoint to update the new lines geometries and attributes. The work layer is read only once, filtering
+        the lines to update, and all the changes are written with a single provider call for the geometries and
+        another one for the attributes
         """
-        key = 'id_tram_linia'
+        lines_updates = {}
+        lines_updates.update(self.get_new_lines_updates(self.new_rep_list, 'rep', 1))
+        # The MTT updates are set after the REP ones, so they prevail if a line has both
+        lines_updates.update(self.get_new_lines_updates(self.new_mtt_list, 'mtt', 2))
+        if not lines_updates:
+            QgsMessageLog.logMessage("No hi ha cap línia per actualitzar", level=Qgis.Info)
+            return
 
-        # REP
-        rep_layer = self.pg_adt.get_layer('v_tram_linia_rep', key)
-        expression_rep = self.get_expression(self.new_rep_list)
-        rep_layer.selectByExpression(expression_rep)
-        rep_path = os.path.join(UPDATE_BM_WORK_DIR, 'REP_noves_linies.shp')
-        QgsVectorFileWriter.writeAsVectorFormat(rep_layer, rep_path, 'utf-8', self.crs,
-                                                'ESRI Shapefile', onlySelected=True)
-        rep_layer.removeSelection()
+        fields = self.lines_work_layer.fields()
+        id_estat = fields.indexFromName('ESTAT')
+        id_data_alta = fields.indexFromName('DATAALTA')
+        request = QgsFeatureRequest().setFilterExpression(in_list_filter('IDLINIA', list(lines_updates)))
+        request.setSubsetOfAttributes(['IDLINIA'], fields)
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+
+        geometry_map, attr_map = {}, {}
+        for line in self.lines_work_layer.getFeatures(request):
+            new_line_geom, estat = lines_updates[int(line['IDLINIA'])]
+            geometry_map[line.id()] = new_line_geom
+            attr_map[line.id()] = {id_estat: estat, id_data_alta: self.new_data_alta}
+
+        provider = self.lines_work_layer.dataProvider()
+        provider.changeGeometryValues(geometry_map)
+        provider.changeAttributeValues(attr_map)
+        QgsMessageLog.logMessage(f'Trams de la BM actualitzats: {len(geometry_map)}', level=Qgis.Info)
+
+    def get_new_lines_updates(self, lines_list, line_type, estat):
+        """
+        Get the new geometry and state of every new line of the given type
 
-        # MTT
-        mtt_layer = self.pg_adt.get_layer('v_tram_linia_mem', key)
-        expression_mtt = self.get_expression(self.new_mtt_list)
-        mtt_layer.selectByExpression(expression_mtt)
-        mtt_path = os.path.join(UPDATE_BM_WORK_DIR, 'MTT_noves_linies.shp')
-        QgsVectorFileWriter.writeAsVectorFormat(mtt_layer, mtt_path, 'utf-8', self.crs,
-                                                'ESRI Shapefile', onlySelected=True)
-        mtt_layer.removeSelection()
+        :param lines_list: list of the new lines ID
+        :type lines_list: list
 
-    @staticmethod
-    def dissolve_line_trams(line_layer, line_type):
+        :param line_type: type of the lines layers. Could be 'rep' or 'mtt'
+        :type line_type: str
+
+        :param estat: state of the updated lines. 1 for REP and 2 for MTT
+        :type estat: int
+
+        :return: dict with the line ID as key and a tuple with the new geometry and state as value
+        :rtype: dict
         """
-        Use the QGIS native dissolve algorithm to dissolve the lines layer by line ID
+        # Get a dict with the new lines's geometry and its ID
+        lines_geom = self.get_lines_geometry(lines_list, line_type)
 
-        :param line_layer: name of the layer to dissolve
-        :type line_layer: str
+        return {line_id: (line_geom, estat) for line_id, line_geom in lines_geom.items()}
 
-        :param line_type: type of the lines layers. Could be 'REP' or 'MTT'
-        :type line_type: str
+    def set_output_as_work(self):
         """
-        params = {'INPUT': line_layer, 'FIELD': ['id_linia'],
-                  'OUTPUT': os.path.join(UPDATE_BM_WORK_DIR, f'{line_type}_dissolved_temp.shp')}
-        processing.run("native:dissolve", params)
+        Set the output lines layer as the working layer, in order to patch it in place. The input data is only
+        copied to the output the first time or when the input layer has been replaced since the last update
+        """
+        if not os.path.exists(self.lines_output_path) or self.journal.get('input') != self.get_input_stamp():
+            QgsMessageLog.logMessage("Copiant la capa de línies d'entrada a la sortida...", level=Qgis.Info)
+            QgsVectorFileWriter.writeAsVectorFormat(self.lines_input_layer, self.lines_output_path, 'utf-8', self.crs,
+                                                    'ESRI Shapefile')
+        self.lines_work_layer = QgsVectorLayer(self.lines_output_path)
 
-    def update_new_lines(self):
-        """ Endpoint to update the new lines geometries and attributes """
-        self.update_new_rep()
-        self.update_new_mtt()
-
-    def update_new_rep(self):
-        """ Update the geometries and attributes of the new REP lines """
-        new_rep_lines_layer = QgsVectorLayer(os.path.join(UPDATE_BM_WORK_DIR, 'REP_noves_linies.shp'))
-        # Dissolve the replantejament's lines layer
-        self.dissolve_line_trams(new_rep_lines_layer, 'REP')
-        # Get a dict with the new lines's geometry and its ID
-        rep_lines_geom = self.get_lines_geometry(self.new_rep_list, 'rep')
-
-        with edit(self.lines_work_layer):
-            for line in self.lines_work_layer.getFeatures():
-                line_id = line['IDLINIA']
-                if line_id in self.new_rep_list and line_id in rep_lines_geom:
-                    new_line_geom = rep_lines_geom[line_id]
-                    self.lines_work_layer.changeGeometry(line.id(), new_line_geom)
-
-        # Loop again to update attributes
-        # It seems not compatible to update the geometry and the attributes in the same loop
-        with edit(self.lines_work_layer):
-            for line in self.lines_work_layer.getFeatures():
-                line_id = line['IDLINIA']
-                if line_id in self.new_rep_list and line_id in rep_lines_geom:
-                    line['ESTAT'] = 1
-                    line['DATAALTA'] = self.new_data_alta
-                    self.lines_work_layer.updateFeature(line)
-
-    def update_new_mtt(self):
-        """ Update the geometries and the attributes of the new MTT lines """
-        new_mtt_lines_layer = QgsVectorLayer(os.path.join(UPDATE_BM_WORK_DIR, 'MTT_noves_linies.shp'))
-        # Dissolve the replantejament's lines layer
-        self.dissolve_line_trams(new_mtt_lines_layer, 'MTT')
-        # Get a dict with the new lines's geometry and its ID
-        mtt_lines_geom = self.get_lines_geometry(self.new_mtt_list, 'mtt')
-
-        with edit(self.lines_work_layer):
-            for line in self.lines_work_layer.getFeatures():
-                line_id = line['IDLINIA']
-                if line_id in self.new_mtt_list and line_id in mtt_lines_geom:
-                    new_line_geom = mtt_lines_geom[line_id]
-                    self.lines_work_layer.changeGeometry(line.id(), new_line_geom)
-
-        # Loop again to update attributes.
-        # It seems not compatible to update the geometry and the attributes in the same loop
-        with edit(self.lines_work_layer):
-            for line in self.lines_work_layer.getFeatures():
-                line_id = line['IDLINIA']
-                if line_id in self.new_mtt_list and line_id in mtt_lines_geom:
-                    line['ESTAT'] = 2
-                    line['DATAALTA'] = self.new_data_alta
-                    self.lines_work_layer.updateFeature(line)
+    def get_input_stamp(self):
+        """
+        Get the modification time and size of the input lines layer's files, to know if the layer has been replaced
+
+        :return: List with the modification time and size of the layer's geometries and attributes files
+        :rtype: list
+        """
+        stamp = []
+        for path in (self.lines_input_path, f'{os.path.splitext(self.lines_input_path)[0]}.dbf'):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                stamp.append([stat.st_mtime, stat.st_size])
+
+        return stamp
 
     def export_lines_layer(self):
         """ Export the working lines layer as the output lines layer, with all the updated data """
@@ -301,16 +299,21 @@ class UpdateBM:
         self.get_new_lines()
         self.write_report()
         try:
-            self.copy_data_to_work()
-            self.copy_sidm3_to_work()
-            self.update_new_lines()
-            self.export_lines_layer()
+            if self.incremental:
+                self.set_output_as_work()
+                self.update_new_lines()
+            else:
+                with Workspace(UPDATE_BM_WORK_DIR, 'update-bm-') as workspace:
+                    self.copy_data_to_work(workspace)
+                    self.update_new_lines()
+                    self.export_lines_layer()
+                    self.lines_work_layer = None   # Release the work layer, so the workspace can remove its files
+            self.write_journal()
         except Exception as e:
             msg = f"-- ATENCIÓ -- El procés d'actualització no s'ha dut a terme correctament -- {e}"
             QgsMessageLog.logMessage(msg, level=Qgis.Warning)
             with open(self.report_path, 'a+') as f:
                 f.write(msg)
-        remove_temp_shapefiles(UPDATE_BM_WORK_DIR)
 
         return self.new_data_alta   # Return the new date as the key variable that allows the module to open the report
 
@@ -326,6 +329,9 @@ class UpdateBM:
         input_layers = self.check_input_lines_layer()
         if not input_layers:
             return
+        # The incremental update starts from the journal's watermarks, so the date is not needed
+        if self.uses_watermarks():
+            return True
         date_last_update_ok = self.check_date_last_update_inputs()
         if not date_last_update_ok:
             return
@@ -366,6 +372,125 @@ class UpdateBM:
         else:
             return True
 
+    # #####################
+    # Journal management
+    @staticmethod
+    def get_journal_path():
+        """
+        Return the path of the journal of the updates
+
+        :return: path of the journal
+        :rtype: str
+        """
+        return os.path.join(UPDATE_BM_LOG_DIR, 'BM_update_journal.json')
+
+    @staticmethod
+    def read_journal():
+        """
+        Read the journal of the previous updates. The journal keeps, for every source table, the latest processed
+        data_doc as watermark and the documents of that date that have already been processed, and the modification
+        time and size of the input lines layer the output was copied from
+
+        :return: journal of the previous updates
+        :rtype: dict
+        """
+        journal_path = UpdateBM.get_journal_path()
+        if os.path.exists(journal_path):
+            with open(journal_path, encoding='utf-8') as f:
+                return json.load(f)
+
+        return {'sources': {}, 'runs': []}
+
+    @staticmethod
+    def has_watermarks(journal):
+        """
+        Check if the journal has the watermark of every source table, so an incremental update doesn't need the
+        last update date
+
+        :param journal: journal of the previous updates
+        :type journal: dict
+
+        :return: boolean that means if the journal has the watermark of every source table or not
+        :rtype: bool
+        """
+        return all(table_name in journal['sources'] for table_name in UPDATE_BM_SOURCE_TABLES)
+
+    def uses_watermarks(self):
+        """
+        Check if the update starts from the journal's watermarks instead of the last update date
+
+        :return: boolean that means if the update starts from the journal's watermarks or not
+        :rtype: bool
+        """
+        return self.incremental and self.has_watermarks(self.journal)
+
+    def get_data_doc_expression(self, table_name):
+        """
+        Return the QGIS expression that selects the new documents of the given source table. The incremental update
+        selects the documents since the table's watermark, and the full update the ones since the last update date
+
+        :param table_name: name of the source table. Could be 'replantejament' or 'memoria_treb_top'
+        :type table_name: str
+
+        :return: QGIS expression to filter the new documents
+        :rtype: str
+        """
+        source = self.journal['sources'].get(table_name)
+        if self.incremental and source:
+            return f'"data_doc" >= \'{source["watermark"]}\' and "data_doc" != \'9999-12-31\''
+
+        return f'"data_doc" > \'{self.date_last_update_tr}\' and "data_doc" != \'9999-12-31\''
+
+    def register_doc(self, table_name, doc):
+        """
+        Register a new document in order to update the table's watermark when the update finishes
+
+        :param table_name: name of the source table. Could be 'replantejament' or 'memoria_treb_top'
+        :type table_name: str
+
+        :param doc: document of the source table
+        :type doc: QgsFeature
+
+        :return: boolean that means if the document is new or it has already been processed in a previous update
+        :rtype: bool
+        """
+        data_doc = doc['data_doc']
+        data_doc = data_doc.toString('yyyy-MM-dd') if hasattr(data_doc, 'toString') else str(data_doc)
+        doc_key = f'{int(doc["id_linia"])}_{data_doc}'
+        source = self.journal['sources'].get(table_name)
+        if self.incremental and source and data_doc == source['watermark'] and doc_key in source['processed']:
+            return False
+
+        watermark, processed = self.new_watermarks.get(table_name, ('', []))
+        if data_doc > watermark:
+            watermark, processed = data_doc, []
+        if data_doc == watermark:
+            processed.append(doc_key)
+        self.new_watermarks[table_name] = (watermark, processed)
+
+        return True
+
+    def write_journal(self):
+        """ Write the new watermarks, the input lines layer's stamp and the updated lines into the journal """
+        for table_name, (watermark, processed) in self.new_watermarks.items():
+            source = self.journal['sources'].get(table_name)
+            if source and source['watermark'] == watermark:
+                processed = sorted(set(source['processed'] + processed))
+            elif source and source['watermark'] > watermark:
+                continue
+            self.journal['sources'][table_name] = {'watermark': watermark, 'processed': processed}
+        # Both the full and the incremental updates leave the output matching the current input lines layer
+        self.journal['input'] = self.get_input_stamp()
+        self.journal['runs'].append({'data_alta': self.new_data_alta,
+                                     'incremental': self.incremental,
+                                     'rep': self.new_rep_list,
+                                     'mtt': self.new_mtt_list})
+        # Keep only the latest runs, so the journal doesn't grow forever
+        self.journal['runs'] = self.journal['runs'][-UPDATE_BM_JOURNAL_MAX_RUNS:]
+
+        with open(self.get_journal_path(), 'w', encoding='utf-8') as f:
+            json.dump(self.journal, f, indent=2)
+
     # #####################
     # Report management
     def write_report(self):
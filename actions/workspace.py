@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the Workspace class is defined. The main function
+of this class is to allocate a unique scratch directory for every run of
+an action and to remove it when the run finishes, so several runs can be
+executed at the same time without overwriting each other's temporal files.
+***************************************************************************/
+"""
+
+import os
+import shutil
+import tempfile
+
+from qgis.core import (QgsMessageLog,
+                       Qgis)
+
+# Memory backed file system used for the scratch directories when it's available
+WORKSPACE_TMPFS_DIR = '/dev/shm'
+
+
+class Workspace:
+    """ Per run scratch workspace class """
+
+    def __init__(self, base_dir, prefix, use_tmpfs=True):
+        """
+        Constructor
+
+        :param base_dir: Directory where the scratch directory is created if there isn't a tmpfs available
+        :type base_dir: str
+
+        :param prefix: Prefix of the scratch directory name
+        :type prefix: str
+
+        :param use_tmpfs: Indicates if the scratch directory has to be created in a tmpfs when it's available
+        :type use_tmpfs: bool
+        """
+        self.base_dir = base_dir
+        self.prefix = prefix
+        self.use_tmpfs = use_tmpfs
+        self.path = None
+
+    def __enter__(self):
+        """
+        Create the scratch directory
+
+        :return: Workspace with its scratch directory created
+        :rtype: Workspace
+        """
+        root_dir = self.get_root_dir()
+        os.makedirs(root_dir, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=self.prefix, dir=root_dir)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ Remove the scratch directory, whether the run has finished correctly or not """
+        self.cleanup()
+
+    def get_root_dir(self):
+        """
+        Get the directory where the scratch directory is created
+
+        :return: Path to the tmpfs if it can be used, or the base directory if not
+        :rtype: str
+        """
+        if self.use_tmpfs and os.path.isdir(WORKSPACE_TMPFS_DIR) and os.access(WORKSPACE_TMPFS_DIR, os.W_OK):
+            return WORKSPACE_TMPFS_DIR
+
+        return self.base_dir
+
+    def get_path(self, file_name):
+        """
+        Get the path of a file inside the scratch directory
+
+        :param file_name: Name of the file
+        :type file_name: str
+
+        :return: Path to the file
+        :rtype: str
+        """
+        return os.path.join(self.path, file_name)
+
+    def cleanup(self):
+        """ Remove the scratch directory and all its files """
+        if not self.path:
+            return
+        shutil.rmtree(self.path, ignore_errors=True)
+        if os.path.exists(self.path):
+            QgsMessageLog.logMessage(f"No s'ha pogut esborrar el directori temporal {self.path}", level=Qgis.Warning)
+        self.path = None
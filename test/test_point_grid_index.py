@@ -0,0 +1,48 @@
+# coding=utf-8
+"""Point grid index test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Francisco.Martin@icgc.cat'
+__date__ = '2021-04-08'
+__copyright__ = 'Copyright 2021, ICGC'
+
+import unittest
+
+from actions.point_grid_index import PointGridIndex
+
+
+class UDTPluginPointGridIndexTest(unittest.TestCase):
+    """Test the point grid index."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.index = PointGridIndex(0.1)
+        self.index.add_array([(400000.0, 4600000.0), (400010.0, 4600000.0)], ['a', 'b'])
+
+    def test_nearest_within_tolerance(self):
+        """Test that a point within the tolerance is found, also across cell boundaries."""
+        self.assertEqual(self.index.nearest(400000.05, 4599999.97), 'a')
+        self.assertEqual(self.index.nearest(399999.95, 4600000.0), 'a')
+
+    def test_nearest_out_of_tolerance(self):
+        """Test that a point farther than the tolerance isn't found."""
+        self.assertIsNone(self.index.nearest(400000.2, 4600000.0))
+        self.assertIsNone(self.index.nearest(400005.0, 4600000.0))
+
+    def test_nearest_closest_point(self):
+        """Test that the closest of several points within the tolerance is returned."""
+        self.index.add(400000.06, 4600000.0, 'c')
+        self.assertEqual(self.index.nearest(400000.05, 4600000.0), 'c')
+        self.assertEqual(self.index.nearest(399999.99, 4600000.0), 'a')
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(UDTPluginPointGridIndexTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
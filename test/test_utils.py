@@ -0,0 +1,60 @@
+# coding=utf-8
+"""Common functions test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Francisco.Martin@icgc.cat'
+__date__ = '2021-04-08'
+__copyright__ = 'Copyright 2021, ICGC'
+
+import random
+import unittest
+
+from utils import coordinates_to_id_fita, coordinates_to_id_fita_array, in_list_filter, in_list_filters
+
+
+class UDTPluginInListFilterTest(unittest.TestCase):
+    """Test the IN-list filter builder."""
+
+    def test_in_list_filter(self):
+        """Test the filter of numeric and text values."""
+        self.assertEqual(in_list_filter('id_linia', [1, 2, 3]), '"id_linia" IN (1, 2, 3)')
+        self.assertEqual(in_list_filter('id_punt', ['a', "b'c"]), '"id_punt" IN (\'a\', \'b\'\'c\')')
+
+    def test_in_list_filter_empty(self):
+        """Test that an empty list doesn't select anything."""
+        self.assertEqual(in_list_filter('id_linia', []), 'FALSE')
+        self.assertEqual(in_list_filters('id_linia', []), [])
+
+    def test_in_list_filters_chunks(self):
+        """Test that the values are split into chunks without repetitions."""
+        filters = in_list_filters('id_linia', [1, 2, 2, 3, 4, 5], chunk_size=2)
+        self.assertEqual(filters, ['"id_linia" IN (1, 2)', '"id_linia" IN (3, 4)', '"id_linia" IN (5)'])
+
+
+class UDTPluginIdFitaTest(unittest.TestCase):
+    """Test the IdFita computation."""
+
+    def test_id_fita_array_equivalence(self):
+        """Test that the vectorized IdFita is the same as the scalar one."""
+        rng = random.Random(0)
+        coords_x = [rng.uniform(250000, 550000) for _ in range(10000)] + [400000.05, 400000.15, 0.25, -0.04]
+        coords_y = [rng.uniform(4480000, 4750000) for _ in range(10000)] + [4600000.25, 4600000.35, 0.35, -0.05]
+        expected = [coordinates_to_id_fita(x, y) for x, y in zip(coords_x, coords_y)]
+        self.assertEqual(coordinates_to_id_fita_array(coords_x, coords_y).tolist(), expected)
+
+    def test_id_fita_array_empty(self):
+        """Test that no coordinates give no IDs."""
+        self.assertEqual(coordinates_to_id_fita_array([], []).tolist(), [])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(UDTPluginInListFilterTest)
+    suite.addTests(unittest.makeSuite(UDTPluginIdFitaTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -20,6 +20,7 @@
 # Import base libraries
 import os.path
 import sys
+import time
 from subprocess import call
 import webbrowser
 from datetime import datetime as dt
@@ -34,6 +35,7 @@ from qgis.core import (Qgis,
 from PyQt5.QtCore import QSize
 from PyQt5.QtGui import QIntValidator, QIcon
 from PyQt5.QtWidgets import (QMenu,
+                             QMessageBox,
                              QToolButton,
                              QComboBox,
                              QAction,
@@ -42,20 +44,10 @@ from PyQt5.QtCore import (QSettings,
                           QTranslator,
                           QCoreApplication)
 
-# Import the actions modules
+# Import the dialogs. The actions modules are imported when their dialog is opened, in order to not load their
+# dependencies when QGIS starts
 from .ui_manager import *
-from .actions.generador_mmc import *
-from .actions.line_mmc import *
-from .actions.agregador_mmc import *
-from .actions.eliminador_mmc import *
-from .actions.decimetritzador import *
-from .actions.check_mm import *
-from .actions.update_bm import *
-from .actions.manage_poligonal import *
-from .actions.cartographic_document import *
-from .actions.line_del_to_rep import *
-from .actions.municipal_map import *
-from .actions.extract_rep_package import *
+from .actions.line_extent_index import LineExtentIndex
 from .config import *
 
 
@@ -127,6 +119,9 @@ class UDTPlugin:
         self.carto_doc_icon_path = os.path.join(os.path.join(self.plugin_dir, 'images/document_cartografic.svg'))
         self.municipal_map_icon_path = os.path.join(os.path.join(self.plugin_dir, 'images/mapa_municipal.svg'))
 
+        # Line finder's index of the searched layers
+        self.line_extent_index = LineExtentIndex()
+
         # Set QGIS settings. Stored in the registry (on Windows) or .ini file (on Unix)
         self.qgis_settings = QSettings()
         self.qgis_settings.setIniCodec(sys.getfilesystemencoding())
@@ -202,11 +197,16 @@ class UDTPlugin:
 
     def initGui(self):
         """ Create the menu entries and toolbar icons inside the QGIS GUI """
+        start_time = time.perf_counter()
         # Initialize plugin
         self.init_plugin()
+        init_time = (time.perf_counter() - start_time) * 1000
+        QgsMessageLog.logMessage(f'Interfície del Plugin UDT inicialitzada en {init_time:.0f} ms', level=Qgis.Info)
 
     def unload(self):
         """ Removes the plugin menu item and icon from QGIS GUI """
+        self.iface.currentLayerChanged.disconnect(self.set_combobox_line_ids)
+        self.line_extent_index.disconnect_layers()
         for action in self.actions:
             self.iface.removePluginMenu(
                 self.tr(u'&UDT Plugin'),
@@ -313,6 +313,13 @@ class UDTPlugin:
                                                    callback=self.analysis_check_mm,
                                                    parent=self.iface.mainWindow())
 
+        # ############
+        # ADT cache
+        self.action_clear_adt_cache = self.add_action(icon_path=self.plugin_icon_path,
+                                                      text="Refrescar dades de referència de l'ADT",
+                                                      callback=self.clear_adt_cache,
+                                                      parent=self.iface.mainWindow())
+
         # ############
         # Docs
         self.action_open_docs = self.add_action(icon_path=self.info_icon_path,
@@ -345,6 +352,23 @@ class UDTPlugin:
         self.combobox.setEditable(True)
         self.combobox.setToolTip(self.TOOLTIP_HELP)
         self.combobox.activated.connect(self.zoom_line)  # Press intro and select combo value
+        self.iface.currentLayerChanged.connect(self.set_combobox_line_ids)
+
+    def set_combobox_line_ids(self, layer=None):
+        """
+        Fill the line finder combobox with the line IDs of the layer, if it has already been indexed, for completion
+
+        :param layer: active QGIS project layer
+        :type layer: QgsVectorLayer
+        """
+        if layer is None:
+            layer = self.iface.mapCanvas().currentLayer()
+        current_text = self.combobox.currentText()
+        self.combobox.blockSignals(True)
+        self.combobox.clear()
+        self.combobox.addItems([str(line_id) for line_id in self.line_extent_index.get_indexed_line_ids(layer)])
+        self.combobox.setEditText(current_text)
+        self.combobox.blockSignals(False)
 
     def configure_tool_button(self):
         """ Configure the tool button """
@@ -381,6 +405,8 @@ class UDTPlugin:
         # BM5M
         self.bm5m_menu = self.plugin_menu.addMenu(QIcon(self.bm5m_icon_path), 'Base Municipal')
         self.bm5m_menu.addAction(self.action_bm5m_update)
+        # ADT cache
+        self.plugin_menu.addAction(self.action_clear_adt_cache)
         # Info
         self.plugin_menu.addAction(self.action_open_docs)
 
@@ -394,44 +420,6 @@ class UDTPlugin:
 
     def zoom_line(self):
         """ Zoom in a line by the ID given by the user """
-
-        def check_line_id_field(layer):
-            """
-            Check if the active layer has a line ID searchable field
-
-            :param layer: active QGIS project layer
-            :type layer: QgsVectorLayer
-
-            :return: Indicates if the active layer has a line ID searchable field
-            :rtype: bool
-            """
-            field_names = [field.name() for field in layer.fields()]
-            if 'id_linia' not in field_names and \
-                    'idlinia' not in field_names and \
-                    'IDLINIA' not in field_names and \
-                    'ID_LINIA' not in field_names:
-                return False
-
-            return True
-
-        def get_line_id_field(layer):
-            """
-            Get the line ID searchable field
-
-            :param layer: active QGIS project layer
-            :type layer: QgsVectorLayer
-
-            :return: name of the line ID searchable field
-            :rtype: str
-            """
-            field_names = [field.name() for field in layer.fields()]
-            field_name = ''
-            for field in field_names:
-                if field == 'id_linia' or field == 'idlinia' or field == 'IDLINIA' or field == 'ID_LINIA':
-                    field_name = field
-
-            return field_name
-
         try:
             line_id = int(self.combobox.currentText())
         except ValueError:
@@ -443,26 +431,39 @@ class UDTPlugin:
             self.show_error_message('No existeix cap capa seleccionada')
             return
         # Check if the layer has an ID_LINIA field to search over
-        layer_searchable = check_line_id_field(search_layer)
-        if not layer_searchable:
+        if not isinstance(search_layer, QgsVectorLayer) or not self.line_extent_index.get_line_id_field(search_layer):
             self.show_error_message('La capa seleccionada no és vàlida per cercar per ID de línia')
             return
-        # Get the name of the layer's line ID searchable field
-        line_id_field = get_line_id_field(search_layer)
-        # Zoom to the given line and then remove the selection, depending on if the layer has the given line ID or not
-        search_layer.selectByExpression(f'"{line_id_field}"={line_id}', QgsVectorLayer.SetSelection)
-        if search_layer.selectedFeatureCount() >= 1:
-            self.iface.actionZoomToSelected().trigger()
-            search_layer.removeSelection()
+        # Get the bounding box of the line from the layer's index, which is built the first time the layer is searched
+        layer_indexed = self.line_extent_index.is_indexed(search_layer)
+        line_extent = self.line_extent_index.get_index(search_layer).get(line_id)
+        if not layer_indexed:
+            self.set_combobox_line_ids(search_layer)
+        # Zoom to the given line, depending on if the layer has the given line ID or not
+        if line_extent is not None:
+            canvas = self.iface.mapCanvas()
+            canvas.zoomToFeatureExtent(canvas.mapSettings().layerExtentToOutputExtent(search_layer, line_extent))
         else:
             self.show_error_message(f"No hi ha registres amb ID de línia {line_id} a la capa {search_layer.name()}")
 
+    def clear_adt_cache(self):
+        """ Clear the local cache of the ADT reference tables, so they are downloaded again when they are used """
+        from .actions.adt_table_cache import ADTTableCache
+        if not ADTTableCache(HOST, DBNAME, SCHEMA).clear():
+            self.show_error_message("No s'han pogut refrescar les dades de referència de l'ADT. Tanqueu les capes "
+                                    "de la memòria cau i torneu-ho a provar")
+            return
+        self.show_success_message("Dades de referència de l'ADT refrescades")
+
     # #################################################
     # REGISTRE MMC
     # #######################
     # Generador MMC
     def show_generador_mmc_dialog(self):
         """ Show the Generador MMC dialog """
+        from .actions.line_documents import clear_line_documents
+        # Start the session without the line documents cached by previous sessions
+        clear_line_documents()
         # Show Generador MMC dialog
         self.generador_dlg = GeneradorMMCDialog()
         self.generador_dlg.show()
@@ -526,6 +527,8 @@ class UDTPlugin:
         :param constructor: Show if the function has to return the Generador MMC constructor or start a generation process.
         :type constructor: bool
         """
+        from .actions.generador_mmc import (GeneradorMMC, GeneradorMMCChecker, GeneradorMMCLayers,
+                                            GeneradorMMCMetadataTable, GeneradorMMCMetadata)
         # Get input data
         municipality_id, data_alta = self.get_generador_mmc_input_data()
         # Validate the municipality ID input
@@ -581,6 +584,7 @@ class UDTPlugin:
 
     def generate_coast_mmc_layers(self):
         """ Directly create a Generador MMC instance and run the layers generating process """
+        from .actions.generador_mmc import GeneradorMMCLayers
         municipality_id, data_alta = self.get_generador_mmc_input_data()
         generador_mmc = GeneradorMMCLayers(municipality_id, data_alta, True)
         generador_mmc.generate_mmc_layers()
@@ -610,6 +614,9 @@ class UDTPlugin:
     # Linia MMC
     def show_line_mmc_dialog(self):
         """ Show the Generador MMC dialog """
+        from .actions.line_documents import clear_line_documents
+        # Start the session without the line documents cached by previous sessions
+        clear_line_documents()
         # Show Generador MMC dialog
         self.line_dlg = LineMMCCDialog()
         self.line_dlg.show()
@@ -627,6 +634,7 @@ class UDTPlugin:
         """
         Run the Line MMC main process. Extract, manage and export the Municipal data of a boundary line
         """
+        from .actions.line_mmc import LineMMC
         # Get the line ID
         line_id = self.line_dlg.lineID.text()
         # Validate the line ID
@@ -685,6 +693,7 @@ class UDTPlugin:
                     'remove-layers-canvas'.
         :type job: str
         """
+        from .actions.agregador_mmc import AgregadorMMC, check_agregador_input_data
         # Check that exists all the necessary data in the workspace
         input_data_ok = check_agregador_input_data()
         if not input_data_ok:
@@ -692,8 +701,12 @@ class UDTPlugin:
         agregador_mmc = AgregadorMMC()
         # en funcion del job hacer una cosa u otra
         if job == 'add-data':
-            agregador_mmc.add_municipal_map_data()
-            self.show_success_message('Mapes agregats i duplicats esborrats')
+            issues_count = agregador_mmc.add_municipal_map_data()
+            if issues_count:
+                self.show_warning_message(f"Mapes agregats i duplicats esborrats. S'han trobat {issues_count} "
+                                          f"incidències topològiques, revisa la capa qa_temp.shp")
+            else:
+                self.show_success_message('Mapes agregats i duplicats esborrats')
         elif job == 'export-data':
             agregador_mmc.export_municipal_map_data()
             self.show_success_message('Mapa Municipal de Catalunya exportat')
@@ -706,6 +719,7 @@ class UDTPlugin:
 
     def init_import_agregador_data(self):
         """ Import the working data from the last Municipal Map of Catalonia """
+        from .actions.agregador_mmc import import_agregador_data
         input_directory = self.agregador_dlg.dataDirectoryBrowser.filePath()
         input_directory_ok = self.validate_input_directory(input_directory)
 
@@ -734,6 +748,7 @@ class UDTPlugin:
 
     def init_eliminador_mmc(self):
         """ Run the Eliminador MMC process """
+        from .actions.eliminador_mmc import EliminadorMMC, check_eliminador_input_data
         # Get input data
         municipality_id = self.eliminador_dlg.municipiID.text()
         # Validate the municipality ID input
@@ -774,10 +789,19 @@ class UDTPlugin:
 
     def init_decimetritzador(self):
         """ Run the Decimetritzador process """
+        from .actions.decimetritzador import Decimetritzador, BatchDecimetritzador
         input_directory = self.decimetritzador_dlg.decimetritzadorDirectoryBrowser.filePath()
         input_directory_ok = self.validate_input_directory(input_directory)
 
-        if input_directory_ok:
+        if input_directory_ok and self.decimetritzador_dlg.batchCheckBox.isChecked():
+            batch_decimetritzador = BatchDecimetritzador(input_directory)
+            n_ok = batch_decimetritzador.decimetritzar()
+            if not batch_decimetritzador.results:
+                self.show_error_message("El directori introduït no té cap carpeta DocDelim")
+            else:
+                self.show_success_message(f'Línies decimetritzades: {n_ok} de {len(batch_decimetritzador.results)}. '
+                                          f'Consulta el log per veure el resultat de cada línia')
+        elif input_directory_ok:
             decimetritzador = Decimetritzador(input_directory)
             decimetritzador_data_ok = decimetritzador.check_input_data()
             if decimetritzador_data_ok:
@@ -798,6 +822,7 @@ class UDTPlugin:
 
     def init_poligonal_update(self):
         """ Run the Manage poligonal process """
+        from .actions.manage_poligonal import ManagePoligonal
         input_directory = self.poligonal_dlg.poligonalDirectoryBrowser.filePath()
         input_directory_ok = self.validate_input_directory(input_directory)
 
@@ -822,6 +847,7 @@ class UDTPlugin:
 
     def init_del_to_rep(self):
         """ Run the Delimitation to Replantejament process """
+        from .actions.line_del_to_rep import DelimitationToReplantejament
         input_directory = self.del_to_rep_dialog.poligonalDirectoryBrowser.filePath()
         input_directory_ok = self.validate_input_directory(input_directory)
 
@@ -881,6 +907,7 @@ class UDTPlugin:
 
     def extract_package(self):
         """ Run the REP package extractor process """
+        from .actions.extract_rep_package import ExtractRepPackage
         # Get line ID
         line_id = self.extract_rep_pack_dlg.lineID.text()
         # Check line ID
@@ -910,11 +937,15 @@ class UDTPlugin:
 
     def init_bm5m_update(self):
         """ Run the BM-5M update process """
+        from .actions.update_bm import UpdateBM
         date_last_update = self.update_bm_dlg.lastUpdateDate.text()
-        date_last_update_ok = self.validate_date_last_update(date_last_update)
+        incremental = self.update_bm_dlg.incrementalCheckBox.isChecked()
+        # The incremental update starts from the journal's watermarks, so the date is not needed
+        date_last_update_ok = (incremental and UpdateBM.has_watermarks(UpdateBM.read_journal())) or \
+            self.validate_date_last_update(date_last_update)
 
         if date_last_update_ok:
-            bm_updater = UpdateBM(date_last_update)
+            bm_updater = UpdateBM(date_last_update, incremental)
             bm_data_ok = bm_updater.check_bm_data()
             if bm_data_ok:
                 new_data_alta = bm_updater.update_bm()
@@ -941,6 +972,7 @@ class UDTPlugin:
     # Check new MM
     def analysis_check_mm(self):
         """ Perform an analysis that checks if there are any municipalities ready to generate them Municipal Map """
+        from .actions.check_mm import CheckMM
         check_mm = CheckMM()
         check_mm.get_new_mm()
         self.show_success_message('Anàlisi de nous MM realitzat. Si us plau, ves al report per veure els resultats.')
@@ -951,6 +983,7 @@ class UDTPlugin:
     # Generate Cartographic document
     def show_carto_doc_dialog(self):
         """ Show the Cartographic document generation dialog """
+        from .actions.style_registry import clear_parsed_styles
         title = QgsProject.instance().title()
         # Check if the QGIS project is the project made for automated layout generation.
         # If not, the feature doesn't work
@@ -958,6 +991,8 @@ class UDTPlugin:
             self.show_error_message("El projecte de QGIS no és el projecte de generació de Documents cartogràfics. "
                                     "Si us plau, obre el projecte pertinent.")
             return
+        # Start the session without the styles parsed by previous sessions, so the edited QML files are reloaded
+        clear_parsed_styles()
         self.carto_doc_dlg = CartographicDocumentDialog()
         self.carto_doc_dlg.show()
         self.configure_carto_doc_dialog()
@@ -970,6 +1005,7 @@ class UDTPlugin:
 
     def init_carto_doc_generation(self):
         """ Run the Cartographic document generation process """
+        from .actions.cartographic_document import CartographicDocument
         # ###############
         # Get input values
         # Get line ID
@@ -1033,6 +1069,8 @@ class UDTPlugin:
     # Generate Municipal Map
     def show_municipal_map_dialog(self):
         """ Show the Municipal map dialog """
+        from .actions.line_documents import clear_line_documents
+        from .actions.style_registry import clear_parsed_styles
         title = QgsProject.instance().title()
         # Check if the QGIS project is the project made for automated layout generation.
         # If not, the feature doesn't work
@@ -1040,6 +1078,10 @@ class UDTPlugin:
             self.show_error_message("El projecte de QGIS no és el projecte de generació de Mapes municipals. "
                                     "Si us plau, obre el projecte pertinent.")
             return
+        # Start the session without the line documents cached by previous sessions
+        clear_line_documents()
+        # Start the session without the styles parsed by previous sessions, so the edited QML files are reloaded
+        clear_parsed_styles()
         self.municipal_map_dlg = MunicipalMapDialog()
         self.municipal_map_dlg.show()
         self.configure_municipal_map_dialog()
@@ -1052,6 +1094,7 @@ class UDTPlugin:
 
     def init_municipal_map(self):
         """ Run the Municipal map generation process """
+        from .actions.municipal_map import MunicipalMap, MunicipalMapBatch, Hillshade
         # ###############
         # Get input values
         # Get municipality ID
@@ -1066,7 +1109,21 @@ class UDTPlugin:
         # ###############
         # Validate input values
         # Validate municipality ID
-        if not hillshade:
+        if ',' in municipality_id:
+            # Several municipalities: the input directory has a sub directory for every municipality, named with its ID.
+            # Every municipality is exported with the hillshade of its own extent
+            municipality_ids = [muni_id.strip() for muni_id in municipality_id.split(',') if muni_id.strip()]
+            municipality_ids_ok = all(self.validate_municipality_id(muni_id) for muni_id in municipality_ids)
+            input_directory_ok = self.validate_input_directory(input_directory)
+            if municipality_ids_ok and input_directory_ok:
+                municipalities = {muni_id: os.path.join(input_directory, muni_id) for muni_id in municipality_ids}
+                if not Hillshade.check_dtm_raster():
+                    self.show_warning_message("No existeix la capa ráster d'elevacions al projecte. "
+                                              "Els Mapes municipals s'exporten sense ombra")
+                municipal_map_batch = MunicipalMapBatch(municipalities, self.iface, size)
+                n_ok = municipal_map_batch.render_municipal_maps()
+                self.show_success_message(f'Mapes municipals exportats: {n_ok} de {len(municipalities)}')
+        elif not hillshade:
             municipality_id_ok = self.validate_municipality_id(municipality_id)
             # Validate the input directory
             input_directory_ok = self.validate_input_directory(input_directory)
@@ -12,138 +12,76 @@ import os
 from qgis.PyQt import uic
 from qgis.PyQt import QtWidgets
 
+# Folder that contains UI files
+UI_FOLDER_PATH = os.path.join(os.path.dirname(__file__), 'ui')
 
-def get_ui_class(ui_file_name):
-    """ Get UI Python class from @ui_file_name """
-    # Folder that contains UI files
-    ui_folder_path = os.path.join(os.path.dirname(__file__), 'ui')
-    ui_file_path = os.path.join(ui_folder_path, ui_file_name)
 
-    return uic.loadUiType(ui_file_path)[0]
+def get_ui_path(ui_file_name):
+    """ Get the path to the UI file @ui_file_name """
+    return os.path.join(UI_FOLDER_PATH, ui_file_name)
 
 
-BASE_FORM_CLASS = get_ui_class('udt_plugin_dialog_base.ui')
+class UIDialog(QtWidgets.QDialog):
+    """ Dialog whose UI file is only loaded when the dialog is created, instead of when the plugin is loaded """
+    UI_FILE_NAME = None
 
-GENERADOR_MMC_FORM_CLASS = get_ui_class('generador_registre_mmc.ui')
+    def __init__(self, parent=None):
+        """Constructor."""
+        super(UIDialog, self).__init__(parent)
+        uic.loadUi(get_ui_path(self.UI_FILE_NAME), self)
 
-GENERADOR_MMC_COAST_FORM_CLASS = get_ui_class('generador_registre_mmc_costa.ui')
 
-LINE_MMC_FORM_CLASS = get_ui_class('linia_registre_mmc.ui')
+class UDTPluginDialog(UIDialog):
+    UI_FILE_NAME = 'udt_plugin_dialog_base.ui'
 
-AGREGADOR_MMC_FORM_CLASS = get_ui_class('agregador_registre_mmc.ui')
 
-ELIMINADOR_MMC_FORM_CLASS = get_ui_class('eliminador_registre_mmc.ui')
+class GeneradorMMCDialog(UIDialog):
+    UI_FILE_NAME = 'generador_registre_mmc.ui'
 
-DECIMETRITZADOR_FORM_CLASS = get_ui_class('decimetritzador_dialog.ui')
 
-PREPARE_LINE_FORM_CLASS = get_ui_class('preparar_linia_dialog.ui')
+class GeneradorMMCCoastDialog(UIDialog):
+    UI_FILE_NAME = 'generador_registre_mmc_costa.ui'
 
-UPDATE_BM_FORM_CLASS = get_ui_class('update_bm_dialog.ui')
 
-UPDATE_POLIGONAL_FORM_CLASS = get_ui_class('update_poligonal_dialog.ui')
+class LineMMCCDialog(UIDialog):
+    UI_FILE_NAME = 'linia_registre_mmc.ui'
 
-CARTO_DOC_FORM_CLASS = get_ui_class('cartographic_document_dialog.ui')
 
-DEL_TO_REP_FORM_CLASS = get_ui_class('delimitation_to_replantejament_dialog.ui')
+class AgregadorMMCDialog(UIDialog):
+    UI_FILE_NAME = 'agregador_registre_mmc.ui'
 
-MUNICIPAL_MAP_FORM_CLASS = get_ui_class('municipal_map_dialog.ui')
 
-EXTRACT_REP_PACKAGE_FORM_CLASS = get_ui_class('extract_rep_package_dialog.ui')
+class EliminadorMMCDialog(UIDialog):
+    UI_FILE_NAME = 'eliminador_registre_mmc.ui'
 
 
-class UDTPluginDialog(QtWidgets.QDialog, BASE_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(UDTPluginDialog, self).__init__(parent)
-        self.setupUi(self)
+class DecimetritzadorDialog(UIDialog):
+    UI_FILE_NAME = 'decimetritzador_dialog.ui'
 
 
-class GeneradorMMCDialog(QtWidgets.QDialog, GENERADOR_MMC_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(GeneradorMMCDialog, self).__init__(parent)
-        self.setupUi(self)
+class PrepareLineDialog(UIDialog):
+    UI_FILE_NAME = 'preparar_linia_dialog.ui'
 
-        
-class GeneradorMMCCoastDialog(QtWidgets.QDialog, GENERADOR_MMC_COAST_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(GeneradorMMCCoastDialog, self).__init__(parent)
-        self.setupUi(self)
 
+class UpdateBMDialog(UIDialog):
+    UI_FILE_NAME = 'update_bm_dialog.ui'
 
-class LineMMCCDialog(QtWidgets.QDialog, LINE_MMC_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(LineMMCCDialog, self).__init__(parent)
-        self.setupUi(self)
 
+class UpdatePoligonalDialog(UIDialog):
+    UI_FILE_NAME = 'update_poligonal_dialog.ui'
 
-class AgregadorMMCDialog(QtWidgets.QDialog, AGREGADOR_MMC_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(AgregadorMMCDialog, self).__init__(parent)
-        self.setupUi(self)
 
+class CartographicDocumentDialog(UIDialog):
+    UI_FILE_NAME = 'cartographic_document_dialog.ui'
 
-class EliminadorMMCDialog(QtWidgets.QDialog, ELIMINADOR_MMC_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(EliminadorMMCDialog, self).__init__(parent)
-        self.setupUi(self)
 
-
-class DecimetritzadorDialog(QtWidgets.QDialog, DECIMETRITZADOR_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(DecimetritzadorDialog, self).__init__(parent)
-        self.setupUi(self)
+class DelimitationToReplantejamentDialog(UIDialog):
+    UI_FILE_NAME = 'delimitation_to_replantejament_dialog.ui'
 
 
-class PrepareLineDialog(QtWidgets.QDialog, PREPARE_LINE_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(PrepareLineDialog, self).__init__(parent)
-        self.setupUi(self)
+class MunicipalMapDialog(UIDialog):
+    UI_FILE_NAME = 'municipal_map_dialog.ui'
 
 
-class UpdateBMDialog(QtWidgets.QDialog, UPDATE_BM_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(UpdateBMDialog, self).__init__(parent)
-        self.setupUi(self)
-
-
-class UpdatePoligonalDialog(QtWidgets.QDialog, UPDATE_POLIGONAL_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(UpdatePoligonalDialog, self).__init__(parent)
-        self.setupUi(self)
-
-
-class CartographicDocumentDialog(QtWidgets.QDialog, CARTO_DOC_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(CartographicDocumentDialog, self).__init__(parent)
-        self.setupUi(self)
-
-
-class DelimitationToReplantejamentDialog(QtWidgets.QDialog, DEL_TO_REP_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(DelimitationToReplantejamentDialog, self).__init__(parent)
-        self.setupUi(self)
-
-
-class MunicipalMapDialog(QtWidgets.QDialog, MUNICIPAL_MAP_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(MunicipalMapDialog, self).__init__(parent)
-        self.setupUi(self)
-
-
-class RepPackageExtractorDialog(QtWidgets.QDialog, EXTRACT_REP_PACKAGE_FORM_CLASS):
-    def __init__(self, parent=None):
-        """Constructor."""
-        super(RepPackageExtractorDialog, self).__init__(parent)
-        self.setupUi(self)
+class RepPackageExtractorDialog(UIDialog):
+    UI_FILE_NAME = 'extract_rep_package_dialog.ui'
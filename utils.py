@@ -14,9 +14,14 @@ Funcions comuns a tots els móduls.
 """
 
 import os
+import numpy as np
 
 from PyQt5.QtCore import QVariant
-from qgis.core import QgsField, QgsVectorFileWriter
+from qgis.core import (QgsField, QgsVectorFileWriter, QgsExpression, QgsFeatureRequest, QgsWkbTypes,
+                       QgsVectorLayer)
+
+# Maximum number of values of every IN-list filter
+IN_LIST_CHUNK_SIZE = 1000
 
 
 def line_id_2_txt(line_id):
@@ -59,6 +64,26 @@ def coordinates_to_id_fita(coord_x, coord_y):
     return id_fita
 
 
+def coordinates_to_id_fita_array(coords_x, coords_y):
+    """
+    Transform the coordinates of several points to their ID at once. The result is exactly the same as the one given by
+    coordinates_to_id_fita for every point
+
+    :param coords_x: X coordinates of the points
+    :type coords_x: list or numpy.ndarray
+
+    :param coords_y: Y coordinates of the points
+    :type coords_y: list or numpy.ndarray
+
+    :return: Array with the ID of every point
+    :rtype: numpy.ndarray
+    """
+    x = np.char.mod('%.1f', np.asarray(coords_x, dtype=float))
+    y = np.char.mod('%.1f', np.asarray(coords_y, dtype=float))
+
+    return np.char.add(np.char.add(x, '_'), y)
+
+
 def round_coordinates(coord_x, coord_y):
     """ Round coordinates to 1 decimal """
     x = round(coord_x, 1)
@@ -67,6 +92,21 @@ def round_coordinates(coord_x, coord_y):
     return x, y
 
 
+def round_coordinates_array(coords):
+    """
+    Round an array of coordinates to 1 decimal. The rounding is done by formatting the values, so the result is
+    exactly the same as the one given by the built-in round function, which numpy.round doesn't guarantee
+
+    :param coords: Array with the coordinates to round
+    :type coords: numpy.ndarray
+
+    :return: Array with the rounded coordinates
+    :rtype: numpy.ndarray
+    """
+    coords = np.asarray(coords, dtype=float)
+    return np.char.mod('%.1f', coords).astype(float)
+
+
 def point_num_to_text(num_fita):
     """ Transform point's order number into text """
     num_fita = int(num_fita)
@@ -91,6 +131,50 @@ def normalize_dogc_title(title):
     return normalized_title
 
 
+def create_memory_layer(layer_name, wkb_type, crs, fields):
+    """
+    Create a memory layer with the given schema
+
+    :param layer_name: Name of the layer
+    :type layer_name: str
+
+    :param wkb_type: Geometry type of the layer
+    :type wkb_type: QgsWkbTypes.Type
+
+    :param crs: CRS of the layer
+    :type crs: QgsCoordinateReferenceSystem
+
+    :param fields: List with the layer's fields
+    :type fields: list
+
+    :return: Memory layer
+    :rtype: QgsVectorLayer
+    """
+    layer = QgsVectorLayer(f'{QgsWkbTypes.displayString(wkb_type)}?crs={crs.authid()}', layer_name, 'memory')
+    layer.dataProvider().addAttributes(fields)
+    layer.updateFields()
+
+    return layer
+
+
+def export_attribute_table(table, dbf_path):
+    """
+    Export an attribute table as a standalone DBF file. The table is written without geometry, so the Shapefile
+    driver only creates the DBF file, and the CPG file is removed as the "taula" specifications require
+
+    :param table: Table to export
+    :type table: QgsVectorLayer
+
+    :param dbf_path: Path to the output DBF file
+    :type dbf_path: str
+    """
+    QgsVectorFileWriter.writeAsVectorFormat(table, dbf_path, 'utf-8', driverName='ESRI Shapefile',
+                                            overrideGeometryType=QgsWkbTypes.NoGeometry)
+    cpg_path = f'{os.path.splitext(dbf_path)[0]}.cpg'
+    if os.path.exists(cpg_path):
+        os.remove(cpg_path)
+
+
 def remove_temp_shapefiles(directory_path, constraint=None):
     """  """
     file_list = os.listdir(directory_path)
@@ -98,3 +182,154 @@ def remove_temp_shapefiles(directory_path, constraint=None):
         if file_name.endswith('.shp'):
             file_path = os.path.join(directory_path, file_name)
             QgsVectorFileWriter.deleteShapeFile(file_path)
+
+
+def in_list_filter(field_name, values):
+    """
+    Get a filter that selects the features which field value is in the given values. The filter is valid both as
+    a QGIS expression and as a provider subset string
+
+    :param field_name: Name of the field to filter
+    :type field_name: str
+
+    :param values: Values to select
+    :type values: list
+
+    :return: Filter with the form "field" IN (...), or FALSE if there are no values
+    :rtype: str
+    """
+    if not values:
+        return 'FALSE'
+    quoted_values = ', '.join(QgsExpression.quotedValue(value) for value in values)
+
+    return f'{QgsExpression.quotedColumnRef(field_name)} IN ({quoted_values})'
+
+
+def in_list_filters(field_name, values, chunk_size=IN_LIST_CHUNK_SIZE):
+    """
+    Get the IN-list filters of the given values, splitting them into chunks so no filter gets too long
+
+    :param field_name: Name of the field to filter
+    :type field_name: str
+
+    :param values: Values to select. The repeated values are only used once
+    :type values: list
+
+    :param chunk_size: Maximum number of values of every filter
+    :type chunk_size: int
+
+    :return: List with the filters, which is empty if there are no values
+    :rtype: list
+    """
+    values = list(dict.fromkeys(values))
+    return [in_list_filter(field_name, values[i:i + chunk_size]) for i in range(0, len(values), chunk_size)]
+
+
+def get_features_by_in_list(layer, field_name, values, request=None, chunk_size=IN_LIST_CHUNK_SIZE):
+    """
+    Iterate over the features which field value is in the given values. The filter is pushed to the provider as a
+    subset string, so the database can use its indexes, and the layer's original subset string is restored at the
+    end. If the provider doesn't accept the subset string, the layer's original subset string is restored and the
+    filter of that and the remaining chunks is evaluated by the feature request
+
+    :param layer: Layer to get the features from
+    :type layer: QgsVectorLayer
+
+    :param field_name: Name of the field to filter
+    :type field_name: str
+
+    :param values: Values to select
+    :type values: list
+
+    :param request: Feature request to use, for example to limit the attributes to fetch
+    :type request: QgsFeatureRequest
+
+    :param chunk_size: Maximum number of values of every filter
+    :type chunk_size: int
+
+    :return: Generator with the filtered features
+    :rtype: generator
+    """
+    original_subset = layer.subsetString()
+    use_subset = True
+    try:
+        for filter_ in in_list_filters(field_name, values, chunk_size):
+            subset = f'({original_subset}) AND {filter_}' if original_subset else filter_
+            if use_subset and layer.setSubsetString(subset):
+                yield from layer.getFeatures(request or QgsFeatureRequest())
+            else:
+                # Evaluate this and the remaining chunks with the original subset string, not the previous chunk's one
+                if use_subset and layer.subsetString() != original_subset and \
+                        not layer.setSubsetString(original_subset):
+                    raise RuntimeError(f"No s'ha pogut restaurar el filtre de la capa {layer.name()}")
+                use_subset = False
+                chunk_request = QgsFeatureRequest(request) if request else QgsFeatureRequest()
+                chunk_request.setFilterExpression(filter_)
+                yield from layer.getFeatures(chunk_request)
+    finally:
+        if layer.subsetString() != original_subset:
+            layer.setSubsetString(original_subset)
+
+
+def get_attributes_request(layer, field_names=None, request=None):
+    """
+    Get a feature request that doesn't fetch the features' geometry and, if the field names are given, only fetches
+    those attributes. Scanning a layer this way avoids decoding every geometry when only some fields are read
+
+    :param layer: Layer to get the features from
+    :type layer: QgsVectorLayer
+
+    :param field_names: Names of the fields to fetch. All the fields are fetched if they are not given
+    :type field_names: list
+
+    :param request: Feature request to start from, for example with a filter expression
+    :type request: QgsFeatureRequest
+
+    :return: Feature request without geometry
+    :rtype: QgsFeatureRequest
+    """
+    attributes_request = QgsFeatureRequest(request) if request else QgsFeatureRequest()
+    attributes_request.setFlags(attributes_request.flags() | QgsFeatureRequest.NoGeometry)
+    if field_names is not None:
+        attributes_request.setSubsetOfAttributes(list(field_names), layer.fields())
+
+    return attributes_request
+
+
+def get_features_attributes(layer, field_names=None, request=None):
+    """
+    Iterate over the layer's features without their geometry, fetching only the given attributes. The features are
+    read only, since updating them would write the attributes that haven't been fetched as NULL
+
+    :param layer: Layer to get the features from
+    :type layer: QgsVectorLayer
+
+    :param field_names: Names of the fields to fetch. All the fields are fetched if they are not given
+    :type field_names: list
+
+    :param request: Feature request to start from, for example with a filter expression
+    :type request: QgsFeatureRequest
+
+    :return: Generator with the features
+    :rtype: generator
+    """
+    yield from layer.getFeatures(get_attributes_request(layer, field_names, request))
+
+
+def get_field_values(layer, field_name, request=None):
+    """
+    Get the values of a field of every layer's feature
+
+    :param layer: Layer to get the values from
+    :type layer: QgsVectorLayer
+
+    :param field_name: Name of the field
+    :type field_name: str
+
+    :param request: Feature request to start from, for example with a filter expression
+    :type request: QgsFeatureRequest
+
+    :return: List with the field's values
+    :rtype: list
+    """
+    return [feature[field_name] for feature in get_features_attributes(layer, [field_name], request)]